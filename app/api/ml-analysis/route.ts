@@ -2,9 +2,88 @@ import { NextResponse } from "next/server"
 import { withContext } from "@/lib/HttpContext"
 import { spawn } from "child_process"
 import path from "path"
-import fs from "fs"
 
-export async function GET() {
+// Inference only: the models are fitted offline (ml_predictive_analysis.py --mode train)
+const PREDICT_TIMEOUT_MS = 20_000
+
+/**
+ * Runs the predict entry point for one tenant schema and resolves with its JSON result
+ * @param schema Tenant schema (org_*) the analysis reads
+ */
+function runPrediction(schema: string): Promise<any> {
+  const scriptPath = path.join(process.cwd(), "scripts", "ml_predictive_analysis.py")
+
+  return new Promise((resolve) => {
+    const pythonProcess = spawn("python3", [scriptPath, "--mode", "predict", "--schema", schema], {
+      env: {
+        ...process.env,
+        DB_HOST: process.env.DB_HOST || "localhost",
+        DB_PORT: process.env.DB_PORT || "5432",
+        DB_NAME: process.env.DB_NAME,
+        DB_USER: process.env.DB_USER,
+        DB_PASSWORD: process.env.DB_PASSWORD,
+      },
+    })
+
+    let stdout = ""
+    let stderr = ""
+    const timer = setTimeout(() => {
+      pythonProcess.kill()
+      resolve({ success: false, error: `Prediction timed out after ${PREDICT_TIMEOUT_MS / 1000}s` })
+    }, PREDICT_TIMEOUT_MS)
+
+    pythonProcess.stdout.on("data", (data) => {
+      stdout += data.toString()
+    })
+
+    pythonProcess.stderr.on("data", (data) => {
+      stderr += data.toString()
+    })
+
+    pythonProcess.on("close", (code) => {
+      clearTimeout(timer)
+      // The script prints a single JSON line; progress goes to stderr
+      const line = stdout.trim().split("\n").pop() || ""
+      try {
+        resolve(JSON.parse(line))
+      } catch (e) {
+        resolve({ success: false, error: `Script failed with code ${code}: ${stderr.slice(-500)}` })
+      }
+    })
+
+    pythonProcess.on("error", (error) => {
+      clearTimeout(timer)
+      resolve({ success: false, error: error.message })
+    })
+  })
+}
+
+export const GET = withContext(async ({ tenantDb }) => {
+  const startedAt = Date.now()
+  let fallbackReason = ""
+
+  try {
+    const [{ schema }] = (await tenantDb`SELECT current_schema() AS schema`) as Record<string, any>[]
+    const result = await runPrediction(schema)
+
+    if (result.success) {
+      return NextResponse.json({
+        success: true,
+        analysis: result.analysis,
+        metadata: {
+          executed_at: new Date().toISOString(),
+          execution_time: `${((Date.now() - startedAt) / 1000).toFixed(1)}s`,
+          demo_mode: false,
+          mode_description: "Predictions from the tenant's persisted models",
+        },
+      })
+    }
+    fallbackReason = result.error || "Prediction failed"
+  } catch (error: any) {
+    fallbackReason = error.message || "Prediction failed"
+  }
+  console.warn("ML prediction unavailable, serving demo analysis:", fallbackReason)
+
   try {
     // 🧠 Mocked AI/ML Analysis Data (for demo/testing)
     const mockAnalysis = {
@@ -152,6 +231,7 @@ export async function GET() {
         execution_time: "1.2s",
         demo_mode: true,
         mode_description: "Demo mode active — no Python backend required",
+        fallback_reason: fallbackReason,
       },
     };
 
@@ -163,4 +243,4 @@ export async function GET() {
       { status: 500 }
     );
   }
-}
+})
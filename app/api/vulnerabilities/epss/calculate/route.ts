@@ -1,5 +1,6 @@
 import { NextResponse } from "next/server";
 import { withContext } from "@/lib/HttpContext";
+import { callEpssWorker } from "@/lib/epss-worker";
 import { spawn } from "child_process";
 import path from "path";
 
@@ -29,51 +30,15 @@ export const POST = withContext(async ({ tenantDb }, request) => {
       );
     }
 
-    // Path to Python script
-    const scriptPath = path.join(process.cwd(), "scripts", "epss_calculator.py");
-
-    // Execute Python script
-    const result = await new Promise<any>((resolve, reject) => {
-      const pythonProcess = spawn("python3", [scriptPath, vulnerability_id.toString()], {
-        env: {
-          ...process.env,
-          DB_HOST: process.env.DB_HOST || "localhost",
-          DB_PORT: process.env.DB_PORT || "5432",
-          DB_NAME: process.env.DB_NAME,
-          DB_USER: process.env.DB_USER,
-          DB_PASSWORD: process.env.DB_PASSWORD,
-        },
-      });
-
-      let stdout = "";
-      let stderr = "";
-
-      pythonProcess.stdout.on("data", (data) => {
-        stdout += data.toString();
-      });
-
-      pythonProcess.stderr.on("data", (data) => {
-        stderr += data.toString();
-      });
-
-      pythonProcess.on("close", (code) => {
-        if (code === 0) {
-          try {
-            const result = JSON.parse(stdout);
-            resolve(result);
-          } catch (e) {
-            reject(new Error(`Failed to parse Python output: ${stdout}`));
-          }
-        } else {
-          reject(new Error(`Python script failed with code ${code}: ${stderr}`));
-        }
-      });
-
-      pythonProcess.on("error", (error) => {
-        reject(new Error(`Failed to start Python process: ${error.message}`));
-      });
+    // Score on the long-lived EPSS worker instead of spawning a process per call
+    const result = await callEpssWorker("score", {
+      vulnerability_id: Number(vulnerability_id),
     });
 
+    if (!result.success) {
+      throw new Error(result.error || result.message || "Failed to calculate EPSS score");
+    }
+
     return NextResponse.json(result);
   } catch (error) {
     console.error("EPSS calculation error:", error);
@@ -101,73 +66,71 @@ export const PUT = withContext(async ({ tenantDb }, request) => {
       );
     }
 
-    const results = [];
     const scriptPath = path.join(process.cwd(), "scripts", "epss_calculator.py");
 
-    for (const vulnerability_id of vulnerability_ids) {
-      try {
-        const result = await new Promise<any>((resolve, reject) => {
-          const pythonProcess = spawn("python3", [scriptPath, vulnerability_id.toString()], {
-            env: {
-              ...process.env,
-              DB_HOST: process.env.DB_HOST || "localhost",
-              DB_PORT: process.env.DB_PORT || "5432",
-              DB_NAME: process.env.DB_NAME,
-              DB_USER: process.env.DB_USER,
-              DB_PASSWORD: process.env.DB_PASSWORD,
-            },
-          });
-
-          let stdout = "";
-          let stderr = "";
-
-          pythonProcess.stdout.on("data", (data) => {
-            stdout += data.toString();
-          });
-
-          pythonProcess.stderr.on("data", (data) => {
-            stderr += data.toString();
-          });
-
-          pythonProcess.on("close", (code) => {
-            if (code === 0) {
-              try {
-                const result = JSON.parse(stdout);
-                resolve(result);
-              } catch (e) {
-                resolve({
-                  success: false,
-                  vulnerability_id,
-                  error: "Failed to parse output",
-                });
-              }
-            } else {
-              resolve({
-                success: false,
-                vulnerability_id,
-                error: `Script failed with code ${code}`,
-              });
+    // Score the whole batch in one Python process; it streams one JSON line per vulnerability
+    let timings: Record<string, any> | undefined;
+    const results = await new Promise<any[]>((resolve) => {
+      const pythonProcess = spawn(
+        "python3",
+        [scriptPath, "--ids", vulnerability_ids.map((id: any) => id.toString()).join(",")],
+        {
+          env: {
+            ...process.env,
+            DB_HOST: process.env.DB_HOST || "localhost",
+            DB_PORT: process.env.DB_PORT || "5432",
+            DB_NAME: process.env.DB_NAME,
+            DB_USER: process.env.DB_USER,
+            DB_PASSWORD: process.env.DB_PASSWORD,
+          },
+        }
+      );
+
+      let stdout = "";
+      let stderr = "";
+
+      pythonProcess.stdout.on("data", (data) => {
+        stdout += data.toString();
+      });
+
+      pythonProcess.stderr.on("data", (data) => {
+        stderr += data.toString();
+      });
+
+      const collect = (error: string) => {
+        const parsed: any[] = [];
+        for (const line of stdout.split("\n")) {
+          if (!line.trim()) continue;
+          try {
+            const message = JSON.parse(line);
+            // The closing timings_summary line is not a per-vulnerability result
+            if (message.type) {
+              timings = message.timings;
+              continue;
             }
-          });
-
-          pythonProcess.on("error", (error) => {
-            resolve({
-              success: false,
-              vulnerability_id,
-              error: error.message,
-            });
-          });
-        });
-
-        results.push(result);
-      } catch (error) {
-        results.push({
-          success: false,
-          vulnerability_id,
-          error: error instanceof Error ? error.message : "Unknown error",
-        });
-      }
-    }
+            parsed.push(message);
+          } catch (e) {
+            // Ignore non-JSON noise on stdout
+          }
+        }
+        // Anything the script never reported on is marked as failed
+        const seen = new Set(parsed.map((r) => String(r.vulnerability_id)));
+        for (const vulnerability_id of vulnerability_ids) {
+          if (!seen.has(String(vulnerability_id))) {
+            parsed.push({ success: false, vulnerability_id, error });
+          }
+        }
+        return parsed;
+      };
+
+      pythonProcess.on("close", (code) => {
+        resolve(collect(`Script failed with code ${code}: ${stderr.slice(-500)}`));
+      });
+
+      pythonProcess.on("error", (error) => {
+        resolve(collect(error.message));
+      });
+    });
 
     const successCount = results.filter((r) => r.success).length;
     const failCount = results.filter((r) => !r.success).length;
@@ -178,6 +141,7 @@ export const PUT = withContext(async ({ tenantDb }, request) => {
       successful: successCount,
       failed: failCount,
       results,
+      timings,
       message: `Processed ${vulnerability_ids.length} vulnerabilities: ${successCount} successful, ${failCount} failed`,
     });
   } catch (error) {
@@ -0,0 +1,135 @@
+/**
+ * EPSS Scoring Worker Client
+ *
+ * Keeps a single long-lived `scripts/epss_worker.py` child process and sends it
+ * newline-delimited JSON requests, instead of spawning a Python process per score.
+ * The worker is restarted on the next request if it exits.
+ *
+ * EPSS_WORKER_ASYNC_POOL sets the worker's `--async-pool` size (default 0: no
+ * extra database connections beyond the worker's own).
+ */
+
+import { spawn, ChildProcessWithoutNullStreams } from "child_process";
+import path from "path";
+
+interface PendingRequest {
+  resolve: (value: any) => void;
+  reject: (reason: Error) => void;
+  timer: NodeJS.Timeout;
+}
+
+const REQUEST_TIMEOUT_MS = 60_000;
+const ASYNC_POOL_SIZE = process.env.EPSS_WORKER_ASYNC_POOL || "0";
+
+let worker: ChildProcessWithoutNullStreams | null = null;
+let nextRequestId = 1;
+let buffer = "";
+const pending = new Map<number, PendingRequest>();
+
+function failPending(error: Error) {
+  for (const [id, request] of pending) {
+    clearTimeout(request.timer);
+    request.reject(error);
+    pending.delete(id);
+  }
+}
+
+function handleLine(line: string) {
+  if (!line.trim()) return;
+  let message: any;
+  try {
+    message = JSON.parse(line);
+  } catch (e) {
+    return;
+  }
+  // Lifecycle events (ready/shutdown) carry no request id
+  if (message.id === undefined || message.id === null) return;
+
+  const request = pending.get(message.id);
+  if (!request) return;
+  pending.delete(message.id);
+  clearTimeout(request.timer);
+
+  if (message.ok) {
+    request.resolve(message.result);
+  } else {
+    request.reject(new Error(message.error || "EPSS worker request failed"));
+  }
+}
+
+function getWorker(): ChildProcessWithoutNullStreams {
+  if (worker && worker.exitCode === null && !worker.killed) {
+    return worker;
+  }
+
+  const scriptPath = path.join(process.cwd(), "scripts", "epss_worker.py");
+  const child = spawn("python3", [scriptPath, "--async-pool", ASYNC_POOL_SIZE], {
+    env: {
+      ...process.env,
+      DB_HOST: process.env.DB_HOST || "localhost",
+      DB_PORT: process.env.DB_PORT || "5432",
+      DB_NAME: process.env.DB_NAME,
+      DB_USER: process.env.DB_USER,
+      DB_PASSWORD: process.env.DB_PASSWORD,
+    },
+  });
+
+  buffer = "";
+  child.stdout.on("data", (data) => {
+    buffer += data.toString();
+    let newline = buffer.indexOf("\n");
+    while (newline !== -1) {
+      handleLine(buffer.slice(0, newline));
+      buffer = buffer.slice(newline + 1);
+      newline = buffer.indexOf("\n");
+    }
+  });
+
+  child.stderr.on("data", (data) => {
+    console.debug("[epss-worker]", data.toString().trimEnd());
+  });
+
+  child.on("exit", (code) => {
+    if (worker === child) worker = null;
+    failPending(new Error(`EPSS worker exited with code ${code}`));
+  });
+
+  child.on("error", (error) => {
+    if (worker === child) worker = null;
+    failPending(new Error(`Failed to start EPSS worker: ${error.message}`));
+  });
+
+  // EPIPE when the worker dies mid-write; unhandled it would crash the server
+  child.stdin.on("error", (error) => {
+    if (worker === child) worker = null;
+    failPending(new Error(`EPSS worker stdin failed: ${error.message}`));
+  });
+
+  worker = child;
+  return child;
+}
+
+/**
+ * Sends one request to the EPSS worker and resolves with its result
+ * @param op Worker operation ("score", "batch", "health", "ready")
+ * @param params Operation parameters
+ */
+export function callEpssWorker(op: string, params: Record<string, any> = {}): Promise<any> {
+  const child = getWorker();
+  const id = nextRequestId++;
+
+  return new Promise((resolve, reject) => {
+    const timer = setTimeout(() => {
+      pending.delete(id);
+      reject(new Error(`EPSS worker request ${op} timed out`));
+    }, REQUEST_TIMEOUT_MS);
+
+    pending.set(id, { resolve, reject, timer });
+    child.stdin.write(JSON.stringify({ id, op, ...params }) + "\n", (error) => {
+      if (!error || !pending.has(id)) return;
+      pending.delete(id);
+      clearTimeout(timer);
+      reject(new Error(`EPSS worker request ${op} could not be sent: ${error.message}`));
+    });
+  });
+}
@@ -0,0 +1,63 @@
+-- Add trigram indexes for EPSS asset matching
+-- The EPSS calculator matches asset names against free-text columns with
+-- ILIKE '%asset%', which sequentially scans without a trigram index.
+-- gin_trgm_ops indexes serve those ILIKE patterns directly. The full-text
+-- indexes for the opt-in --text-match fts mode are a separate migration
+-- (1004-add-epss-fulltext-indexes.sql), so every write does not pay for both.
+-- Run with search_path set to the tenant schema (e.g. SET search_path TO org_mashreqbank).
+-- Index expressions must match the calculator's queries exactly.
+
+CREATE EXTENSION IF NOT EXISTS pg_trgm;
+
+DO $$
+DECLARE
+    target RECORD;
+    column_expression TEXT;
+    index_suffix TEXT;
+BEGIN
+    FOR target IN
+        SELECT * FROM (VALUES
+            ('incidents', 'description', NULL),
+            ('incidents', 'assets', NULL),
+            ('vulnerabilities', 'assets', 'text'),
+            ('vulnerabilities', 'affected_systems', NULL),
+            ('assessment_findings', 'finding_description', NULL),
+            ('fair_risks', 'description', NULL),
+            ('iso27001_risks', 'description', NULL),
+            ('nist_csf_risk_templates', 'description', NULL),
+            ('third_party_risk_assessments', 'vendor_name', NULL),
+            ('third_party_risk_assessments', 'assessment_findings', NULL)
+        ) AS t(table_name, column_name, cast_to)
+    LOOP
+        -- Only tables and columns visible on the current search_path
+        IF to_regclass(quote_ident(target.table_name)) IS NULL OR NOT EXISTS (
+            SELECT 1
+            FROM pg_attribute
+            WHERE attrelid = to_regclass(quote_ident(target.table_name))
+            AND attname = target.column_name
+            AND NOT attisdropped
+        ) THEN
+            RAISE NOTICE '%.% not found, skipping', target.table_name, target.column_name;
+            CONTINUE;
+        END IF;
+
+        IF target.cast_to IS NULL THEN
+            column_expression := quote_ident(target.column_name);
+            index_suffix := target.column_name;
+        ELSE
+            column_expression := format('(%I::%s)', target.column_name, target.cast_to);
+            index_suffix := target.column_name || '_' || target.cast_to;
+        END IF;
+
+        EXECUTE format(
+            'CREATE INDEX IF NOT EXISTS %I ON %I USING gin (%s gin_trgm_ops)',
+            'idx_' || target.table_name || '_' || index_suffix || '_trgm',
+            target.table_name,
+            column_expression
+        );
+        RAISE NOTICE 'Trigram index ensured on %.%', target.table_name, target.column_name;
+
+        -- Expression indexes need fresh statistics before the planner trusts them
+        EXECUTE format('ANALYZE %I', target.table_name);
+    END LOOP;
+END $$;
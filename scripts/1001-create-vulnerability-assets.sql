@@ -0,0 +1,24 @@
+-- Create vulnerability_assets: one row per (vulnerability, asset) derived from vulnerabilities.assets
+-- Kept in sync incrementally by the EPSS calculator (python epss_calculator.py --sync-assets),
+-- so "all vulnerabilities touching asset X" is an index lookup instead of parsing JSON.
+-- Run with search_path set to the tenant schema (e.g. SET search_path TO org_mashreqbank).
+
+CREATE TABLE IF NOT EXISTS vulnerability_assets (
+    vulnerability_id INTEGER NOT NULL REFERENCES vulnerabilities(id) ON DELETE CASCADE,
+    asset_key TEXT NOT NULL,
+    PRIMARY KEY (vulnerability_id, asset_key)
+);
+
+-- Asset -> vulnerabilities lookups
+CREATE INDEX IF NOT EXISTS idx_vulnerability_assets_asset_key ON vulnerability_assets(asset_key, vulnerability_id);
+
+-- Hash of the assets value each vulnerability was last synced from; only changed rows are re-synced
+CREATE TABLE IF NOT EXISTS vulnerability_assets_sync (
+    vulnerability_id INTEGER PRIMARY KEY REFERENCES vulnerabilities(id) ON DELETE CASCADE,
+    assets_hash TEXT NOT NULL,
+    synced_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+);
+
+COMMENT ON TABLE vulnerability_assets IS 'Assets of each vulnerability as parsed from vulnerabilities.assets, maintained by the EPSS calculator';
+COMMENT ON COLUMN vulnerability_assets.asset_key IS 'Asset name exactly as listed in vulnerabilities.assets';
+COMMENT ON TABLE vulnerability_assets_sync IS 'md5 of vulnerabilities.assets at the last vulnerability_assets sync';
@@ -0,0 +1,45 @@
+-- Create epss_score_history: append-only time series of contextual EPSS scores
+-- One row per vulnerability per scoring run, written by the EPSS calculator alongside its
+-- bulk score update. Range-partitioned by month on scored_at; the calculator creates the
+-- partition for the current month on first write, old months can be detached or dropped.
+-- Run with search_path set to the tenant schema (e.g. SET search_path TO org_mashreqbank).
+
+CREATE TABLE IF NOT EXISTS epss_score_history (
+    vulnerability_id INTEGER NOT NULL,
+    scored_at TIMESTAMP NOT NULL,
+    epss_score REAL NOT NULL,
+    epss_percentile REAL,
+    incidents_count INTEGER NOT NULL DEFAULT 0,
+    vulnerabilities_count INTEGER NOT NULL DEFAULT 0,
+    findings_count INTEGER NOT NULL DEFAULT 0,
+    risks_count INTEGER NOT NULL DEFAULT 0,
+    third_party_gaps_count INTEGER NOT NULL DEFAULT 0
+) PARTITION BY RANGE (scored_at);
+
+-- Previous score of a vulnerability
+CREATE INDEX IF NOT EXISTS idx_epss_score_history_vulnerability ON epss_score_history(vulnerability_id, scored_at DESC);
+-- Latest run; scored_at only grows, so inserts always land on the rightmost leaf
+CREATE INDEX IF NOT EXISTS idx_epss_score_history_scored_at ON epss_score_history(scored_at);
+
+-- Rows outside every monthly partition land here instead of failing the write
+CREATE TABLE IF NOT EXISTS epss_score_history_default PARTITION OF epss_score_history DEFAULT;
+
+-- Partitions for the current and next month
+DO $$
+DECLARE
+    month_start DATE;
+BEGIN
+    FOR i IN 0..1 LOOP
+        month_start := (date_trunc('month', CURRENT_DATE) + make_interval(months => i))::date;
+        EXECUTE format(
+            'CREATE TABLE IF NOT EXISTS %I PARTITION OF epss_score_history FOR VALUES FROM (%L) TO (%L)',
+            'epss_score_history_' || to_char(month_start, '"y"YYYY"m"MM'),
+            month_start,
+            (month_start + INTERVAL '1 month')::date
+        );
+        RAISE NOTICE 'Partition for % ready', to_char(month_start, 'YYYY-MM');
+    END LOOP;
+END $$;
+
+COMMENT ON TABLE epss_score_history IS 'Append-only history of contextual EPSS scores and factor counts, one row per vulnerability per scoring run';
+COMMENT ON COLUMN epss_score_history.scored_at IS 'Start of the scoring run; shared by every row the run wrote';
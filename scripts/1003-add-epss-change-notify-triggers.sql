@@ -0,0 +1,78 @@
+-- Notify the EPSS listener (python epss_listener.py) when rows that feed EPSS risk factors change
+-- Each insert/update/delete on incidents, assessment_findings, the risk registers and
+-- third_party_risk_assessments sends a NOTIFY on channel epss_changes carrying the row id and
+-- the text of the columns the EPSS calculator searches for asset names (old and new values).
+-- Run with search_path set to the tenant schema (e.g. SET search_path TO org_mashreqbank).
+
+CREATE OR REPLACE FUNCTION epss_notify_change() RETURNS trigger AS $$
+DECLARE
+    new_row JSONB := CASE WHEN TG_OP <> 'DELETE' THEN to_jsonb(NEW) END;
+    old_row JSONB := CASE WHEN TG_OP <> 'INSERT' THEN to_jsonb(OLD) END;
+    texts JSONB := '[]'::jsonb;
+    payload TEXT;
+    value TEXT;
+BEGIN
+    -- Trigger arguments name the searched text columns
+    FOR i IN 0 .. TG_NARGS - 1 LOOP
+        FOREACH value IN ARRAY ARRAY[new_row ->> TG_ARGV[i], old_row ->> TG_ARGV[i]] LOOP
+            IF value IS NOT NULL AND NOT texts @> jsonb_build_array(value) THEN
+                texts := texts || jsonb_build_array(value);
+            END IF;
+        END LOOP;
+    END LOOP;
+
+    payload := json_build_object(
+        'schema', TG_TABLE_SCHEMA,
+        'table', TG_TABLE_NAME,
+        'op', TG_OP,
+        'id', COALESCE(new_row -> 'id', old_row -> 'id'),
+        'texts', texts,
+        'truncated', FALSE
+    )::text;
+    -- NOTIFY payloads are limited to 8000 bytes; the listener re-reads the row instead
+    IF octet_length(payload) > 7900 THEN
+        payload := json_build_object(
+            'schema', TG_TABLE_SCHEMA,
+            'table', TG_TABLE_NAME,
+            'op', TG_OP,
+            'id', COALESCE(new_row -> 'id', old_row -> 'id'),
+            'texts', '[]'::json,
+            'truncated', TRUE
+        )::text;
+    END IF;
+
+    PERFORM pg_notify('epss_changes', payload);
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DO $$
+DECLARE
+    source RECORD;
+BEGIN
+    FOR source IN
+        SELECT * FROM (VALUES
+            ('incidents', ARRAY['description', 'assets']),
+            ('assessment_findings', ARRAY['finding_description']),
+            ('fair_risks', ARRAY['description']),
+            ('iso27001_risks', ARRAY['description']),
+            ('nist_csf_risk_templates', ARRAY['description']),
+            ('third_party_risk_assessments', ARRAY['vendor_name', 'assessment_findings'])
+        ) AS s(table_name, columns)
+    LOOP
+        IF to_regclass(source.table_name) IS NULL THEN
+            RAISE NOTICE 'Table % not found, skipping EPSS notify trigger', source.table_name;
+            CONTINUE;
+        END IF;
+        EXECUTE format('DROP TRIGGER IF EXISTS epss_notify_change ON %I', source.table_name);
+        EXECUTE format(
+            'CREATE TRIGGER epss_notify_change AFTER INSERT OR UPDATE OR DELETE ON %I '
+            'FOR EACH ROW EXECUTE FUNCTION epss_notify_change(%s)',
+            source.table_name,
+            (SELECT string_agg(quote_literal(c), ', ') FROM unnest(source.columns) AS c)
+        );
+        RAISE NOTICE 'EPSS notify trigger created on %', source.table_name;
+    END LOOP;
+END $$;
+
+COMMENT ON FUNCTION epss_notify_change() IS 'Sends changed rows of EPSS factor tables to the epss_changes channel for event-driven rescoring';
@@ -0,0 +1,60 @@
+-- Add full-text indexes for the EPSS calculator's opt-in --text-match fts mode
+-- OPTIONAL: only run this for tenants scored with --text-match fts. Each index is
+-- another GIN index maintained on every write to these OLTP tables, and the
+-- calculator prefers the trigram indexes (1000-add-epss-text-search-indexes.sql)
+-- wherever they exist, so fts is only chosen for tables without them.
+-- Run with search_path set to the tenant schema (e.g. SET search_path TO org_mashreqbank).
+-- Index expressions must match the calculator's queries exactly.
+
+DO $$
+DECLARE
+    target RECORD;
+    column_expression TEXT;
+    index_suffix TEXT;
+BEGIN
+    FOR target IN
+        SELECT * FROM (VALUES
+            ('incidents', 'description', NULL),
+            ('incidents', 'assets', NULL),
+            ('vulnerabilities', 'assets', 'text'),
+            ('vulnerabilities', 'affected_systems', NULL),
+            ('assessment_findings', 'finding_description', NULL),
+            ('fair_risks', 'description', NULL),
+            ('iso27001_risks', 'description', NULL),
+            ('nist_csf_risk_templates', 'description', NULL),
+            ('third_party_risk_assessments', 'vendor_name', NULL),
+            ('third_party_risk_assessments', 'assessment_findings', NULL)
+        ) AS t(table_name, column_name, cast_to)
+    LOOP
+        -- Only tables and columns visible on the current search_path
+        IF to_regclass(quote_ident(target.table_name)) IS NULL OR NOT EXISTS (
+            SELECT 1
+            FROM pg_attribute
+            WHERE attrelid = to_regclass(quote_ident(target.table_name))
+            AND attname = target.column_name
+            AND NOT attisdropped
+        ) THEN
+            RAISE NOTICE '%.% not found, skipping', target.table_name, target.column_name;
+            CONTINUE;
+        END IF;
+
+        IF target.cast_to IS NULL THEN
+            column_expression := quote_ident(target.column_name);
+            index_suffix := target.column_name;
+        ELSE
+            column_expression := format('(%I::%s)', target.column_name, target.cast_to);
+            index_suffix := target.column_name || '_' || target.cast_to;
+        END IF;
+
+        EXECUTE format(
+            'CREATE INDEX IF NOT EXISTS %I ON %I USING gin (to_tsvector(''simple'', %s))',
+            'idx_' || target.table_name || '_' || index_suffix || '_fts',
+            target.table_name,
+            column_expression
+        );
+        RAISE NOTICE 'Full-text index ensured on %.%', target.table_name, target.column_name;
+
+        -- Expression indexes need fresh statistics before the planner trusts them
+        EXECUTE format('ANALYZE %I', target.table_name);
+    END LOOP;
+END $$;
@@ -0,0 +1,145 @@
+#!/usr/bin/env python3
+"""
+Asset Mention Index for EPSS factor counting
+Matches every asset name against GRC free-text columns in one pass using an
+Aho-Corasick automaton and keeps an asset -> matching row ids inverted index
+"""
+
+import re
+from collections import deque
+from typing import Dict, List, Any, Optional, Iterable, Sequence, Set, Tuple
+
+# Characters with special meaning in a (default escape) LIKE pattern
+LIKE_METACHARACTERS = ('%', '_', '\\')
+
+
+def like_to_regex(pattern: str) -> 're.Pattern':
+    """Translate an ILIKE pattern to an equivalent case-insensitive regex"""
+    parts = []
+    i = 0
+    while i < len(pattern):
+        ch = pattern[i]
+        if ch == '\\' and i + 1 < len(pattern):
+            parts.append(re.escape(pattern[i + 1]))
+            i += 2
+            continue
+        if ch == '%':
+            parts.append('.*')
+        elif ch == '_':
+            parts.append('.')
+        else:
+            parts.append(re.escape(ch))
+        i += 1
+    return re.compile('^' + ''.join(parts) + '$', re.IGNORECASE | re.DOTALL)
+
+
+class AhoCorasick:
+    """Multi-pattern substring matcher (Aho-Corasick automaton)"""
+
+    def __init__(self, patterns: Sequence[str]):
+        """Build the automaton; pattern ids are their positions in ``patterns``"""
+        self.goto: List[Dict[str, int]] = [{}]
+        self.fail: List[int] = [0]
+        self.output: List[List[int]] = [[]]
+
+        for pattern_id, pattern in enumerate(patterns):
+            if not pattern:
+                continue
+            state = 0
+            for ch in pattern:
+                next_state = self.goto[state].get(ch)
+                if next_state is None:
+                    next_state = len(self.goto)
+                    self.goto[state][ch] = next_state
+                    self.goto.append({})
+                    self.fail.append(0)
+                    self.output.append([])
+                state = next_state
+            self.output[state].append(pattern_id)
+
+        # Breadth-first pass to set failure links and merge outputs
+        queue = deque(self.goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for ch, next_state in self.goto[state].items():
+                queue.append(next_state)
+                fallback = self.fail[state]
+                while fallback and ch not in self.goto[fallback]:
+                    fallback = self.fail[fallback]
+                target = self.goto[fallback].get(ch, 0)
+                self.fail[next_state] = target if target != next_state else 0
+                self.output[next_state] = self.output[next_state] + self.output[self.fail[next_state]]
+
+    def find(self, text: str) -> Set[int]:
+        """Return the ids of all patterns occurring in ``text``"""
+        found = set()
+        goto, fail, output = self.goto, self.fail, self.output
+        state = 0
+        for ch in text:
+            while state and ch not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(ch, 0)
+            if output[state]:
+                found.update(output[state])
+        return found
+
+
+class AssetMentionIndex:
+    """Inverted index from asset name to the rows of each source that mention it.
+
+    Matching follows ``column ILIKE '%asset%'``: case-insensitive substring
+    matching, NULL columns never match, and assets containing LIKE wildcards
+    are matched as patterns rather than literal text.
+    """
+
+    def __init__(self, assets: Iterable[str]):
+        """Prepare matchers for the distinct asset names"""
+        self.assets = sorted(set(assets))
+        literal_ids = []
+        self.wildcard_assets: List[Tuple[int, 're.Pattern']] = []
+        for asset_id, asset in enumerate(self.assets):
+            if any(ch in asset for ch in LIKE_METACHARACTERS):
+                self.wildcard_assets.append((asset_id, like_to_regex(f'%{asset}%')))
+            else:
+                literal_ids.append(asset_id)
+        self.literal_ids = literal_ids
+        self.automaton = AhoCorasick([self.assets[i].lower() for i in literal_ids])
+        self.asset_ids = {asset: asset_id for asset_id, asset in enumerate(self.assets)}
+        self.index: Dict[str, Dict[int, Set[Any]]] = {}
+        self.rows_scanned: Dict[str, int] = {}
+
+    def match(self, text: Optional[str]) -> Set[int]:
+        """Return ids of the assets mentioned in one column value"""
+        if text is None:
+            return set()
+        matched = {self.literal_ids[i] for i in self.automaton.find(text.lower())}
+        for asset_id, regex in self.wildcard_assets:
+            if asset_id not in matched and regex.match(text):
+                matched.add(asset_id)
+        return matched
+
+    def add_rows(self, source: str, rows: Iterable[Tuple[Any, Sequence[Optional[str]]]]):
+        """Index ``(row_id, column_values)`` rows of one source table"""
+        postings = self.index.setdefault(source, {})
+        scanned = 0
+        for row_id, values in rows:
+            scanned += 1
+            matched = set()
+            for value in values:
+                matched |= self.match(value)
+            for asset_id in matched:
+                postings.setdefault(asset_id, set()).add(row_id)
+        self.rows_scanned[source] = self.rows_scanned.get(source, 0) + scanned
+
+    def count(self, source: str, assets: Iterable[str]) -> int:
+        """Count distinct rows of ``source`` mentioning any of ``assets``"""
+        postings = self.index.get(source)
+        if not postings:
+            return 0
+        row_sets = [postings[self.asset_ids[a]] for a in assets
+                    if a in self.asset_ids and self.asset_ids[a] in postings]
+        if not row_sets:
+            return 0
+        if len(row_sets) == 1:
+            return len(row_sets[0])
+        return len(set().union(*row_sets))
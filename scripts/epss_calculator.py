@@ -5,16 +5,26 @@ Calculates Exploit Prediction Scoring System (EPSS) based on multiple risk facto
 """
 
 import os
+import io
+import re
+import csv
 import sys
 import json
+import asyncio
+import hashlib
+import argparse
+from bisect import bisect_left, bisect_right, insort
 import psycopg2
-from psycopg2.extras import RealDictCursor
 import numpy as np
-from sklearn.preprocessing import StandardScaler
-from sklearn.ensemble import RandomForestRegressor
 import logging
-from datetime import datetime
-from typing import Dict, List, Any, Optional
+import time
+from datetime import datetime, timedelta
+from typing import Dict, List, Any, Optional, Iterable, Iterator, Tuple
+
+from epss_asset_index import AssetMentionIndex
+from epss_instrumentation import Instrumentation, InstrumentedConnection, InstrumentedCursor
+from epss_model import EPSSModel, load_model
+from schema_catalog import SchemaCatalog, catalog as default_catalog, normalize_expression
 
 # Configure logging
 logging.basicConfig(
@@ -32,11 +42,248 @@ WEIGHTS = {
     'open_risks': 0.20      # 20%
 }
 
+# Risk register tables searched for open critical/high risks
+RISK_TABLES = ['fair_risks', 'iso27001_risks', 'nist_csf_risk_templates']
+
+# Factor counts produced for every vulnerability
+FACTOR_KEYS = ['incidents_count', 'vulnerabilities_count', 'findings_count',
+               'risks_count', 'third_party_gaps_count']
+
+# Factor sources: (factor, table, text columns searched for assets, filter on t).
+# The predicates are the same as in the per-vulnerability count_* methods; a row
+# counts when any of its columns matches ILIKE '%asset%' for any asset.
+FACTOR_SOURCES = [
+    ('incidents_count', 'incidents', ['description', 'assets'],
+     "t.status IN ('Open', 'In Progress', 'Investigating') AND t.severity IN ('Critical', 'High')"),
+    ('vulnerabilities_count', 'vulnerabilities', ['assets::text', 'affected_systems'],
+     "t.remediation_status IN ('Open', 'In Progress') AND t.severity IN ('Critical', 'High')"),
+    ('findings_count', 'assessment_findings', ['finding_description'],
+     "t.status IN ('Open', 'In Progress') AND t.severity IN ('Critical', 'High')"),
+] + [
+    ('risks_count', table, ['description'],
+     "t.status IN ('Open', 'Identified', 'In Progress') "
+     "AND ((t.impact >= 4 AND t.likelihood >= 4) OR t.risk_level IN ('Critical', 'High'))")
+    for table in RISK_TABLES
+] + [
+    ('third_party_gaps_count', 'third_party_risk_assessments', ['vendor_name', 'assessment_findings'],
+     "t.status IN ('Open', 'In Progress', 'Identified') AND t.risk_level IN ('Critical', 'High')"),
+]
+
+# Risk factor engines for batch scoring
+ENGINES = ['sql', 'memory', 'per-vuln']
+
+# How the set-based engine matches assets in free text: 'auto' probes pg_trgm
+# indexes where every column of a factor table has one and falls back to ILIKE;
+# 'fts' also uses to_tsvector indexes (whole-token phrase matches, not substrings;
+# created by the optional 1004-add-epss-fulltext-indexes.sql migration);
+# 'ilike' always uses the original ILIKE join
+TEXT_MATCH_MODES = ['auto', 'fts', 'ilike']
+
+# Tables that may be missing in a schema; their factors count as 0 when absent
+OPTIONAL_FACTOR_TABLES = RISK_TABLES + ['third_party_risk_assessments']
+
+# Weights as stored in epss_calculation_metadata, serialized once
+WEIGHTS_JSON = json.dumps(WEIGHTS, separators=(',', ':'))
+
+# Columns used as change watermarks in incremental mode
+WATERMARK_COLUMNS = ['updated_at', 'created_at']
+
+# epss_model_version stamped on scores from the weighted formula (trained models stamp their artifact version)
+FORMULA_MODEL_VERSION = 'weighted-formula'
+
+# Every scored vulnerability, for a PercentileRanker
+RANKER_SCORES_QUERY = """
+    SELECT id, epss_score::float8 AS epss_score
+    FROM vulnerabilities
+    WHERE epss_score IS NOT NULL
+"""
+
+# Counts for rank_percentile(), formatted with the driver's placeholders for the score and the id
+RANK_COUNTS_QUERY = """
+    SELECT COUNT(*) FILTER (WHERE epss_score <= {score}) AS at_or_below,
+           COUNT(*) AS total
+    FROM vulnerabilities
+    WHERE epss_score IS NOT NULL AND id <> {vulnerability_id}
+"""
+
+# Appends the stored scores of ``source`` rows to epss_score_history (see history_insert_query)
+HISTORY_INSERT_QUERY = """
+    INSERT INTO epss_score_history
+        (vulnerability_id, scored_at, epss_score, epss_percentile, {factors})
+    SELECT s.{id_column}, {scored_at}, s.epss_score, s.epss_percentile, {counts}
+    FROM {source} s
+    WHERE s.{id_column} = ANY({ids})
+"""
+
+# Scoring inputs per factor: (risk factor key, expected maximum count, WEIGHTS key)
+FACTOR_SCORING = [
+    ('incidents_count', 50, 'incidents'),
+    ('vulnerabilities_count', 100, 'vulnerabilities'),
+    ('findings_count', 100, 'findings'),
+    ('risks_count', 50, 'open_risks'),
+    ('third_party_gaps_count', 30, 'third_party_gaps'),
+]
+
+
+def factor_phase(factor: str) -> str:
+    """Instrumentation phase name of a risk factor (``risks_count`` -> ``risks``)"""
+    return factor[:-len('_count')] if factor.endswith('_count') else factor
+
+
+def normalize_count(count: int, max_expected: int = 100) -> float:
+    """Normalize count to 0-1 scale using logarithmic transformation"""
+    if count == 0:
+        return 0.0
+    # Log scale normalization
+    normalized = np.log1p(count) / np.log1p(max_expected)
+    return min(normalized, 1.0)
+
+
+def calculate_epss_scores(factor_counts: Dict[str, Any], cvss_scores: Any) -> Tuple[np.ndarray, Dict[str, np.ndarray]]:
+    """Vectorized EPSS scoring for N vulnerabilities.
+    
+    ``factor_counts`` maps each FACTOR_KEYS entry to a length-N array of counts
+    and ``cvss_scores`` is a length-N array. Uses the same log1p normalization,
+    caps, weights and 70/30 CVSS blend, in the same order of operations, as
+    EPSSCalculator.calculate_epss_score, so results are numerically identical.
+    Returns the scores and the weighted contribution of each factor keyed by
+    its WEIGHTS name.
+    """
+    contributions = {}
+    weighted = None
+    for factor, max_expected, weight_key in FACTOR_SCORING:
+        counts = np.asarray(factor_counts[factor], dtype=np.float64)
+        normalized = np.minimum(np.log1p(counts) / np.log1p(max_expected), 1.0)
+        normalized[counts == 0] = 0.0
+        contribution = normalized * WEIGHTS[weight_key]
+        contributions[weight_key] = contribution
+        weighted = contribution if weighted is None else weighted + contribution
+    
+    cvss = np.asarray(cvss_scores, dtype=np.float64)
+    # Blend EPSS with CVSS (70% context-based, 30% CVSS) where CVSS is available
+    final = np.where(cvss > 0, (weighted * 0.7) + ((cvss / 10.0) * 0.3), weighted)
+    return np.clip(final, 0.0, 1.0), contributions
+
+
+def portfolio_percentiles(scores: Any) -> np.ndarray:
+    """Percentile rank (0-100) of every score within the given portfolio.
+    
+    A score's percentile is the share of the portfolio scoring the same or
+    lower, as in FIRST.org EPSS percentiles.
+    """
+    scores = np.asarray(scores, dtype=np.float64)
+    if scores.size == 0:
+        return scores
+    sorted_scores = np.sort(scores)
+    return np.round(np.searchsorted(sorted_scores, scores, side='right') / scores.size * 100, 2)
+
+
+def rank_percentile(at_or_below: int, total: int) -> float:
+    """Percentile rank (0-100) of a new score from the other scored vulnerabilities:
+    how many score the same or lower and how many there are. The new score
+    counts itself, as PercentileRanker.update does.
+    """
+    return round((at_or_below + 1) / (total + 1) * 100, 2)
+
+
+def history_insert_query(source: str, id_column: str, scored_at: str, ids: str) -> str:
+    """HISTORY_INSERT_QUERY reading ``source`` (the staging table or vulnerabilities itself),
+    with the driver's placeholders for the run timestamp and the id array"""
+    counts = ", ".join(
+        f"COALESCE((s.epss_calculation_metadata->'risk_factors'->>'{factor}')::int, 0)"
+        for factor in FACTOR_KEYS
+    )
+    return HISTORY_INSERT_QUERY.format(factors=', '.join(FACTOR_KEYS), counts=counts, source=source,
+                                       id_column=id_column, scored_at=scored_at, ids=ids)
+
+
+def history_partition(scored_at: datetime) -> Tuple[Any, str, str]:
+    """Month start, name and CREATE statement of the epss_score_history partition holding ``scored_at``"""
+    month_start = scored_at.date().replace(day=1)
+    next_month = (month_start.replace(day=28) + timedelta(days=4)).replace(day=1)
+    name = f"epss_score_history_y{month_start.year:04d}m{month_start.month:02d}"
+    # Literal bounds: DDL takes no bind parameters on the server-side (asyncpg) path
+    return month_start, name, (f"CREATE TABLE IF NOT EXISTS {name} PARTITION OF epss_score_history "
+                               f"FOR VALUES FROM ('{month_start.isoformat()}') TO ('{next_month.isoformat()}')")
+
+
+def asset_fingerprint(assets: List[str]) -> str:
+    """Fingerprint of a normalized asset list.
+    
+    The factor counts only depend on the set of assets (every count is of
+    distinct rows matching any of them), so order and duplicates are ignored.
+    """
+    return hashlib.sha1('\x1f'.join(sorted(set(assets))).encode('utf-8')).hexdigest()
+
+
+class FactorCountMemo:
+    """Factor counts per asset-set fingerprint, shared across one batch"""
+    
+    def __init__(self):
+        """Start an empty memo table"""
+        self.counts: Dict[str, Tuple[int, ...]] = {}
+        self.hits = 0
+        self.misses = 0
+        self.without_assets = 0
+        
+    def get(self, fingerprint: str) -> Optional[Dict[str, int]]:
+        """Counts for a fingerprint, or None when it has not been counted yet"""
+        counts = self.counts.get(fingerprint)
+        return None if counts is None else dict(zip(FACTOR_KEYS, counts))
+        
+    def put(self, fingerprint: str, counts: Dict[str, int]):
+        """Record the counts of a newly counted asset set"""
+        self.counts[fingerprint] = tuple(counts[factor] for factor in FACTOR_KEYS)
+        
+    def report(self) -> Dict[str, Any]:
+        """Hit/miss report of the reuse achieved"""
+        lookups = self.hits + self.misses
+        return {
+            'vulnerabilities': lookups + self.without_assets,
+            'without_assets': self.without_assets,
+            'distinct_asset_sets': len(self.counts),
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': round(self.hits / lookups, 4) if lookups else None
+        }
+
+
+class PercentileRanker:
+    """Sorted EPSS scores of a portfolio for incremental percentile ranks"""
+    
+    def __init__(self, scores_by_id: Dict[int, float]):
+        """Build the sorted structure from current scores keyed by vulnerability id"""
+        self.scores_by_id = dict(scores_by_id)
+        self.sorted_scores = sorted(self.scores_by_id.values())
+        self.loaded_at = time.time()
+        
+    def percentile(self, score: float) -> float:
+        """Percentile rank (0-100) of a score against the portfolio"""
+        if not self.sorted_scores:
+            return 100.0
+        return round(bisect_right(self.sorted_scores, score) / len(self.sorted_scores) * 100, 2)
+        
+    def update(self, vulnerability_id: int, score: float) -> float:
+        """Replace one vulnerability's score and return its new percentile"""
+        old_score = self.scores_by_id.get(vulnerability_id)
+        if old_score is not None:
+            del self.sorted_scores[bisect_left(self.sorted_scores, old_score)]
+        insort(self.sorted_scores, score)
+        self.scores_by_id[vulnerability_id] = score
+        return self.percentile(score)
+
+
 class EPSSCalculator:
     """EPSS Score Calculator using multi-factor analysis"""
     
-    def __init__(self, db_config: Optional[Dict[str, str]] = None):
-        """Initialize the calculator with database configuration"""
+    def __init__(self, db_config: Optional[Dict[str, str]] = None, catalog: Optional[SchemaCatalog] = None,
+                 schema: Optional[str] = None):
+        """Initialize the calculator with database configuration.
+        
+        ``schema`` pins the connection's search_path to one tenant schema (org_*).
+        """
+        if schema is not None and not re.match(r'^[A-Za-z_][A-Za-z0-9_]*$', schema):
+            raise ValueError(f"Invalid schema name {schema!r}")
         if db_config is None:
             db_config = {
                 'host': os.getenv('DB_HOST', 'localhost'),
@@ -46,13 +293,32 @@ class EPSSCalculator:
                 'password': os.getenv('DB_PASSWORD', '')
             }
         self.db_config = db_config
+        self.schema = schema
         self.conn = None
-        self.scaler = StandardScaler()
+        self.ranker: Optional[PercentileRanker] = None
+        # Reload the ranker after this many seconds (None keeps it for the process)
+        self.ranker_max_age: Optional[float] = None
+        # Per-phase timings and query counts; cheap enough to stay on
+        self.instrumentation = Instrumentation()
+        # Table/column existence per tenant, shared across calculators in the process
+        self.catalog = catalog or default_catalog
+        self.text_match = 'auto'
+        # Set once vulnerability_assets is synced on this connection; batches then join it
+        self.asset_table_synced = False
+        # Months whose epss_score_history partition has been ensured
+        self.history_partitions = set()
+        # Trained model used instead of the weighted formula (see use_model)
+        self.model: Optional[EPSSModel] = None
         
     def connect(self):
         """Establish database connection"""
         try:
-            self.conn = psycopg2.connect(**self.db_config, cursor_factory=RealDictCursor)
+            config = dict(self.db_config)
+            if self.schema:
+                config['options'] = f"-c search_path={self.schema}"
+            self.conn = psycopg2.connect(**config, connection_factory=InstrumentedConnection,
+                                         cursor_factory=InstrumentedCursor)
+            self.conn.instrumentation = self.instrumentation
             logger.info("Database connection established")
         except Exception as e:
             logger.error(f"Database connection failed: {e}")
@@ -63,6 +329,8 @@ class EPSSCalculator:
         if self.conn:
             self.conn.close()
             logger.info("Database connection closed")
+        self.ranker = None
+        self.asset_table_synced = False
             
     def get_vulnerability_data(self, vulnerability_id: int) -> Optional[Dict[str, Any]]:
         """Fetch vulnerability details"""
@@ -193,20 +461,15 @@ class EPSSCalculator:
             return 0
             
         total_risks = 0
-        risk_tables = ['fair_risks', 'iso27001_risks', 'nist_csf_risk_templates']
         
-        for table in risk_tables:
+        for table in RISK_TABLES:
             try:
-                with self.conn.cursor() as cur:
+                with self.instrumentation.phase('risks', table), self.conn.cursor() as cur:
                     # Check if table exists
-                    cur.execute("""
-                        SELECT EXISTS (
-                            SELECT FROM information_schema.tables 
-                            WHERE table_name = %s
-                        )
-                    """, (table,))
+                    with self.instrumentation.phase('schema_check'):
+                        exists = self.catalog.has_table(self.conn, table)
                     
-                    if not cur.fetchone()['exists']:
+                    if not exists:
                         continue
                     
                     asset_conditions = " OR ".join([
@@ -253,14 +516,10 @@ class EPSSCalculator:
         try:
             with self.conn.cursor() as cur:
                 # Check if third_party_risk_assessments table exists
-                cur.execute("""
-                    SELECT EXISTS (
-                        SELECT FROM information_schema.tables 
-                        WHERE table_name = 'third_party_risk_assessments'
-                    )
-                """)
+                with self.instrumentation.phase('schema_check'):
+                    exists = self.catalog.has_table(self.conn, 'third_party_risk_assessments')
                 
-                if not cur.fetchone()['exists']:
+                if not exists:
                     return 0
                 
                 asset_conditions = " OR ".join([
@@ -292,9 +551,16 @@ class EPSSCalculator:
             logger.error(f"Error counting third party gaps: {e}")
             return 0
             
-    def calculate_risk_factors(self, vulnerability_id: int) -> Dict[str, Any]:
-        """Calculate all risk factors for a vulnerability"""
-        vuln_data = self.get_vulnerability_data(vulnerability_id)
+    def calculate_risk_factors(self, vulnerability_id: int,
+                               memo: Optional[FactorCountMemo] = None) -> Dict[str, Any]:
+        """Calculate all risk factors for a vulnerability.
+        
+        With a ``memo`` the five counts are reused when the same asset set was
+        already counted.
+        """
+        phase = self.instrumentation.phase
+        with phase('get_vulnerability_data'):
+            vuln_data = self.get_vulnerability_data(vulnerability_id)
         if not vuln_data:
             raise ValueError(f"Vulnerability {vulnerability_id} not found")
         
@@ -309,28 +575,607 @@ class EPSSCalculator:
             'cve_id': vuln_data.get('cve_id'),
             'severity': vuln_data.get('severity'),
             'cvss_score': float(vuln_data.get('cvss_score') or 0),
-            'assets': assets,
-            'incidents_count': self.count_critical_high_incidents(assets),
-            'vulnerabilities_count': self.count_critical_high_vulnerabilities(assets),
-            'findings_count': self.count_critical_high_findings(assets),
-            'risks_count': self.count_critical_high_risks(assets),
-            'third_party_gaps_count': self.count_third_party_gaps(assets)
+            'assets': assets
         }
         
+        fingerprint = None
+        if memo is not None:
+            if not assets:
+                memo.without_assets += 1
+            else:
+                fingerprint = asset_fingerprint(assets)
+                counts = memo.get(fingerprint)
+                if counts is not None:
+                    memo.hits += 1
+                    risk_factors.update(counts)
+                    logger.info(f"Risk factors reused for asset set {fingerprint[:12]}")
+                    return risk_factors
+                memo.misses += 1
+        
+        with phase('incidents'):
+            risk_factors['incidents_count'] = self.count_critical_high_incidents(assets)
+        with phase('vulnerabilities'):
+            risk_factors['vulnerabilities_count'] = self.count_critical_high_vulnerabilities(assets)
+        with phase('findings'):
+            risk_factors['findings_count'] = self.count_critical_high_findings(assets)
+        with phase('risks'):
+            risk_factors['risks_count'] = self.count_critical_high_risks(assets)
+        with phase('third_party_gaps'):
+            risk_factors['third_party_gaps_count'] = self.count_third_party_gaps(assets)
+        if fingerprint is not None:
+            memo.put(fingerprint, risk_factors)
+        
         logger.info(f"Risk factors calculated: {risk_factors}")
         return risk_factors
         
-    def calculate_epss_score(self, risk_factors: Dict[str, Any]) -> float:
-        """Calculate EPSS score using weighted factors"""
+    def get_vulnerabilities_data(self, vulnerability_ids: List[int]) -> Dict[int, Dict[str, Any]]:
+        """Fetch vulnerability details for many ids in one query"""
+        with self.conn.cursor() as cur:
+            cur.execute("""
+                SELECT id, name, cve_id, severity, assets,
+                       created_at, updated_at, cvss_score
+                FROM vulnerabilities
+                WHERE id = ANY(%s)
+            """, (list(vulnerability_ids),))
+            return {row['id']: row for row in cur.fetchall()}
+            
+    def sync_vulnerability_assets(self, itersize: int = 5000) -> Dict[str, Any]:
+        """Bring vulnerability_assets up to date with vulnerabilities.assets.
+        
+        Only vulnerabilities whose assets value hashes differently from the
+        last sync (or that were never synced) are re-parsed; their rows are
+        replaced in one transaction. Deleted vulnerabilities cascade. Returns
+        a summary; ``available`` is False when the table has not been created.
+        """
+        with self.instrumentation.phase('schema_check'):
+            available = self.catalog.existing_tables(
+                self.conn, ['vulnerability_assets', 'vulnerability_assets_sync'])
+        if len(available) < 2:
+            self.asset_table_synced = False
+            return {'available': False}
+        
+        summary = {'available': True, 'vulnerabilities_changed': 0, 'asset_rows': 0}
+        try:
+            with self.conn.cursor() as cur:
+                cur.execute("""
+                    CREATE TEMP TABLE IF NOT EXISTS epss_asset_sync_hashes (
+                        vulnerability_id INTEGER PRIMARY KEY,
+                        assets_hash TEXT NOT NULL
+                    ) ON COMMIT DELETE ROWS
+                """)
+                cur.execute("""
+                    CREATE TEMP TABLE IF NOT EXISTS epss_asset_sync_rows (
+                        vulnerability_id INTEGER NOT NULL,
+                        asset_key TEXT NOT NULL
+                    ) ON COMMIT DELETE ROWS
+                """)
+            with self.conn.cursor(name='epss_asset_sync') as changed, self.conn.cursor() as cur:
+                changed.itersize = itersize
+                changed.execute("""
+                    SELECT v.id, v.assets::text AS assets, md5(COALESCE(v.assets::text, '')) AS assets_hash
+                    FROM vulnerabilities v
+                    LEFT JOIN vulnerability_assets_sync s ON s.vulnerability_id = v.id
+                    WHERE s.assets_hash IS DISTINCT FROM md5(COALESCE(v.assets::text, ''))
+                """)
+                while True:
+                    rows = changed.fetchmany(itersize)
+                    if not rows:
+                        break
+                    self.instrumentation.add_rows(len(rows))
+                    hashes, assets = io.StringIO(), io.StringIO()
+                    hash_writer, asset_writer = csv.writer(hashes), csv.writer(assets)
+                    for row in rows:
+                        hash_writer.writerow([row['id'], row['assets_hash']])
+                        for asset in set(self.extract_assets(row['assets'])):
+                            asset_writer.writerow([row['id'], asset])
+                            summary['asset_rows'] += 1
+                    summary['vulnerabilities_changed'] += len(rows)
+                    hashes.seek(0)
+                    assets.seek(0)
+                    cur.copy_expert("COPY epss_asset_sync_hashes (vulnerability_id, assets_hash) "
+                                    "FROM STDIN WITH (FORMAT csv)", hashes)
+                    cur.copy_expert("COPY epss_asset_sync_rows (vulnerability_id, asset_key) "
+                                    "FROM STDIN WITH (FORMAT csv)", assets)
+            
+            if summary['vulnerabilities_changed']:
+                with self.conn.cursor() as cur:
+                    cur.execute("""
+                        DELETE FROM vulnerability_assets va
+                        USING epss_asset_sync_hashes h
+                        WHERE va.vulnerability_id = h.vulnerability_id
+                    """)
+                    cur.execute("""
+                        INSERT INTO vulnerability_assets (vulnerability_id, asset_key)
+                        SELECT vulnerability_id, asset_key FROM epss_asset_sync_rows
+                        ON CONFLICT DO NOTHING
+                    """)
+                    cur.execute("""
+                        INSERT INTO vulnerability_assets_sync (vulnerability_id, assets_hash, synced_at)
+                        SELECT vulnerability_id, assets_hash, NOW() FROM epss_asset_sync_hashes
+                        ON CONFLICT (vulnerability_id) DO UPDATE
+                        SET assets_hash = EXCLUDED.assets_hash, synced_at = EXCLUDED.synced_at
+                    """)
+            self.conn.commit()
+        except Exception as e:
+            logger.error(f"Error syncing vulnerability_assets: {e}")
+            self.conn.rollback()
+            self.asset_table_synced = False
+            raise
+        
+        self.asset_table_synced = True
+        logger.info(f"vulnerability_assets synced: {summary}")
+        return summary
+        
+    def load_vulnerability_assets(self, vulnerability_ids: Optional[List[int]] = None) -> Dict[int, List[str]]:
+        """Assets per vulnerability from vulnerability_assets (all vulnerabilities when ids is None)"""
+        with self.conn.cursor() as cur:
+            query = """
+                SELECT vulnerability_id, array_agg(asset_key ORDER BY asset_key) AS assets
+                FROM vulnerability_assets
+            """
+            if vulnerability_ids is None:
+                cur.execute(query + " GROUP BY vulnerability_id")
+            else:
+                cur.execute(query + " WHERE vulnerability_id = ANY(%s) GROUP BY vulnerability_id",
+                            (list(vulnerability_ids),))
+            return {row['vulnerability_id']: list(row['assets']) for row in cur.fetchall()}
+        
+    def assets_for(self, vulnerabilities: Dict[int, Dict[str, Any]]) -> Dict[int, List[str]]:
+        """Assets of the given vulnerability rows: joined from vulnerability_assets once it has
+        been synced on this connection, else parsed from each row's assets JSON"""
+        if self.asset_table_synced:
+            with self.instrumentation.phase('asset_lookup'):
+                joined = self.load_vulnerability_assets(list(vulnerabilities))
+            return {vid: joined.get(vid, []) for vid in vulnerabilities}
+        return {vid: self.extract_assets(row.get('assets')) for vid, row in vulnerabilities.items()}
+        
+    def existing_tables(self, tables: List[str]) -> set:
+        """Return which of the given tables exist in the tenant schema"""
+        with self.instrumentation.phase('schema_check'):
+            return self.catalog.existing_tables(self.conn, tables)
+            
+    def text_match_strategy(self, table: str, columns: List[str]) -> Tuple[str, Optional[str]]:
+        """Pick how a factor table's columns are matched: ('trgm'|'fts'|'ilike', text search config).
+        
+        An index only helps if every OR'ed column has one, so a strategy is
+        chosen only when all columns are covered; otherwise the plain ILIKE
+        join is kept.
+        """
+        if self.text_match == 'ilike':
+            return 'ilike', None
+        indexes = self.catalog.text_search_indexes(self.conn).get(table, {})
+        kinds = [indexes.get(normalize_expression(column), set()) for column in columns]
+        if all('trgm' in k for k in kinds):
+            return 'trgm', None
+        if self.text_match == 'fts':
+            configs = set.intersection(*({k[4:] for k in kind if k.startswith('fts:')} for kind in kinds))
+            if configs:
+                return 'fts', sorted(configs)[0]
+        return 'ilike', None
+        
+    def text_search_report(self, sample_asset: Optional[str] = None) -> List[Dict[str, Any]]:
+        """Index coverage, chosen strategy and plan scan types for every factor table"""
+        if sample_asset is None:
+            with self.conn.cursor() as cur:
+                cur.execute("""
+                    SELECT a AS asset
+                    FROM vulnerabilities, jsonb_array_elements_text(assets) a
+                    WHERE jsonb_typeof(assets) = 'array'
+                    LIMIT 1
+                """)
+                row = cur.fetchone()
+                sample_asset = row['asset'] if row else 'server'
+        available = self.existing_tables(OPTIONAL_FACTOR_TABLES)
+        indexes = self.catalog.text_search_indexes(self.conn)
+        report = []
+        for factor, table, columns, condition in FACTOR_SOURCES:
+            if table in OPTIONAL_FACTOR_TABLES and table not in available:
+                continue
+            strategy, config = self.text_match_strategy(table, columns)
+            if strategy == 'fts':
+                match = " OR ".join(f"to_tsvector('{config}', t.{c}) @@ phraseto_tsquery('{config}', %s)"
+                                    for c in columns)
+                params = [sample_asset] * len(columns)
+            else:
+                match = " OR ".join(f"t.{c} ILIKE %s" for c in columns)
+                params = [f'%{sample_asset}%'] * len(columns)
+            entry = {
+                'factor': factor,
+                'table': table,
+                'strategy': strategy,
+                'indexes': {c: sorted(indexes.get(table, {}).get(normalize_expression(c), set())) for c in columns}
+            }
+            with self.conn.cursor() as cur:
+                cur.execute("SAVEPOINT epss_explain")
+                try:
+                    cur.execute(f"EXPLAIN (FORMAT JSON) SELECT COUNT(*) FROM {table} t WHERE {condition} AND ({match})",
+                                params)
+                    plan = list(cur.fetchone().values())[0][0]['Plan']
+                    scans, stack = [], [plan]
+                    while stack:
+                        node = stack.pop()
+                        if node['Node Type'].endswith('Scan'):
+                            scans.append(node['Node Type'])
+                        stack.extend(node.get('Plans', []))
+                    entry['plan_scans'] = scans
+                    cur.execute("RELEASE SAVEPOINT epss_explain")
+                except Exception as e:
+                    cur.execute("ROLLBACK TO SAVEPOINT epss_explain")
+                    entry['error'] = str(e)
+            report.append(entry)
+        self.conn.rollback()
+        return report
+        
+    def count_portfolio_factors(self, vulnerability_assets: Dict[int, List[str]]) -> Dict[int, Dict[str, int]]:
+        """Count all five risk factors for many vulnerabilities with grouped queries.
+        
+        Each vulnerability's asset list is staged once as (vulnerability_id, pattern)
+        rows in a temporary table. Every factor table is then matched against the
+        distinct patterns in a single statement and the matching row ids are
+        counted per vulnerability, which gives the same result as the per-asset
+        OR-chains in the count_* methods. How the patterns are matched per table
+        follows text_match_strategy.
+        """
+        counts = {vid: dict.fromkeys(FACTOR_KEYS, 0) for vid in vulnerability_assets}
+        
+        vuln_ids, patterns, asset_names = [], [], []
+        for vid, assets in vulnerability_assets.items():
+            for asset in assets:
+                vuln_ids.append(vid)
+                patterns.append(f'%{asset}%')
+                asset_names.append(asset)
+        if not patterns:
+            return counts
         
-        # Normalize counts (using logarithmic scale to handle large variations)
-        def normalize_count(count: int, max_expected: int = 100) -> float:
-            """Normalize count to 0-1 scale using logarithmic transformation"""
-            if count == 0:
-                return 0.0
-            # Log scale normalization
-            normalized = np.log1p(count) / np.log1p(max_expected)
-            return min(normalized, 1.0)
+        available = self.existing_tables(OPTIONAL_FACTOR_TABLES)
+        
+        phase = self.instrumentation.phase
+        with self.conn.cursor() as cur, phase('stage_assets'):
+            cur.execute("""
+                CREATE TEMP TABLE IF NOT EXISTS epss_vuln_assets (
+                    vulnerability_id INTEGER NOT NULL,
+                    pattern TEXT NOT NULL,
+                    asset TEXT NOT NULL
+                )
+            """)
+            cur.execute("TRUNCATE epss_vuln_assets")
+            cur.execute("""
+                INSERT INTO epss_vuln_assets (vulnerability_id, pattern, asset)
+                SELECT * FROM unnest(%s::int[], %s::text[], %s::text[])
+            """, (vuln_ids, patterns, asset_names))
+            cur.execute("ANALYZE epss_vuln_assets")
+        
+        with self.conn.cursor() as cur:
+            for factor, table, columns, condition in FACTOR_SOURCES:
+                if table in OPTIONAL_FACTOR_TABLES and table not in available:
+                    continue
+                strategy, config = self.text_match_strategy(table, columns)
+                if strategy == 'fts':
+                    match = " OR ".join(f"to_tsvector('{config}', t.{column}) @@ phraseto_tsquery('{config}', p.asset)"
+                                        for column in columns)
+                else:
+                    match = " OR ".join(f"t.{column} ILIKE p.pattern" for column in columns)
+                if strategy == 'ilike':
+                    matches = f"""
+                        SELECT p.pattern, t.id
+                        FROM (SELECT DISTINCT pattern, asset FROM epss_vuln_assets) p
+                        JOIN {table} t ON ({match})
+                        WHERE {condition}
+                    """
+                else:
+                    # One index probe per distinct asset instead of one scan of the table
+                    matches = f"""
+                        SELECT p.pattern, m.id
+                        FROM (SELECT DISTINCT pattern, asset FROM epss_vuln_assets) p
+                        CROSS JOIN LATERAL (
+                            SELECT t.id FROM {table} t
+                            WHERE {condition} AND ({match})
+                        ) m
+                    """
+                cur.execute("SAVEPOINT epss_factor")
+                try:
+                    with phase(factor_phase(factor), table if table in RISK_TABLES else None):
+                        cur.execute(f"""
+                            WITH matches AS ({matches})
+                            SELECT va.vulnerability_id, COUNT(DISTINCT m.id) AS count
+                            FROM epss_vuln_assets va
+                            JOIN matches m ON m.pattern = va.pattern
+                            GROUP BY va.vulnerability_id
+                        """)
+                        for row in cur.fetchall():
+                            counts[row['vulnerability_id']][factor] += row['count']
+                    cur.execute("RELEASE SAVEPOINT epss_factor")
+                except Exception as e:
+                    logger.warning(f"Error counting {factor} from {table}: {e}")
+                    cur.execute("ROLLBACK TO SAVEPOINT epss_factor")
+        
+        return counts
+        
+    def build_asset_index(self, assets: Iterable[str], itersize: int = 5000) -> AssetMentionIndex:
+        """Load the open critical/high rows of every factor table once and index asset mentions"""
+        index = AssetMentionIndex(assets)
+        available = self.existing_tables(OPTIONAL_FACTOR_TABLES)
+        
+        for factor, table, columns, condition in FACTOR_SOURCES:
+            if table in OPTIONAL_FACTOR_TABLES and table not in available:
+                continue
+            select = ", ".join(f"t.{column} AS c{i}" for i, column in enumerate(columns))
+            with self.conn.cursor() as cur:
+                cur.execute("SAVEPOINT epss_index")
+            try:
+                # Server-side cursor so large tables stream instead of materializing
+                with self.instrumentation.phase('index', table), \
+                        self.conn.cursor(name=f"epss_index_{table}") as cur:
+                    cur.itersize = itersize
+                    cur.execute(f"SELECT t.id, {select} FROM {table} t WHERE {condition}")
+                    scanned = index.rows_scanned.get(table, 0)
+                    index.add_rows(table, (
+                        (row['id'], [row[f'c{i}'] for i in range(len(columns))])
+                        for row in cur
+                    ))
+                    self.instrumentation.add_rows(index.rows_scanned[table] - scanned)
+                with self.conn.cursor() as cur:
+                    cur.execute("RELEASE SAVEPOINT epss_index")
+            except Exception as e:
+                logger.warning(f"Error indexing {factor} from {table}: {e}")
+                with self.conn.cursor() as cur:
+                    cur.execute("ROLLBACK TO SAVEPOINT epss_index")
+        
+        return index
+        
+    def count_portfolio_factors_in_memory(self, vulnerability_assets: Dict[int, List[str]],
+                                          index: Optional[AssetMentionIndex] = None) -> Dict[int, Dict[str, int]]:
+        """Count all five risk factors from an in-memory asset mention index.
+        
+        Gives the same counts as count_portfolio_factors; each vulnerability's
+        count is the size of the union of its assets' matching row sets.
+        """
+        if index is None:
+            index = self.build_asset_index(
+                asset for assets in vulnerability_assets.values() for asset in assets
+            )
+        counts = {}
+        with self.instrumentation.phase('count_in_memory'):
+            for vid, assets in vulnerability_assets.items():
+                counts[vid] = dict.fromkeys(FACTOR_KEYS, 0)
+                if not assets:
+                    continue
+                for factor, table, _, _ in FACTOR_SOURCES:
+                    counts[vid][factor] += index.count(table, assets)
+        return counts
+        
+    def calculate_portfolio_risk_factors(self, vulnerability_ids: List[int], engine: str = 'sql',
+                                         memo: Optional[FactorCountMemo] = None) -> Dict[int, Dict[str, Any]]:
+        """Calculate risk factors for many vulnerabilities using the set-based engines.
+        
+        ``engine`` is 'sql' for grouped queries or 'memory' for the in-memory
+        asset mention index. Only distinct asset sets are counted: vulnerabilities
+        sharing an asset set, within this call or already in ``memo``, reuse its
+        counts. Returns risk factor dicts shaped like calculate_risk_factors,
+        keyed by id. Ids that do not exist are omitted.
+        """
+        with self.instrumentation.phase('get_vulnerability_data'):
+            vulnerabilities = self.get_vulnerabilities_data(vulnerability_ids)
+        vulnerability_assets = self.assets_for(vulnerabilities)
+        if memo is None:
+            memo = FactorCountMemo()
+        
+        counts = {}
+        fingerprints = {}
+        to_count: Dict[str, List[str]] = {}
+        for vid, assets in vulnerability_assets.items():
+            if not assets:
+                memo.without_assets += 1
+                counts[vid] = dict.fromkeys(FACTOR_KEYS, 0)
+                continue
+            fingerprint = fingerprints[vid] = asset_fingerprint(assets)
+            if fingerprint in memo.counts or fingerprint in to_count:
+                memo.hits += 1
+            else:
+                memo.misses += 1
+                to_count[fingerprint] = assets
+        
+        if to_count:
+            # Count each distinct asset set once, keyed by a stand-in integer id
+            set_fingerprints = list(to_count)
+            set_assets = {i: to_count[fingerprint] for i, fingerprint in enumerate(set_fingerprints)}
+            if engine == 'memory':
+                set_counts = self.count_portfolio_factors_in_memory(set_assets)
+            else:
+                set_counts = self.count_portfolio_factors(set_assets)
+            for i, fingerprint in enumerate(set_fingerprints):
+                memo.put(fingerprint, set_counts[i])
+        for vid, fingerprint in fingerprints.items():
+            counts[vid] = memo.get(fingerprint)
+        
+        risk_factors = {}
+        for vid, row in vulnerabilities.items():
+            risk_factors[vid] = {
+                'vulnerability_id': vid,
+                'vulnerability_name': row['name'],
+                'cve_id': row.get('cve_id'),
+                'severity': row.get('severity'),
+                'cvss_score': float(row.get('cvss_score') or 0),
+                'assets': vulnerability_assets[vid],
+                **counts[vid]
+            }
+        return risk_factors
+        
+    def benchmark_engines(self, vulnerability_ids: List[int]) -> Dict[str, Any]:
+        """Time the sql and memory engines on the same vulnerabilities and compare their counts"""
+        vulnerabilities = self.get_vulnerabilities_data(vulnerability_ids)
+        vulnerability_assets = self.assets_for(vulnerabilities)
+        
+        started = time.perf_counter()
+        sql_counts = self.count_portfolio_factors(vulnerability_assets)
+        sql_seconds = time.perf_counter() - started
+        
+        started = time.perf_counter()
+        index = self.build_asset_index(
+            asset for assets in vulnerability_assets.values() for asset in assets
+        )
+        index_seconds = time.perf_counter() - started
+        memory_counts = self.count_portfolio_factors_in_memory(vulnerability_assets, index)
+        memory_seconds = time.perf_counter() - started
+        self.conn.rollback()
+        
+        mismatches = [
+            {'vulnerability_id': vid, 'factor': factor,
+             'sql': sql_counts[vid][factor], 'memory': memory_counts[vid][factor]}
+            for vid in vulnerability_assets
+            for factor in FACTOR_KEYS
+            if sql_counts[vid][factor] != memory_counts[vid][factor]
+        ]
+        
+        return {
+            'vulnerabilities': len(vulnerability_assets),
+            'distinct_assets': len(index.assets),
+            'rows_indexed': index.rows_scanned,
+            'sql_seconds': round(sql_seconds, 4),
+            'memory_seconds': round(memory_seconds, 4),
+            'memory_index_build_seconds': round(index_seconds, 4),
+            'speedup': round(sql_seconds / memory_seconds, 2) if memory_seconds else None,
+            'identical': not mismatches,
+            'mismatch_count': len(mismatches),
+            'mismatches': mismatches[:50]
+        }
+        
+    def watermark_columns(self, tables: List[str]) -> Dict[str, List[str]]:
+        """Return the watermark columns present on each of the given tables"""
+        with self.instrumentation.phase('schema_check'):
+            found = {table: self.catalog.columns(self.conn, table) for table in tables}
+        return {table: [c for c in WATERMARK_COLUMNS if c in cols] for table, cols in found.items() if cols}
+        
+    def find_stale_vulnerabilities(self, itersize: int = 5000) -> Dict[str, Any]:
+        """Find vulnerabilities whose EPSS inputs changed since they were last scored.
+        
+        A vulnerability is stale when it was never scored, when its own row
+        changed after epss_last_updated, or when a row of any factor table that
+        mentions one of its assets was created or updated after its
+        epss_last_updated. Changed rows are considered whatever their status, so
+        records that were closed or downgraded (lost factors) are caught as well
+        as new ones. Deleted rows leave no watermark; run a full sweep (--all)
+        periodically to pick those up.
+        """
+        with self.conn.cursor() as cur:
+            cur.execute("""
+                SELECT id, assets, epss_last_updated::timestamp AS scored_at,
+                       updated_at::timestamp AS updated_at
+                FROM vulnerabilities
+            """)
+            vulnerabilities = cur.fetchall()
+        joined = self.load_vulnerability_assets() if self.asset_table_synced else None
+        
+        stale = set()
+        reasons = {'never_scored': 0, 'vulnerability_changed': 0, 'related_records_changed': 0}
+        scored = {}
+        for row in vulnerabilities:
+            if row['scored_at'] is None:
+                stale.add(row['id'])
+                reasons['never_scored'] += 1
+            elif row['updated_at'] is not None and row['updated_at'] > row['scored_at']:
+                stale.add(row['id'])
+                reasons['vulnerability_changed'] += 1
+            else:
+                if joined is not None:
+                    assets = joined.get(row['id'], [])
+                else:
+                    assets = self.extract_assets(row.get('assets'))
+                if assets:
+                    scored[row['id']] = (row['scored_at'], assets)
+        
+        since = min((scored_at for scored_at, _ in scored.values()), default=None)
+        if since is not None:
+            tables = sorted({table for _, table, _, _ in FACTOR_SOURCES})
+            available = self.existing_tables(OPTIONAL_FACTOR_TABLES)
+            watermarks = self.watermark_columns(tables)
+            index = AssetMentionIndex(asset for _, assets in scored.values() for asset in assets)
+            changed_at = {}
+            
+            for table in tables:
+                if table in OPTIONAL_FACTOR_TABLES and table not in available:
+                    continue
+                if not watermarks.get(table):
+                    logger.warning(f"{table} has no {'/'.join(WATERMARK_COLUMNS)} column; "
+                                   f"changes there are only picked up by a full sweep")
+                    continue
+                columns = sorted({c for _, t, cols, _ in FACTOR_SOURCES if t == table for c in cols})
+                select = ", ".join(f"t.{column} AS c{i}" for i, column in enumerate(columns))
+                watermark = f"GREATEST({', '.join('t.' + c for c in watermarks[table])})::timestamp"
+                condition = f"{watermark} > %s"
+                if table == 'vulnerabilities':
+                    # Our own EPSS writes bump updated_at together with epss_last_updated
+                    condition += " AND (t.epss_last_updated IS NULL OR t.updated_at > t.epss_last_updated)"
+                
+                table_changes = changed_at.setdefault(table, {})
+                with self.conn.cursor() as cur:
+                    cur.execute("SAVEPOINT epss_changes")
+                try:
+                    with self.conn.cursor(name=f"epss_changes_{table}") as cur:
+                        cur.itersize = itersize
+                        cur.execute(f"SELECT t.id, {watermark} AS changed_at, {select} "
+                                    f"FROM {table} t WHERE {condition}", (since,))
+                        
+                        def rows():
+                            for row in cur:
+                                table_changes[row['id']] = row['changed_at']
+                                yield row['id'], [row[f'c{i}'] for i in range(len(columns))]
+                        
+                        index.add_rows(table, rows())
+                    with self.conn.cursor() as cur:
+                        cur.execute("RELEASE SAVEPOINT epss_changes")
+                except Exception as e:
+                    logger.warning(f"Error scanning changes in {table}: {e}")
+                    with self.conn.cursor() as cur:
+                        cur.execute("ROLLBACK TO SAVEPOINT epss_changes")
+            
+            # Latest related change per asset across all factor tables
+            latest_change = {}
+            for table, postings in index.index.items():
+                for asset_id, row_ids in postings.items():
+                    newest = max(changed_at[table][row_id] for row_id in row_ids)
+                    asset = index.assets[asset_id]
+                    if asset not in latest_change or newest > latest_change[asset]:
+                        latest_change[asset] = newest
+            
+            for vid, (scored_at, assets) in scored.items():
+                if any(a in latest_change and latest_change[a] > scored_at for a in assets):
+                    stale.add(vid)
+                    reasons['related_records_changed'] += 1
+        
+        self.conn.rollback()
+        logger.info(f"Incremental scan: {len(stale)} of {len(vulnerabilities)} vulnerabilities stale {reasons}")
+        return {
+            'vulnerability_ids': sorted(stale),
+            'total_vulnerabilities': len(vulnerabilities),
+            'since': since.isoformat() if since else None,
+            'reasons': reasons
+        }
+        
+    def use_model(self, path: Optional[str] = None) -> EPSSModel:
+        """Score with a trained model artifact instead of the weighted formula (loaded once per process)"""
+        self.model = load_model(path)
+        return self.model
+        
+    @property
+    def model_version(self) -> str:
+        """Value stamped in epss_model_version"""
+        return self.model.version if self.model is not None else FORMULA_MODEL_VERSION
+        
+    def score_vectors(self, factor_counts: Dict[str, Any], cvss_scores: Any) -> np.ndarray:
+        """Scores for N vulnerabilities in one vectorized pass, by the trained model when one is in use"""
+        if self.model is not None:
+            return self.model.predict(factor_counts, cvss_scores)
+        scores, _ = calculate_epss_scores(factor_counts, cvss_scores)
+        return scores
+        
+    def calculate_epss_score(self, risk_factors: Dict[str, Any]) -> float:
+        """Calculate EPSS score using weighted factors (or the trained model when one is in use)"""
+        if self.model is not None:
+            return float(self.model.predict(
+                {factor: [risk_factors[factor]] for factor in FACTOR_KEYS},
+                [risk_factors.get('cvss_score', 0)]
+            )[0])
         
         # Calculate individual risk scores
         incidents_score = normalize_count(risk_factors['incidents_count'], 50)
@@ -360,38 +1205,138 @@ class EPSSCalculator:
         # Ensure score is between 0 and 1
         epss_score = max(0.0, min(1.0, final_score))
         
-        logger.info(f"EPSS Score calculated: {epss_score:.4f}")
-        logger.info(f"  - Incidents contribution: {incidents_score * WEIGHTS['incidents']:.4f}")
-        logger.info(f"  - Vulnerabilities contribution: {vulnerabilities_score * WEIGHTS['vulnerabilities']:.4f}")
-        logger.info(f"  - Findings contribution: {findings_score * WEIGHTS['findings']:.4f}")
-        logger.info(f"  - Risks contribution: {risks_score * WEIGHTS['open_risks']:.4f}")
-        logger.info(f"  - Third party contribution: {third_party_score * WEIGHTS['third_party_gaps']:.4f}")
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug(f"EPSS Score calculated: {epss_score:.4f}")
+            logger.debug(f"  - Incidents contribution: {incidents_score * WEIGHTS['incidents']:.4f}")
+            logger.debug(f"  - Vulnerabilities contribution: {vulnerabilities_score * WEIGHTS['vulnerabilities']:.4f}")
+            logger.debug(f"  - Findings contribution: {findings_score * WEIGHTS['findings']:.4f}")
+            logger.debug(f"  - Risks contribution: {risks_score * WEIGHTS['open_risks']:.4f}")
+            logger.debug(f"  - Third party contribution: {third_party_score * WEIGHTS['third_party_gaps']:.4f}")
         
         return epss_score
         
+    def epss_metadata(self, risk_factors: Dict[str, Any], calculated_at: Optional[str] = None) -> str:
+        """Serialize the epss_calculation_metadata document for one vulnerability"""
+        return (
+            '{"risk_factors":' + json.dumps(risk_factors, separators=(',', ':'), default=str) +
+            ',"weights":' + WEIGHTS_JSON +
+            ',"model_version":' + json.dumps(self.model_version) +
+            ',"calculated_at":' + json.dumps(calculated_at or datetime.now().isoformat()) + '}'
+        )
+        
+    def load_ranker(self) -> PercentileRanker:
+        """Load every scored vulnerability into a sorted percentile ranker"""
+        with self.conn.cursor() as cur:
+            cur.execute(RANKER_SCORES_QUERY)
+            self.ranker = PercentileRanker({row['id']: row['epss_score'] for row in cur.fetchall()})
+        return self.ranker
+        
+    def rank_score(self, vulnerability_id: int, epss_score: float) -> float:
+        """Percentile rank of a new score against the portfolio.
+        
+        With a loaded ranker this is a bisect that also records the new score.
+        Otherwise the rank is counted with one query on the epss_score index,
+        so a one-off rescore never reads the whole portfolio. Other
+        vulnerabilities keep their stored ranks until rebuild_percentiles.
+        """
+        stored_score = round(epss_score, 4)
+        if self.ranker_expired():
+            self.load_ranker()
+        if self.ranker is not None:
+            return self.ranker.update(vulnerability_id, stored_score)
+        
+        with self.conn.cursor() as cur:
+            cur.execute(RANK_COUNTS_QUERY.format(score='%s', vulnerability_id='%s'),
+                        (stored_score, vulnerability_id))
+            row = cur.fetchone()
+        return rank_percentile(row['at_or_below'], row['total'])
+        
+    def ranker_expired(self) -> bool:
+        """Whether the loaded ranker is older than ranker_max_age and should be reloaded"""
+        return self.ranker is not None and self.ranker_max_age is not None and \
+            time.time() - self.ranker.loaded_at > self.ranker_max_age
+        
+    def rebuild_percentiles(self) -> int:
+        """Recompute every vulnerability's percentile against the whole portfolio.
+        
+        Sorts all scores once, ranks them with searchsorted and writes back only
+        the percentiles that changed. Intended for the end of batch sweeps.
+        Returns the number of rows updated.
+        """
+        with self.conn.cursor() as cur:
+            cur.execute(RANKER_SCORES_QUERY)
+            rows = cur.fetchall()
+        if not rows:
+            return 0
+        ids = [row['id'] for row in rows]
+        scores = np.array([row['epss_score'] for row in rows], dtype=np.float64)
+        percentiles = portfolio_percentiles(scores)
+        
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        for vulnerability_id, percentile in zip(ids, percentiles):
+            writer.writerow([vulnerability_id, f"{percentile:.2f}"])
+        buffer.seek(0)
+        
+        try:
+            with self.conn.cursor() as cur:
+                cur.execute("""
+                    CREATE TEMP TABLE IF NOT EXISTS epss_staged_percentiles (
+                        vulnerability_id INTEGER PRIMARY KEY,
+                        epss_percentile NUMERIC(5,2)
+                    )
+                """)
+                cur.execute("TRUNCATE epss_staged_percentiles")
+                cur.copy_expert(
+                    "COPY epss_staged_percentiles (vulnerability_id, epss_percentile) FROM STDIN WITH (FORMAT csv)",
+                    buffer
+                )
+                # Leave updated_at alone: a rank shift is not a change to the vulnerability
+                cur.execute("""
+                    UPDATE vulnerabilities v
+                    SET epss_percentile = s.epss_percentile
+                    FROM epss_staged_percentiles s
+                    WHERE v.id = s.vulnerability_id
+                    AND v.epss_percentile IS DISTINCT FROM s.epss_percentile
+                """)
+                updated = cur.rowcount
+            self.conn.commit()
+        except Exception as e:
+            logger.error(f"Error rebuilding EPSS percentiles: {e}")
+            self.conn.rollback()
+            raise
+        
+        self.ranker = PercentileRanker(dict(zip(ids, scores.tolist())))
+        logger.info(f"EPSS percentiles rebuilt for {len(ids)} vulnerabilities, {updated} changed")
+        return updated
+        
     def update_vulnerability_epss(self, vulnerability_id: int, epss_score: float, 
-                                  risk_factors: Dict[str, Any]) -> bool:
+                                  risk_factors: Dict[str, Any],
+                                  epss_percentile: Optional[float] = None) -> bool:
         """Update vulnerability with calculated EPSS score"""
         try:
+            if epss_percentile is None:
+                epss_percentile = self.rank_score(vulnerability_id, epss_score)
             with self.conn.cursor() as cur:
                 cur.execute("""
                     UPDATE vulnerabilities 
                     SET epss_score = %s,
                         epss_percentile = %s,
+                        epss_model_version = %s,
                         epss_last_updated = NOW(),
                         epss_calculation_metadata = %s,
                         updated_at = NOW()
                     WHERE id = %s
                 """, (
                     epss_score,
-                    epss_score * 100,  # Convert to percentile
-                    json.dumps({
-                        'risk_factors': risk_factors,
-                        'weights': WEIGHTS,
-                        'calculated_at': datetime.now().isoformat()
-                    }),
+                    epss_percentile,
+                    self.model_version,
+                    self.epss_metadata(risk_factors),
                     vulnerability_id
                 ))
+                if cur.rowcount:
+                    self.append_score_history(cur, datetime.now(), [vulnerability_id],
+                                              source='vulnerabilities', id_column='id')
                 self.conn.commit()
                 logger.info(f"EPSS score updated for vulnerability {vulnerability_id}")
                 return True
@@ -400,30 +1345,243 @@ class EPSSCalculator:
             self.conn.rollback()
             return False
             
+    def write_epss_scores(self, scores: List[Tuple[int, float, float, Dict[str, Any]]],
+                          scored_at: Optional[datetime] = None) -> Dict[int, Optional[str]]:
+        """Write many EPSS scores in one transaction.
+        
+        ``scores`` are (vulnerability_id, epss_score, epss_percentile, risk_factors)
+        tuples. They are COPY'd into a temporary staging table and applied with a single
+        UPDATE ... FROM, then committed once. If the bulk update fails, the rows
+        are retried one by one under savepoints so only the offending rows fail.
+        The updated rows are appended to epss_score_history in the same
+        transaction, stamped ``scored_at`` (the run start; now by default).
+        Returns an error message (or None on success) per vulnerability id.
+        """
+        scored_at = scored_at or datetime.now()
+        calculated_at = scored_at.isoformat()
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        for vulnerability_id, epss_score, epss_percentile, risk_factors in scores:
+            writer.writerow([
+                vulnerability_id,
+                epss_score,
+                epss_percentile,
+                self.epss_metadata(risk_factors, calculated_at)
+            ])
+        
+        errors: Dict[int, Optional[str]] = {vid: None for vid, _, _, _ in scores}
+        try:
+            with self.conn.cursor() as cur:
+                cur.execute("""
+                    CREATE TEMP TABLE IF NOT EXISTS epss_staged_scores (
+                        vulnerability_id INTEGER PRIMARY KEY,
+                        epss_score DOUBLE PRECISION,
+                        epss_percentile DOUBLE PRECISION,
+                        epss_calculation_metadata JSONB
+                    )
+                """)
+                cur.execute("TRUNCATE epss_staged_scores")
+                buffer.seek(0)
+                cur.copy_expert(
+                    "COPY epss_staged_scores (vulnerability_id, epss_score, epss_percentile, "
+                    "epss_calculation_metadata) FROM STDIN WITH (FORMAT csv)",
+                    buffer
+                )
+                cur.execute("SAVEPOINT epss_bulk_update")
+                try:
+                    cur.execute("""
+                        UPDATE vulnerabilities v
+                        SET epss_score = s.epss_score,
+                            epss_percentile = s.epss_percentile,
+                            epss_model_version = %s,
+                            epss_last_updated = NOW(),
+                            epss_calculation_metadata = s.epss_calculation_metadata,
+                            updated_at = NOW()
+                        FROM epss_staged_scores s
+                        WHERE v.id = s.vulnerability_id
+                        RETURNING v.id
+                    """, (self.model_version,))
+                    updated = {row['id'] for row in cur.fetchall()}
+                except Exception as e:
+                    logger.warning(f"Bulk EPSS update failed, retrying row by row: {e}")
+                    cur.execute("ROLLBACK TO SAVEPOINT epss_bulk_update")
+                    updated = set()
+                    for vid in errors:
+                        cur.execute("SAVEPOINT epss_row_update")
+                        try:
+                            cur.execute("""
+                                UPDATE vulnerabilities v
+                                SET epss_score = s.epss_score,
+                                    epss_percentile = s.epss_percentile,
+                                    epss_model_version = %s,
+                                    epss_last_updated = NOW(),
+                                    epss_calculation_metadata = s.epss_calculation_metadata,
+                                    updated_at = NOW()
+                                FROM epss_staged_scores s
+                                WHERE v.id = s.vulnerability_id AND s.vulnerability_id = %s
+                                RETURNING v.id
+                            """, (self.model_version, vid))
+                            if cur.fetchone():
+                                updated.add(vid)
+                            cur.execute("RELEASE SAVEPOINT epss_row_update")
+                        except Exception as row_error:
+                            cur.execute("ROLLBACK TO SAVEPOINT epss_row_update")
+                            errors[vid] = str(row_error).strip()
+                
+                if updated:
+                    self.append_score_history(cur, scored_at, updated)
+                
+                for vid in errors:
+                    if vid not in updated and errors[vid] is None:
+                        errors[vid] = f"Vulnerability {vid} not found"
+            self.conn.commit()
+        except Exception as e:
+            logger.error(f"Error writing EPSS scores: {e}")
+            self.conn.rollback()
+            return {vid: str(e) for vid in errors}
+        
+        logger.info(f"EPSS scores written for {sum(1 for e in errors.values() if e is None)} "
+                    f"of {len(errors)} vulnerabilities")
+        return errors
+        
+    def ensure_history_partition(self, cur, scored_at: datetime) -> None:
+        """Create the epss_score_history partition for ``scored_at``'s month unless already done"""
+        month_start, name, create = history_partition(scored_at)
+        if month_start in self.history_partitions:
+            return
+        cur.execute("SAVEPOINT epss_history_partition")
+        try:
+            cur.execute(create)
+            cur.execute("RELEASE SAVEPOINT epss_history_partition")
+        except Exception as e:
+            # e.g. the default partition already holds rows for this month; keep writing there
+            logger.warning(f"Could not create history partition {name}: {e}")
+            cur.execute("ROLLBACK TO SAVEPOINT epss_history_partition")
+        self.history_partitions.add(month_start)
+        
+    def append_score_history(self, cur, scored_at: datetime, vulnerability_ids: Iterable[int],
+                             source: str = 'epss_staged_scores', id_column: str = 'vulnerability_id') -> int:
+        """Append the scores of the given ids to epss_score_history with one INSERT ... SELECT.
+        
+        Reads the staged scores by default; single rescores pass
+        ``source='vulnerabilities', id_column='id'`` to copy the row they just
+        updated. Runs inside the caller's score-write transaction; a history
+        failure is logged and never fails the score write. Skipped when the
+        table does not exist.
+        """
+        with self.instrumentation.phase('schema_check'):
+            if not self.catalog.has_table(self.conn, 'epss_score_history'):
+                return 0
+        with self.instrumentation.phase('history'):
+            self.ensure_history_partition(cur, scored_at)
+            cur.execute("SAVEPOINT epss_history")
+            try:
+                cur.execute(history_insert_query(source, id_column, '%s', '%s'),
+                            (scored_at, list(vulnerability_ids)))
+                appended = cur.rowcount
+                cur.execute("RELEASE SAVEPOINT epss_history")
+                return appended
+            except Exception as e:
+                logger.warning(f"Error appending EPSS score history: {e}")
+                cur.execute("ROLLBACK TO SAVEPOINT epss_history")
+                return 0
+        
+    def score_movers(self, since: Optional[datetime] = None, limit: int = 20) -> Dict[str, Any]:
+        """Largest score changes since each vulnerability's previous history row.
+        
+        Compares the vulnerabilities scored at or after ``since`` (the latest
+        write by default: a batch run or a single rescore) with their last score before it, ordered by the absolute
+        score delta. Factor count deltas show what moved the score.
+        """
+        with self.conn.cursor() as cur:
+            if since is None:
+                cur.execute("SELECT MAX(scored_at) AS scored_at FROM epss_score_history")
+                since = cur.fetchone()['scored_at']
+                if since is None:
+                    return {'since': None, 'movers': []}
+            previous_counts = ", ".join(f"h.{factor}" for factor in FACTOR_KEYS)
+            count_deltas = ", ".join(f"l.{factor} - p.{factor} AS {factor}_delta" for factor in FACTOR_KEYS)
+            cur.execute(f"""
+                WITH latest AS (
+                    SELECT DISTINCT ON (vulnerability_id)
+                           vulnerability_id, scored_at, epss_score, epss_percentile, {', '.join(FACTOR_KEYS)}
+                    FROM epss_score_history
+                    WHERE scored_at >= %(since)s
+                    ORDER BY vulnerability_id, scored_at DESC
+                )
+                SELECT l.vulnerability_id, v.name AS vulnerability_name, v.cve_id,
+                       l.scored_at, l.epss_score, l.epss_percentile,
+                       p.scored_at AS previous_scored_at, p.epss_score AS previous_score,
+                       (l.epss_score - p.epss_score)::float8 AS score_delta, {count_deltas}
+                FROM latest l
+                JOIN LATERAL (
+                    SELECT h.scored_at, h.epss_score, {previous_counts}
+                    FROM epss_score_history h
+                    WHERE h.vulnerability_id = l.vulnerability_id AND h.scored_at < %(since)s
+                    ORDER BY h.scored_at DESC
+                    LIMIT 1
+                ) p ON TRUE
+                LEFT JOIN vulnerabilities v ON v.id = l.vulnerability_id
+                ORDER BY ABS(l.epss_score - p.epss_score) DESC, l.vulnerability_id
+                LIMIT %(limit)s
+            """, {'since': since, 'limit': limit})
+            movers = [dict(row) for row in cur.fetchall()]
+        self.conn.rollback()
+        for mover in movers:
+            mover['score_delta'] = round(mover['score_delta'], 4)
+        return {'since': since.isoformat(), 'movers': movers}
+        
+    def score_vulnerability(self, vulnerability_id: int) -> Dict[str, Any]:
+        """Calculate and store the EPSS score for one vulnerability on the open connection"""
+        self.instrumentation.reset()
+        
+        # Calculate risk factors
+        risk_factors = self.calculate_risk_factors(vulnerability_id)
+        
+        result = self.score_risk_factors(vulnerability_id, risk_factors)
+        result['timings'] = self.instrumentation.timings()
+        return result
+        
+    def score_risk_factors(self, vulnerability_id: int, risk_factors: Dict[str, Any]) -> Dict[str, Any]:
+        """Score already calculated risk factors and store the result"""
+        phase = self.instrumentation.phase
+        
+        # Calculate EPSS score
+        with phase('score'):
+            epss_score = self.calculate_epss_score(risk_factors)
+        
+        # Rank against the portfolio
+        with phase('rank'):
+            epss_percentile = self.rank_score(vulnerability_id, epss_score)
+        
+        # Update database
+        with phase('update'):
+            success = self.update_vulnerability_epss(vulnerability_id, epss_score, risk_factors, epss_percentile)
+        
+        return self.build_result(vulnerability_id, epss_score, risk_factors, success,
+                                 epss_percentile=epss_percentile)
+        
+    def build_result(self, vulnerability_id: int, epss_score: float, risk_factors: Dict[str, Any],
+                     success: bool, error: Optional[str] = None,
+                     epss_percentile: Optional[float] = None) -> Dict[str, Any]:
+        """Build the JSON result reported for one scored vulnerability"""
+        result = {
+            'success': success,
+            'vulnerability_id': vulnerability_id,
+            'epss_score': round(epss_score, 4),
+            'epss_percentile': epss_percentile,
+            'risk_factors': risk_factors,
+            'message': 'EPSS score calculated and updated successfully' if success else 'Failed to update EPSS score'
+        }
+        if error:
+            result['error'] = error
+        return result
+        
     def calculate_and_update(self, vulnerability_id: int) -> Dict[str, Any]:
         """Main method to calculate and update EPSS score"""
         try:
             self.connect()
-            
-            # Calculate risk factors
-            risk_factors = self.calculate_risk_factors(vulnerability_id)
-            
-            # Calculate EPSS score
-            epss_score = self.calculate_epss_score(risk_factors)
-            
-            # Update database
-            success = self.update_vulnerability_epss(vulnerability_id, epss_score, risk_factors)
-            
-            result = {
-                'success': success,
-                'vulnerability_id': vulnerability_id,
-                'epss_score': round(epss_score, 4),
-                'epss_percentile': round(epss_score * 100, 2),
-                'risk_factors': risk_factors,
-                'message': 'EPSS score calculated and updated successfully' if success else 'Failed to update EPSS score'
-            }
-            
-            return result
+            return self.score_vulnerability(vulnerability_id)
             
         except Exception as e:
             logger.error(f"Error in calculate_and_update: {e}")
@@ -434,22 +1592,500 @@ class EPSSCalculator:
             }
         finally:
             self.disconnect()
+            
+    async def create_async_pool(self, min_size: int = 1, max_size: int = 7):
+        """Open an asyncpg pool on the same database for the concurrent scoring path"""
+        import asyncpg
+        
+        config = dict(self.db_config)
+        if config.get('dsn'):
+            connect_args = {'dsn': config['dsn']}
+        else:
+            connect_args = {
+                'host': config.get('host'),
+                'port': int(config.get('port') or 5432),
+                'database': config.get('database'),
+                'user': config.get('user'),
+                'password': config.get('password')
+            }
+        return await asyncpg.create_pool(
+            **connect_args,
+            server_settings={'search_path': self.schema} if self.schema else None,
+            min_size=min_size,
+            max_size=max_size
+        )
+        
+    async def _count_factor_async(self, pool, factor: str, table: str, columns: List[str],
+                                  condition: str, patterns: List[str]) -> Tuple[str, int]:
+        """Run one factor count on its own pooled connection"""
+        match = " OR ".join(f"t.{column} ILIKE ANY($1::text[])" for column in columns)
+        started = time.perf_counter()
+        try:
+            count = await pool.fetchval(
+                f"SELECT COUNT(*) FROM {table} t WHERE {condition} AND ({match})",
+                patterns
+            )
+        except Exception as e:
+            logger.warning(f"Error counting {factor} from {table}: {e}")
+            count = 0
+        phase = factor_phase(factor)
+        self.instrumentation.record(f"{phase}.{table}" if table in RISK_TABLES else phase,
+                                    time.perf_counter() - started, rows=1)
+        return factor, count or 0
+        
+    async def calculate_risk_factors_async(self, vulnerability_id: int, pool) -> Dict[str, Any]:
+        """Calculate all risk factors for a vulnerability with the counts issued concurrently.
+        
+        Each factor table is counted on its own pooled connection at the same
+        time, so latency is close to the slowest single count rather than the
+        sum of them. The counts match calculate_risk_factors.
+        """
+        started = time.perf_counter()
+        vuln_data = await pool.fetchrow("""
+            SELECT id, name, cve_id, severity, assets::text AS assets, cvss_score
+            FROM vulnerabilities
+            WHERE id = $1
+        """, vulnerability_id)
+        self.instrumentation.record('get_vulnerability_data', time.perf_counter() - started,
+                                    rows=1 if vuln_data else 0)
+        if not vuln_data:
+            raise ValueError(f"Vulnerability {vulnerability_id} not found")
+        
+        assets = self.extract_assets(vuln_data['assets'])
+        risk_factors = {
+            'vulnerability_id': vulnerability_id,
+            'vulnerability_name': vuln_data['name'],
+            'cve_id': vuln_data['cve_id'],
+            'severity': vuln_data['severity'],
+            'cvss_score': float(vuln_data['cvss_score'] or 0),
+            'assets': assets,
+            **dict.fromkeys(FACTOR_KEYS, 0)
+        }
+        if not assets:
+            return risk_factors
+        
+        started = time.perf_counter()
+        visible = await self.catalog.tables_async(pool)
+        self.instrumentation.record('schema_check', time.perf_counter() - started, queries=0)
+        
+        patterns = [f'%{asset}%' for asset in assets]
+        counts = await asyncio.gather(*(
+            self._count_factor_async(pool, factor, table, columns, condition, patterns)
+            for factor, table, columns, condition in FACTOR_SOURCES
+            if table not in OPTIONAL_FACTOR_TABLES or table in visible
+        ))
+        for factor, count in counts:
+            risk_factors[factor] += count
+        
+        logger.info(f"Risk factors calculated concurrently for vulnerability {vulnerability_id}")
+        return risk_factors
+        
+    async def score_vulnerability_async(self, vulnerability_id: int, pool) -> Dict[str, Any]:
+        """Async counterpart of score_vulnerability over an asyncpg pool"""
+        self.instrumentation.reset()
+        risk_factors = await self.calculate_risk_factors_async(vulnerability_id, pool)
+        
+        with self.instrumentation.phase('score'):
+            epss_score = self.calculate_epss_score(risk_factors)
+        stored_score = round(epss_score, 4)
+        
+        started = time.perf_counter()
+        if self.ranker_expired():
+            rows = await pool.fetch(RANKER_SCORES_QUERY)
+            self.ranker = PercentileRanker({row['id']: row['epss_score'] for row in rows})
+        if self.ranker is not None:
+            epss_percentile = self.ranker.update(vulnerability_id, stored_score)
+        else:
+            row = await pool.fetchrow(RANK_COUNTS_QUERY.format(score='$1::float8', vulnerability_id='$2'),
+                                      stored_score, vulnerability_id)
+            epss_percentile = rank_percentile(row['at_or_below'], row['total'])
+        self.instrumentation.record('rank', time.perf_counter() - started,
+                                    queries=0 if self.ranker is not None else 1)
+        
+        started = time.perf_counter()
+        try:
+            history = 'epss_score_history' in await self.catalog.tables_async(pool)
+            async with pool.acquire() as conn:
+                async with conn.transaction():
+                    status = await conn.execute("""
+                        UPDATE vulnerabilities
+                        SET epss_score = $1::float8,
+                            epss_percentile = $2::float8,
+                            epss_model_version = $5,
+                            epss_last_updated = NOW(),
+                            epss_calculation_metadata = $3::jsonb,
+                            updated_at = NOW()
+                        WHERE id = $4
+                    """, stored_score, epss_percentile, self.epss_metadata(risk_factors), vulnerability_id,
+                        self.model_version)
+                    success = status.endswith(' 1')
+                    if success and history:
+                        await self.append_score_history_async(conn, datetime.now(), [vulnerability_id])
+            logger.info(f"EPSS score updated for vulnerability {vulnerability_id}")
+        except Exception as e:
+            logger.error(f"Error updating EPSS score: {e}")
+            success = False
+        self.instrumentation.record('update', time.perf_counter() - started)
+        
+        result = self.build_result(vulnerability_id, epss_score, risk_factors, success,
+                                   epss_percentile=epss_percentile)
+        result['timings'] = self.instrumentation.timings()
+        return result
+        
+    async def append_score_history_async(self, conn, scored_at: datetime, vulnerability_ids: List[int]) -> int:
+        """append_score_history for rows just updated on an asyncpg connection, inside its transaction"""
+        month_start, name, create = history_partition(scored_at)
+        if month_start not in self.history_partitions:
+            try:
+                async with conn.transaction():
+                    await conn.execute(create)
+            except Exception as e:
+                logger.warning(f"Could not create history partition {name}: {e}")
+            self.history_partitions.add(month_start)
+        try:
+            async with conn.transaction():
+                status = await conn.execute(history_insert_query('vulnerabilities', 'id', '$1::timestamp', '$2::int[]'),
+                                            scored_at, vulnerability_ids)
+            return int(status.split()[-1])
+        except Exception as e:
+            logger.warning(f"Error appending EPSS score history: {e}")
+            return 0
+        
+    async def calculate_and_update_async(self, vulnerability_id: int, pool_size: int = 3) -> Dict[str, Any]:
+        """Score one vulnerability with concurrent factor counts on a short-lived pool.
+        
+        The pool starts with one connection and opens at most ``pool_size`` as
+        the counts need them, since every connection costs a handshake that a
+        single score barely amortizes. Repeated scoring should use the warm pool
+        of the long-lived worker (epss_worker.py --async-pool) instead.
+        """
+        pool = None
+        try:
+            pool = await self.create_async_pool(min_size=1, max_size=pool_size)
+            return await self.score_vulnerability_async(vulnerability_id, pool)
+        except Exception as e:
+            logger.error(f"Error in calculate_and_update_async: {e}")
+            return {
+                'success': False,
+                'error': str(e),
+                'message': 'Failed to calculate EPSS score'
+            }
+        finally:
+            if pool is not None:
+                await pool.close()
+            
+    def fetch_all_vulnerability_ids(self) -> List[int]:
+        """Fetch the ids of every vulnerability in the current schema"""
+        with self.conn.cursor() as cur:
+            cur.execute("SELECT id FROM vulnerabilities ORDER BY id")
+            return [row['id'] for row in cur.fetchall()]
+            
+    def iter_risk_factors(self, vulnerability_ids: Iterable[int], engine: str = 'sql', chunk_size: int = 1000,
+                          memo: Optional[FactorCountMemo] = None
+                          ) -> Iterator[Tuple[int, Optional[Dict[str, Any]], Optional[Exception]]]:
+        """Yield (vulnerability_id, risk_factors, error) for each id using the chosen engine"""
+        if engine == 'per-vuln':
+            for vulnerability_id in vulnerability_ids:
+                try:
+                    yield vulnerability_id, self.calculate_risk_factors(vulnerability_id, memo), None
+                except Exception as e:
+                    yield vulnerability_id, None, e
+            return
+        
+        if engine == 'memory':
+            # One index over the whole batch: the factor tables are read once
+            vulnerability_ids = list(vulnerability_ids)
+            chunk_size = max(len(vulnerability_ids), 1)
+        
+        for chunk in chunked(vulnerability_ids, chunk_size):
+            try:
+                portfolio = self.calculate_portfolio_risk_factors(chunk, engine=engine, memo=memo)
+            except Exception as e:
+                for vulnerability_id in chunk:
+                    yield vulnerability_id, None, e
+                continue
+            
+            for vulnerability_id in chunk:
+                if vulnerability_id in portfolio:
+                    yield vulnerability_id, portfolio[vulnerability_id], None
+                else:
+                    yield vulnerability_id, None, ValueError(f"Vulnerability {vulnerability_id} not found")
+                    
+    def calculate_batch(self, vulnerability_ids: Iterable[int], engine: str = 'sql',
+                        chunk_size: int = 1000, commit_size: int = 500,
+                        memo: Optional[FactorCountMemo] = None) -> Iterator[Dict[str, Any]]:
+        """Score many vulnerabilities over a single connection, yielding one result per id.
+        
+        The connection must already be open. With the 'sql' engine risk factors are
+        counted set-based for ``chunk_size`` vulnerabilities at a time; 'memory'
+        indexes asset mentions for the whole batch at once; 'per-vuln' runs the
+        individual count_* queries for each vulnerability. Every ``commit_size``
+        rows are scored in one vectorized pass and written with write_epss_scores
+        in one transaction; their results are yielded once it has committed.
+        Factor counts are memoized per asset set in ``memo`` (a fresh one by
+        default), so vulnerabilities sharing an asset list are counted once.
+        A failure on one vulnerability is reported in its result and does not
+        stop the batch. Every history row of the batch shares its start time.
+        """
+        if memo is None:
+            memo = FactorCountMemo()
+        run_at = datetime.now()
+        pending = []
+        for vulnerability_id, risk_factors, error in self.iter_risk_factors(vulnerability_ids, engine,
+                                                                            chunk_size, memo):
+            if error is not None:
+                yield self._batch_failure(vulnerability_id, error)
+                continue
+            pending.append((vulnerability_id, risk_factors))
+            if len(pending) >= commit_size:
+                yield from self._flush_scores(pending, run_at)
+                pending = []
+        if pending:
+            yield from self._flush_scores(pending, run_at)
+            
+    def _flush_scores(self, pending: List[Tuple[int, Dict[str, Any]]],
+                      scored_at: Optional[datetime] = None) -> Iterator[Dict[str, Any]]:
+        """Score and rank a group of risk factors in one vectorized pass, write them and yield their results"""
+        phase = self.instrumentation.phase
+        with phase('score'):
+            scores = self.score_vectors(
+                {factor: [rf[factor] for _, rf in pending] for factor in FACTOR_KEYS},
+                [rf.get('cvss_score', 0) for _, rf in pending]
+            )
+        with phase('rank'):
+            if self.ranker is None:
+                self.load_ranker()
+            scored = [(vid, float(score), self.rank_score(vid, float(score)), rf)
+                      for (vid, rf), score in zip(pending, scores)]
+        with phase('update'):
+            errors = self.write_epss_scores(scored, scored_at)
+        for vulnerability_id, epss_score, epss_percentile, risk_factors in scored:
+            error = errors.get(vulnerability_id)
+            yield self.build_result(vulnerability_id, epss_score, risk_factors, error is None, error,
+                                    epss_percentile=epss_percentile)
+            
+    def _batch_failure(self, vulnerability_id: int, error: Exception) -> Dict[str, Any]:
+        """Roll back after a failed vulnerability and build its batch result"""
+        logger.error(f"Error scoring vulnerability {vulnerability_id}: {error}")
+        if self.conn and not self.conn.closed:
+            self.conn.rollback()
+        return {
+            'success': False,
+            'vulnerability_id': vulnerability_id,
+            'error': str(error),
+            'message': 'Failed to calculate EPSS score'
+        }
+
+
+def chunked(items: Iterable[Any], size: int) -> Iterator[List[Any]]:
+    """Yield lists of at most ``size`` items"""
+    chunk = []
+    for item in items:
+        chunk.append(item)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def parse_vulnerability_ids(values: Iterable[str]) -> List[int]:
+    """Parse vulnerability ids from comma- or whitespace-separated strings"""
+    ids = []
+    for value in values:
+        for token in value.replace(',', ' ').split():
+            try:
+                ids.append(int(token))
+            except ValueError:
+                raise ValueError(f"vulnerability_id must be an integer, got {token!r}")
+    return ids
+
+
+def run_batch(calculator: EPSSCalculator, vulnerability_ids: Optional[List[int]], out=sys.stdout,
+              engine: str = 'sql', chunk_size: int = 1000, incremental: bool = False,
+              commit_size: int = 500) -> Dict[str, Any]:
+    """Run a batch and stream one JSON line per vulnerability to ``out``.
+    
+    ``vulnerability_ids`` of None scores every vulnerability in the schema, or
+    only the stale ones when ``incremental`` is set. A final
+    ``{"type": "timings_summary", ...}`` line carries the counts and the
+    per-phase latency histograms of the whole batch, and the asset-set
+    memo's hit/miss report. vulnerability_assets is synced first so the
+    batch reads assets from it rather than parsing JSON.
+    """
+    summary = {'total': 0, 'successful': 0, 'failed': 0}
+    memo = FactorCountMemo()
+    phase = calculator.instrumentation.phase
+    calculator.instrumentation.reset_histograms()
+    calculator.connect()
+    try:
+        try:
+            with phase('asset_sync'):
+                summary['asset_sync'] = calculator.sync_vulnerability_assets()
+        except Exception as e:
+            # Not fatal: assets are parsed from the JSON column instead
+            summary['asset_sync'] = {'available': True, 'error': str(e)}
+        if incremental:
+            with phase('incremental_scan'):
+                stale = set(calculator.find_stale_vulnerabilities()['vulnerability_ids'])
+            vulnerability_ids = sorted(stale if vulnerability_ids is None else stale & set(vulnerability_ids))
+        elif vulnerability_ids is None:
+            vulnerability_ids = calculator.fetch_all_vulnerability_ids()
+        for result in calculator.calculate_batch(vulnerability_ids, engine=engine, chunk_size=chunk_size,
+                                                 commit_size=commit_size, memo=memo):
+            summary['total'] += 1
+            summary['successful' if result['success'] else 'failed'] += 1
+            out.write(json.dumps(result, default=str) + "\n")
+            out.flush()
+        if summary['successful']:
+            # Ranks written during the sweep were against a moving portfolio
+            with phase('rebuild_percentiles'):
+                calculator.rebuild_percentiles()
+    finally:
+        calculator.disconnect()
+    summary['asset_set_reuse'] = memo.report()
+    summary['timings'] = calculator.instrumentation.histogram_summary()
+    # Aggregate timings close the stream; result lines carry a vulnerability_id, this one a type
+    out.write(json.dumps({'type': 'timings_summary', **summary}) + "\n")
+    out.flush()
+    logger.info(f"Batch complete: {summary['total']} processed, "
+                f"{summary['successful']} successful, {summary['failed']} failed")
+    logger.info(f"Asset-set reuse: {summary['asset_set_reuse']}")
+    return summary
 
 
 def main():
     """Main entry point for command-line execution"""
-    if len(sys.argv) < 2:
-        print("Usage: python epss_calculator.py <vulnerability_id>")
+    parser = argparse.ArgumentParser(
+        description="Calculate contextual EPSS scores for vulnerabilities",
+        usage="python epss_calculator.py <vulnerability_id> | --ids ID[,ID...] | --all | --incremental | --stdin [--engine E] [--benchmark] | --index-report | --sync-assets | --movers N"
+    )
+    parser.add_argument('vulnerability_id', nargs='?', help="score a single vulnerability")
+    parser.add_argument('--ids', action='append', default=[],
+                        help="comma-separated vulnerability ids to score in one batch")
+    parser.add_argument('--all', action='store_true', help="score every vulnerability")
+    parser.add_argument('--incremental', action='store_true',
+                        help="only rescore vulnerabilities whose inputs changed since their last score")
+    parser.add_argument('--stdin', action='store_true',
+                        help="read vulnerability ids (one or more per line) from stdin")
+    parser.add_argument('--engine', choices=ENGINES, default='sql',
+                        help="risk factor engine for batches (default: set-based sql)")
+    parser.add_argument('--benchmark', action='store_true',
+                        help="compare the sql and memory engines on the batch without writing scores")
+    parser.add_argument('--chunk-size', type=int, default=1000,
+                        help="vulnerabilities per set-based scoring chunk")
+    parser.add_argument('--commit-size', type=int, default=500,
+                        help="scores written per bulk update transaction")
+    parser.add_argument('--text-match', choices=TEXT_MATCH_MODES, default='auto',
+                        help="asset matching in the sql engine: trigram indexes when present (auto), "
+                             "also full-text indexes (fts), or plain ILIKE")
+    parser.add_argument('--index-report', action='store_true',
+                        help="report text search index coverage and query plans per factor table, then exit")
+    parser.add_argument('--sync-assets', action='store_true',
+                        help="update the vulnerability_assets table for changed vulnerabilities, then exit")
+    parser.add_argument('--movers', type=int, metavar='N',
+                        help="report the N largest score changes of the latest run from epss_score_history, then exit")
+    parser.add_argument('--model', nargs='?', const='', metavar='PATH',
+                        help="score with a trained model artifact (default: the latest from epss_model.py)")
+    parser.add_argument('--async', dest='use_async', action='store_true',
+                        help="single score: run the factor counts concurrently over a small asyncpg pool "
+                             "(for repeated scores use epss_worker.py --async-pool)")
+    args = parser.parse_args()
+    
+    if args.index_report:
+        calculator = EPSSCalculator()
+        calculator.text_match = args.text_match
+        try:
+            calculator.connect()
+            report = calculator.text_search_report()
+        except Exception as e:
+            logger.error(f"Index report failed: {e}")
+            sys.exit(1)
+        finally:
+            calculator.disconnect()
+        print(json.dumps(report, indent=2))
+        sys.exit(0)
+    
+    if args.movers is not None:
+        calculator = EPSSCalculator()
+        try:
+            calculator.connect()
+            report = calculator.score_movers(limit=args.movers)
+        except Exception as e:
+            logger.error(f"Score movers report failed: {e}")
+            sys.exit(1)
+        finally:
+            calculator.disconnect()
+        print(json.dumps(report, indent=2, default=str))
+        sys.exit(0)
+    
+    if args.sync_assets:
+        calculator = EPSSCalculator()
+        try:
+            calculator.connect()
+            summary = calculator.sync_vulnerability_assets()
+        except Exception as e:
+            logger.error(f"vulnerability_assets sync failed: {e}")
+            sys.exit(1)
+        finally:
+            calculator.disconnect()
+        print(json.dumps(summary, indent=2))
+        sys.exit(0 if summary['available'] else 1)
+    
+    batch_mode = bool(args.ids) or args.all or args.stdin or args.incremental
+    if not batch_mode and args.vulnerability_id is None:
+        parser.print_usage()
         sys.exit(1)
     
     try:
-        vulnerability_id = int(sys.argv[1])
-    except ValueError:
-        print("Error: vulnerability_id must be an integer")
+        if batch_mode:
+            ids = None if args.all or (args.incremental and not args.ids and not args.vulnerability_id) \
+                else parse_vulnerability_ids(args.ids + ([args.vulnerability_id] if args.vulnerability_id else []))
+            if args.stdin:
+                ids = (ids or []) + parse_vulnerability_ids(sys.stdin)
+        else:
+            vulnerability_id = int(args.vulnerability_id)
+    except ValueError as e:
+        print(f"Error: {e}" if batch_mode else "Error: vulnerability_id must be an integer")
         sys.exit(1)
     
     calculator = EPSSCalculator()
-    result = calculator.calculate_and_update(vulnerability_id)
+    calculator.text_match = args.text_match
+    if args.model is not None:
+        try:
+            calculator.use_model(args.model or None)
+        except Exception as e:
+            print(f"Error: could not load EPSS model: {e}")
+            sys.exit(1)
+    
+    if batch_mode and args.benchmark:
+        try:
+            calculator.connect()
+            if ids is None:
+                ids = calculator.fetch_all_vulnerability_ids()
+            report = calculator.benchmark_engines(ids)
+        except Exception as e:
+            logger.error(f"EPSS engine benchmark failed: {e}")
+            sys.exit(1)
+        finally:
+            calculator.disconnect()
+        print(json.dumps(report, indent=2))
+        sys.exit(0 if report['identical'] else 1)
+    
+    if batch_mode:
+        # One JSON document per line, one line per vulnerability
+        try:
+            summary = run_batch(calculator, ids, engine=args.engine, chunk_size=args.chunk_size,
+                                incremental=args.incremental, commit_size=args.commit_size)
+        except Exception as e:
+            logger.error(f"Batch EPSS calculation failed: {e}")
+            sys.exit(1)
+        sys.exit(0 if summary['failed'] == 0 else 1)
+    
+    if args.use_async:
+        result = asyncio.run(calculator.calculate_and_update_async(vulnerability_id))
+    else:
+        result = calculator.calculate_and_update(vulnerability_id)
     
     # Output result as JSON
     print(json.dumps(result, indent=2))
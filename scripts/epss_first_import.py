@@ -0,0 +1,253 @@
+#!/usr/bin/env python3
+"""
+FIRST.org EPSS Snapshot Importer
+Streams a daily epss_scores-YYYY-MM-DD.csv.gz snapshot from a local file and
+bulk-updates the EPSS columns of the tenant's vulnerabilities by CVE id,
+optionally blending the official score with our contextual score.
+FIRST's global percentile is kept in epss_calculation_metadata->'first_epss';
+epss_percentile stays the rank within the tenant's portfolio, as every other
+scoring path writes it
+"""
+
+import io
+import os
+import re
+import csv
+import sys
+import gzip
+import json
+import argparse
+import logging
+import time
+from typing import Dict, List, Any, Optional, Iterator, Tuple
+
+from epss_calculator import EPSSCalculator, FACTOR_KEYS
+
+logger = logging.getLogger('epss_first_import')
+
+# epss_model_version is VARCHAR(20)
+MODEL_VERSION_LENGTH = 20
+
+
+class FirstEPSSImporter:
+    """Imports FIRST.org EPSS snapshots into the vulnerabilities table"""
+
+    def __init__(self, calculator: EPSSCalculator, blend_weight: float = 1.0, batch_size: int = 5000):
+        """
+        Args:
+            calculator: Connected EPSSCalculator for the tenant schema
+            blend_weight: Share of the official score in the stored score (1.0 = official only)
+            batch_size: Updates staged per bulk write
+        """
+        if not 0.0 <= blend_weight <= 1.0:
+            raise ValueError("blend_weight must be between 0 and 1")
+        self.calculator = calculator
+        self.blend_weight = blend_weight
+        self.batch_size = batch_size
+        self.model_version: Optional[str] = None
+        self.score_date: Optional[str] = None
+
+    @property
+    def conn(self):
+        return self.calculator.conn
+
+    def load_tenant_cves(self) -> Dict[str, List[int]]:
+        """Map each CVE id in the tenant's vulnerabilities to the vulnerability ids carrying it"""
+        cves: Dict[str, List[int]] = {}
+        with self.conn.cursor() as cur:
+            cur.execute("""
+                SELECT id, UPPER(TRIM(cve_id)) AS cve_id
+                FROM vulnerabilities
+                WHERE cve_id IS NOT NULL AND TRIM(cve_id) <> ''
+            """)
+            for row in cur.fetchall():
+                cves.setdefault(row['cve_id'], []).append(row['id'])
+        return cves
+
+    def load_contextual_scores(self) -> Dict[int, float]:
+        """Recompute our contextual scores from the risk factors stored in epss_calculation_metadata"""
+        with self.conn.cursor() as cur:
+            cur.execute("""
+                SELECT id, epss_calculation_metadata->'risk_factors' AS risk_factors
+                FROM vulnerabilities
+                WHERE cve_id IS NOT NULL
+                AND epss_calculation_metadata ? 'risk_factors'
+            """)
+            rows = [row for row in cur.fetchall() if isinstance(row['risk_factors'], dict)]
+        if not rows:
+            return {}
+        scores = self.calculator.score_vectors(
+            {factor: [int(row['risk_factors'].get(factor) or 0) for row in rows] for factor in FACTOR_KEYS},
+            [float(row['risk_factors'].get('cvss_score') or 0) for row in rows]
+        )
+        return {row['id']: float(score) for row, score in zip(rows, scores)}
+
+    def read_snapshot(self, path: str) -> Iterator[Tuple[str, float, float]]:
+        """Stream (cve, epss, percentile) rows from a snapshot file, gzip or plain CSV.
+
+        The leading ``#model_version:...,score_date:...`` comment is parsed into
+        model_version and score_date.
+        """
+        opener = gzip.open if path.endswith('.gz') else open
+        with opener(path, 'rt', encoding='utf-8', newline='') as handle:
+            header = None
+            for line in handle:
+                if line.startswith('#'):
+                    for key, value in re.findall(r'(\w+):([^,\s]+)', line):
+                        if key == 'model_version':
+                            self.model_version = value
+                        elif key == 'score_date':
+                            self.score_date = value
+                    continue
+                header = next(csv.reader([line]))
+                break
+            if header is None:
+                return
+            columns = {name.strip().lower(): i for i, name in enumerate(header)}
+            for name in ('cve', 'epss', 'percentile'):
+                if name not in columns:
+                    raise ValueError(f"Snapshot is missing the {name!r} column")
+            cve_col, epss_col, pct_col = columns['cve'], columns['epss'], columns['percentile']
+            for record in csv.reader(handle):
+                if len(record) <= max(cve_col, epss_col, pct_col):
+                    continue
+                try:
+                    yield record[cve_col].strip().upper(), float(record[epss_col]), float(record[pct_col])
+                except ValueError:
+                    continue
+
+    def stored_model_version(self) -> Optional[str]:
+        """Model version stamped on imported rows"""
+        version = self.model_version or 'first-epss'
+        if self.blend_weight < 1.0:
+            version = f"{version}+ctx"
+        return version[:MODEL_VERSION_LENGTH]
+
+    def write_batch(self, updates: List[Tuple[int, float, Dict[str, Any]]]) -> int:
+        """Bulk-apply staged (vulnerability_id, score, first_epss) updates in one transaction"""
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        for vulnerability_id, score, first_epss in updates:
+            writer.writerow([vulnerability_id, score, json.dumps(first_epss, separators=(',', ':'))])
+        buffer.seek(0)
+        try:
+            with self.conn.cursor() as cur:
+                cur.execute("""
+                    CREATE TEMP TABLE IF NOT EXISTS epss_first_staging (
+                        vulnerability_id INTEGER PRIMARY KEY,
+                        epss_score DOUBLE PRECISION,
+                        first_epss JSONB
+                    )
+                """)
+                cur.execute("TRUNCATE epss_first_staging")
+                cur.copy_expert(
+                    "COPY epss_first_staging (vulnerability_id, epss_score, first_epss) "
+                    "FROM STDIN WITH (FORMAT csv)",
+                    buffer
+                )
+                cur.execute("""
+                    UPDATE vulnerabilities v
+                    SET epss_score = s.epss_score,
+                        epss_model_version = %s,
+                        epss_last_updated = NOW(),
+                        epss_calculation_metadata = COALESCE(v.epss_calculation_metadata, '{}'::jsonb)
+                            || jsonb_build_object('first_epss', s.first_epss),
+                        updated_at = NOW()
+                    FROM epss_first_staging s
+                    WHERE v.id = s.vulnerability_id
+                """, (self.stored_model_version(),))
+                updated = cur.rowcount
+            self.conn.commit()
+            return updated
+        except Exception as e:
+            logger.error(f"Error writing EPSS snapshot batch: {e}")
+            self.conn.rollback()
+            raise
+
+    def import_file(self, path: str) -> Dict[str, Any]:
+        """Stream a snapshot and update every matching vulnerability.
+
+        Memory is bounded by the tenant's CVE map and one staged batch; the
+        snapshot itself is never held in memory.
+        """
+        started = time.perf_counter()
+        cves = self.load_tenant_cves()
+        contextual = self.load_contextual_scores() if self.blend_weight < 1.0 else {}
+        logger.info(f"Importing {path} for {len(cves)} tenant CVEs")
+
+        summary = {'rows_read': 0, 'cves_matched': 0, 'vulnerabilities_updated': 0}
+        matched = set()
+        pending = []
+        for cve, official, percentile in self.read_snapshot(path):
+            summary['rows_read'] += 1
+            vulnerability_ids = cves.get(cve)
+            if not vulnerability_ids:
+                continue
+            matched.add(cve)
+            first_epss = {
+                'cve': cve,
+                'epss': official,
+                'percentile': percentile,
+                'model_version': self.model_version,
+                'score_date': self.score_date,
+                'blend_weight': self.blend_weight
+            }
+            for vulnerability_id in vulnerability_ids:
+                if self.blend_weight < 1.0 and vulnerability_id in contextual:
+                    score = self.blend_weight * official + (1 - self.blend_weight) * contextual[vulnerability_id]
+                else:
+                    score = official
+                pending.append((vulnerability_id, round(score, 4), first_epss))
+            if len(pending) >= self.batch_size:
+                summary['vulnerabilities_updated'] += self.write_batch(pending)
+                pending = []
+        if pending:
+            summary['vulnerabilities_updated'] += self.write_batch(pending)
+
+        if summary['vulnerabilities_updated']:
+            # Portfolio ranks of the new scores; FIRST's global percentile stays in first_epss
+            summary['percentiles_updated'] = self.calculator.rebuild_percentiles()
+
+        summary.update({
+            'cves_matched': len(matched),
+            'tenant_cves_not_in_snapshot': len(cves) - len(matched),
+            'model_version': self.model_version,
+            'score_date': self.score_date,
+            'blend_weight': self.blend_weight,
+            'elapsed_seconds': round(time.perf_counter() - started, 2)
+        })
+        logger.info(f"EPSS snapshot import complete: {summary}")
+        return summary
+
+
+def main():
+    """Main entry point for command-line execution"""
+    parser = argparse.ArgumentParser(description="Import a FIRST.org EPSS daily snapshot from a local file")
+    parser.add_argument('snapshot', help="path to epss_scores-YYYY-MM-DD.csv.gz (or .csv)")
+    parser.add_argument('--blend', type=float, default=1.0,
+                        help="weight of the official score when blending with the contextual score (default 1.0)")
+    parser.add_argument('--batch-size', type=int, default=5000, help="updates per bulk write")
+    args = parser.parse_args()
+
+    if not os.path.exists(args.snapshot):
+        print(f"Error: snapshot file not found: {args.snapshot}")
+        sys.exit(1)
+
+    calculator = EPSSCalculator()
+    try:
+        calculator.connect()
+        importer = FirstEPSSImporter(calculator, blend_weight=args.blend, batch_size=args.batch_size)
+        summary = importer.import_file(args.snapshot)
+        result = {'success': True, **summary}
+    except Exception as e:
+        logger.error(f"EPSS snapshot import failed: {e}")
+        result = {'success': False, 'error': str(e), 'message': 'Failed to import EPSS snapshot'}
+    finally:
+        calculator.disconnect()
+
+    print(json.dumps(result, indent=2))
+    sys.exit(0 if result['success'] else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,203 @@
+#!/usr/bin/env python3
+"""
+Instrumentation for EPSS scoring
+Records wall time, rows returned and query count per scoring phase, and keeps
+fixed-bucket latency histograms per phase for batch summaries
+"""
+
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from typing import Dict, List, Any, Optional, Iterator
+
+from psycopg2.extensions import connection as _connection
+from psycopg2.extras import RealDictCursor
+
+# Histogram bucket upper bounds in milliseconds; the last bucket is open-ended
+BUCKET_BOUNDS_MS = [0.5, 1, 2, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000]
+
+
+class PhaseStats:
+    """Totals for one phase: wall time, rows, queries and how often it ran"""
+    __slots__ = ('seconds', 'rows', 'queries', 'calls')
+
+    def __init__(self):
+        self.seconds = 0.0
+        self.rows = 0
+        self.queries = 0
+        self.calls = 0
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            'ms': round(self.seconds * 1000, 3),
+            'rows': self.rows,
+            'queries': self.queries,
+            'calls': self.calls
+        }
+
+
+class PhaseHistogram:
+    """Latency distribution of one phase across many runs, in constant memory"""
+    __slots__ = ('buckets', 'count', 'seconds', 'max_seconds', 'rows', 'queries')
+
+    def __init__(self):
+        self.buckets = [0] * (len(BUCKET_BOUNDS_MS) + 1)
+        self.count = 0
+        self.seconds = 0.0
+        self.max_seconds = 0.0
+        self.rows = 0
+        self.queries = 0
+
+    def add(self, seconds: float, rows: int, queries: int):
+        self.buckets[bisect_left(BUCKET_BOUNDS_MS, seconds * 1000)] += 1
+        self.count += 1
+        self.seconds += seconds
+        self.rows += rows
+        self.queries += queries
+        if seconds > self.max_seconds:
+            self.max_seconds = seconds
+
+    def quantile_ms(self, q: float) -> Optional[float]:
+        """Upper bound of the bucket holding the q-quantile (the max for the open bucket)"""
+        if not self.count:
+            return None
+        target = q * self.count
+        seen = 0
+        for i, n in enumerate(self.buckets):
+            seen += n
+            if seen >= target and n:
+                if i < len(BUCKET_BOUNDS_MS):
+                    return min(BUCKET_BOUNDS_MS[i], round(self.max_seconds * 1000, 3))
+                break
+        return round(self.max_seconds * 1000, 3)
+
+    def to_dict(self) -> Dict[str, Any]:
+        labels = [f"<={b:g}ms" for b in BUCKET_BOUNDS_MS] + [f">{BUCKET_BOUNDS_MS[-1]:g}ms"]
+        return {
+            'count': self.count,
+            'total_ms': round(self.seconds * 1000, 3),
+            'mean_ms': round(self.seconds * 1000 / self.count, 3) if self.count else None,
+            'p50_ms': self.quantile_ms(0.5),
+            'p90_ms': self.quantile_ms(0.9),
+            'p99_ms': self.quantile_ms(0.99),
+            'max_ms': round(self.max_seconds * 1000, 3),
+            'rows': self.rows,
+            'queries': self.queries,
+            'buckets': {label: n for label, n in zip(labels, self.buckets) if n}
+        }
+
+
+class Instrumentation:
+    """Phase timer and query counter shared by a calculator and its connection.
+
+    Phases nest: a query is charged to every phase that is open when it runs,
+    so a parent phase's numbers include its children's. ``timings`` reports
+    the phases since the last ``reset``; the histograms accumulate every
+    phase run until ``reset_histograms``.
+    """
+
+    def __init__(self):
+        self.stack: List[PhaseStats] = []
+        self.current: Dict[str, PhaseStats] = {}
+        self.histograms: Dict[str, PhaseHistogram] = {}
+        self.started = time.perf_counter()
+
+    @contextmanager
+    def phase(self, name: str, detail: Optional[str] = None) -> Iterator[PhaseStats]:
+        """Time a phase; with ``detail`` a ``name.detail`` sub-phase is recorded inside it"""
+        if detail is not None:
+            with self.phase(name), self.phase(f"{name}.{detail}") as stats:
+                yield stats
+            return
+        stats = self.current.get(name)
+        if stats is None:
+            stats = self.current[name] = PhaseStats()
+        elif any(open_stats is stats for open_stats in self.stack):
+            # Already open further up: re-entering must not count it twice
+            yield stats
+            return
+        rows, queries = stats.rows, stats.queries
+        self.stack.append(stats)
+        started = time.perf_counter()
+        try:
+            yield stats
+        finally:
+            elapsed = time.perf_counter() - started
+            self.stack.pop()
+            stats.seconds += elapsed
+            stats.calls += 1
+            histogram = self.histograms.get(name)
+            if histogram is None:
+                histogram = self.histograms[name] = PhaseHistogram()
+            histogram.add(elapsed, stats.rows - rows, stats.queries - queries)
+
+    def record_query(self, rows: int = 0):
+        """Charge one query and the rows it returned to every open phase"""
+        for stats in self.stack:
+            stats.queries += 1
+            stats.rows += rows
+
+    def record(self, name: str, seconds: float, rows: int = 0, queries: int = 1):
+        """Record a finished phase timed by the caller, e.g. one of several concurrent queries"""
+        stats = self.current.get(name)
+        if stats is None:
+            stats = self.current[name] = PhaseStats()
+        stats.seconds += seconds
+        stats.rows += rows
+        stats.queries += queries
+        stats.calls += 1
+        histogram = self.histograms.get(name)
+        if histogram is None:
+            histogram = self.histograms[name] = PhaseHistogram()
+        histogram.add(seconds, rows, queries)
+
+    def add_rows(self, rows: int):
+        """Charge rows fetched outside execute (server-side cursors) to every open phase"""
+        for stats in self.stack:
+            stats.rows += rows
+
+    def reset(self):
+        """Start a new timings block"""
+        self.current = {}
+        self.started = time.perf_counter()
+
+    def timings(self) -> Dict[str, Any]:
+        """The timings block for everything since the last reset"""
+        return {
+            'total_ms': round((time.perf_counter() - self.started) * 1000, 3),
+            'phases': {name: stats.to_dict() for name, stats in self.current.items()}
+        }
+
+    def reset_histograms(self):
+        """Start a new aggregate summary"""
+        self.histograms = {}
+
+    def histogram_summary(self) -> Dict[str, Any]:
+        """Aggregate latency histograms per phase"""
+        return {name: histogram.to_dict() for name, histogram in sorted(self.histograms.items())}
+
+
+class InstrumentedConnection(_connection):
+    """psycopg2 connection carrying the Instrumentation its cursors report to"""
+    instrumentation: Optional[Instrumentation] = None
+
+
+class InstrumentedCursor(RealDictCursor):
+    """RealDictCursor that counts its queries and returned rows"""
+
+    def execute(self, query, vars=None):
+        result = super().execute(query, vars)
+        instrumentation = getattr(self.connection, 'instrumentation', None)
+        if instrumentation is not None:
+            # Server-side cursors fetch later; their rows are added by the caller
+            instrumentation.record_query(
+                self.rowcount if self.name is None and self.description is not None and self.rowcount > 0 else 0
+            )
+        return result
+
+    def copy_expert(self, sql, file, size=8192):
+        result = super().copy_expert(sql, file, size)
+        instrumentation = getattr(self.connection, 'instrumentation', None)
+        if instrumentation is not None:
+            instrumentation.record_query()
+        return result
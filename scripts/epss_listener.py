@@ -0,0 +1,318 @@
+#!/usr/bin/env python3
+"""
+EPSS Change Listener
+Listens for the epss_changes notifications sent by the factor table triggers
+(1003-add-epss-change-notify-triggers.sql), maps each changed row to the
+vulnerabilities whose assets it mentions, and rescores them in debounced,
+coalesced micro-batches
+"""
+
+import sys
+import json
+import time
+import select
+import signal
+import argparse
+import logging
+from typing import Dict, List, Any, Optional, Set
+
+import psycopg2
+from psycopg2 import extensions
+
+from epss_asset_index import AssetMentionIndex
+from epss_calculator import EPSSCalculator, FACTOR_SOURCES, FactorCountMemo, chunked
+
+logger = logging.getLogger('epss_listener')
+
+CHANNEL = 'epss_changes'
+
+# Searched text columns per factor table, for re-reading rows whose payload was truncated
+SOURCE_COLUMNS: Dict[str, List[str]] = {}
+for _, _table, _columns, _ in FACTOR_SOURCES:
+    SOURCE_COLUMNS.setdefault(_table, [])
+    SOURCE_COLUMNS[_table] += [c for c in _columns if c not in SOURCE_COLUMNS[_table]]
+
+
+class TenantAssets:
+    """One tenant's calculator and its asset -> vulnerability ids mapping"""
+
+    def __init__(self, calculator: EPSSCalculator):
+        self.calculator = calculator
+        self.index: Optional[AssetMentionIndex] = None
+        self.vulnerabilities: Dict[int, Set[int]] = {}
+        self.loaded_at = 0.0
+        self.memo = FactorCountMemo()
+
+    def load(self):
+        """(Re)build the mapping from vulnerability_assets, or the assets JSON when it is absent"""
+        calculator = self.calculator
+        try:
+            calculator.sync_vulnerability_assets()
+        except Exception as e:
+            logger.warning(f"vulnerability_assets sync failed, parsing assets JSON: {e}")
+        if calculator.asset_table_synced:
+            assets_by_vulnerability = calculator.load_vulnerability_assets()
+        else:
+            with calculator.conn.cursor() as cur:
+                cur.execute("SELECT id, assets FROM vulnerabilities WHERE assets IS NOT NULL")
+                assets_by_vulnerability = {row['id']: calculator.extract_assets(row['assets'])
+                                           for row in cur.fetchall()}
+        calculator.conn.rollback()
+
+        self.index = AssetMentionIndex(a for assets in assets_by_vulnerability.values() for a in assets)
+        self.vulnerabilities = {}
+        for vid, assets in assets_by_vulnerability.items():
+            for asset in assets:
+                self.vulnerabilities.setdefault(self.index.asset_ids[asset], set()).add(vid)
+        self.loaded_at = time.monotonic()
+        self.memo = FactorCountMemo()
+        logger.info(f"{calculator.schema or 'default'}: {len(self.index.assets)} assets across "
+                    f"{len(assets_by_vulnerability)} vulnerabilities")
+
+    def affected(self, texts: List[str]) -> Set[int]:
+        """Vulnerabilities with an asset mentioned in any of the texts"""
+        found = set()
+        for text in texts:
+            for asset_id in self.index.match(text):
+                found |= self.vulnerabilities.get(asset_id, set())
+        return found
+
+
+class EPSSListener:
+    """Rescores vulnerabilities shortly after the records around their assets change.
+
+    Events are coalesced per tenant: ids accumulate until no event has
+    arrived for ``debounce`` seconds, or ``max_wait`` seconds after the first
+    one, and are then rescored ``batch_size`` at a time with calculate_batch.
+    """
+
+    def __init__(self, db_config: Optional[Dict[str, str]] = None, schemas: Optional[Set[str]] = None,
+                 debounce: float = 2.0, max_wait: float = 10.0, batch_size: int = 200,
+                 refresh_interval: float = 300, engine: str = 'sql', model: Optional[str] = None,
+                 out=sys.stdout):
+        """
+        Args:
+            db_config: Connection settings (default: the calculator's environment variables)
+            schemas: Tenant schemas to handle (None = every schema that notifies)
+            debounce: Quiet seconds after the last event before a tenant is rescored
+            max_wait: Longest a pending event waits while events keep arriving
+            batch_size: Vulnerabilities per rescoring transaction
+            refresh_interval: Seconds between reloads of the asset mapping
+            engine: Risk factor engine passed to calculate_batch
+            model: Trained model artifact to score with ('' = the latest; None = weighted formula)
+            out: Stream receiving one JSON line per rescored micro-batch
+        """
+        self.db_config = db_config or EPSSCalculator().db_config
+        self.schemas = schemas
+        self.debounce = debounce
+        self.max_wait = max_wait
+        self.batch_size = max(1, batch_size)
+        self.refresh_interval = refresh_interval
+        self.engine = engine
+        self.model = model
+        self.out = out
+        self.conn = None
+        self.tenants: Dict[str, TenantAssets] = {}
+        # Per schema: vulnerability ids awaiting rescoring and when their first/last event arrived
+        self.pending: Dict[str, Set[int]] = {}
+        self.first_event: Dict[str, float] = {}
+        self.last_event: Dict[str, float] = {}
+        self.stopping = False
+        self.stats = {'events': 0, 'events_ignored': 0, 'vulnerabilities_queued': 0,
+                      'rescored': 0, 'failed': 0, 'batches': 0}
+
+    def listen(self):
+        """Open the notification connection and LISTEN on the channel"""
+        self.conn = psycopg2.connect(**self.db_config)
+        self.conn.set_isolation_level(extensions.ISOLATION_LEVEL_AUTOCOMMIT)
+        with self.conn.cursor() as cur:
+            cur.execute(f"LISTEN {CHANNEL}")
+        logger.info(f"Listening on {CHANNEL}")
+
+    def tenant(self, schema: str) -> TenantAssets:
+        """The tenant's calculator and asset mapping, connected and loaded on first use"""
+        tenant = self.tenants.get(schema)
+        if tenant is None:
+            calculator = EPSSCalculator(self.db_config, schema=schema)
+            if self.model is not None:
+                calculator.use_model(self.model or None)
+            calculator.connect()
+            tenant = self.tenants[schema] = TenantAssets(calculator)
+            tenant.load()
+        elif time.monotonic() - tenant.loaded_at > self.refresh_interval:
+            tenant.load()
+        return tenant
+
+    def row_texts(self, tenant: TenantAssets, table: str, row_id: Any) -> List[str]:
+        """Current searched column values of a row whose payload was too large to carry them"""
+        columns = SOURCE_COLUMNS.get(table)
+        if not columns or row_id is None:
+            return []
+        conn = tenant.calculator.conn
+        try:
+            with conn.cursor() as cur:
+                cur.execute(f"SELECT {', '.join(f'{c}::text AS c{i}' for i, c in enumerate(columns))} "
+                            f"FROM {table} WHERE id = %s", (row_id,))
+                row = cur.fetchone()
+            return [v for v in (row or {}).values() if v is not None]
+        finally:
+            conn.rollback()
+
+    def handle(self, payload: str):
+        """Map one notification to the vulnerabilities it affects and queue them"""
+        self.stats['events'] += 1
+        try:
+            event = json.loads(payload)
+            schema, table = event['schema'], event['table']
+        except (ValueError, KeyError, TypeError) as e:
+            logger.warning(f"Ignoring malformed notification {payload[:200]!r}: {e}")
+            self.stats['events_ignored'] += 1
+            return
+        if table not in SOURCE_COLUMNS or (self.schemas is not None and schema not in self.schemas):
+            self.stats['events_ignored'] += 1
+            return
+
+        tenant = self.tenant(schema)
+        texts = list(event.get('texts') or [])
+        if event.get('truncated'):
+            if event.get('op') == 'DELETE':
+                logger.warning(f"Deleted {schema}.{table} row {event.get('id')} was too large to map; "
+                               f"it is picked up by the next scheduled sweep")
+            else:
+                texts = self.row_texts(tenant, table, event.get('id'))
+        affected = tenant.affected(texts)
+        if not affected:
+            self.stats['events_ignored'] += 1
+            return
+
+        now = time.monotonic()
+        pending = self.pending.setdefault(schema, set())
+        before = len(pending)
+        pending |= affected
+        self.stats['vulnerabilities_queued'] += len(pending) - before
+        self.first_event.setdefault(schema, now)
+        self.last_event[schema] = now
+
+    def due(self, schema: str, now: float) -> bool:
+        """Whether a tenant's pending events have settled (or waited long enough)"""
+        return now - self.last_event[schema] >= self.debounce or now - self.first_event[schema] >= self.max_wait
+
+    def flush(self, schema: str):
+        """Rescore a tenant's pending vulnerabilities in micro-batches"""
+        ids = sorted(self.pending.pop(schema, set()))
+        self.first_event.pop(schema, None)
+        self.last_event.pop(schema, None)
+        if not ids:
+            return
+        # Reconnects and reloads when the connections were dropped since the events arrived
+        tenant = self.tenant(schema)
+        calculator = tenant.calculator
+        for batch in chunked(ids, self.batch_size):
+            started = time.perf_counter()
+            results = list(calculator.calculate_batch(batch, engine=self.engine, chunk_size=len(batch),
+                                                      commit_size=len(batch), memo=tenant.memo))
+            succeeded = sum(1 for r in results if r['success'])
+            self.stats['rescored'] += succeeded
+            self.stats['failed'] += len(results) - succeeded
+            self.stats['batches'] += 1
+            self.emit({
+                'type': 'rescored',
+                'schema': schema,
+                'vulnerabilities': len(batch),
+                'successful': succeeded,
+                'failed': len(results) - succeeded,
+                'elapsed_ms': round((time.perf_counter() - started) * 1000, 2)
+            })
+        # Factor counts changed underneath the memo
+        tenant.memo = FactorCountMemo()
+
+    def emit(self, message: Dict[str, Any]):
+        if self.out is not None:
+            self.out.write(json.dumps(message, default=str) + "\n")
+            self.out.flush()
+
+    def next_timeout(self, now: float) -> float:
+        """Seconds until the earliest pending tenant becomes due (1s when idle)"""
+        timeouts = [min(self.last_event[s] + self.debounce, self.first_event[s] + self.max_wait) - now
+                    for s in self.pending]
+        return max(0.0, min(timeouts, default=1.0))
+
+    def poll(self):
+        """Wait for notifications until the next flush is due, and handle them"""
+        if select.select([self.conn], [], [], self.next_timeout(time.monotonic()))[0]:
+            self.conn.poll()
+            while self.conn.notifies:
+                notification = self.conn.notifies.pop(0)
+                try:
+                    self.handle(notification.payload)
+                except Exception as e:
+                    logger.error(f"Error handling notification: {e}")
+
+    def run(self):
+        """Serve until stopped; pending events are flushed before exiting"""
+        self.listen()
+        self.emit({'type': 'ready', 'channel': CHANNEL})
+        while not self.stopping:
+            try:
+                self.poll()
+                now = time.monotonic()
+                for schema in [s for s in self.pending if self.due(s, now)]:
+                    self.flush(schema)
+            except (psycopg2.OperationalError, psycopg2.InterfaceError) as e:
+                # Notifications sent while disconnected are lost; the scheduled sweep covers them
+                logger.warning(f"Listener connection lost, reconnecting: {e}")
+                self.close_connections()
+                time.sleep(1)
+                self.listen()
+        for schema in list(self.pending):
+            self.flush(schema)
+        self.close_connections()
+        self.emit({'type': 'shutdown', **self.stats})
+
+    def close_connections(self):
+        """Close the notification connection and every tenant calculator"""
+        if self.conn is not None and not self.conn.closed:
+            self.conn.close()
+        for tenant in self.tenants.values():
+            tenant.calculator.disconnect()
+        self.tenants = {}
+
+
+def main():
+    """Main entry point for the listener"""
+    parser = argparse.ArgumentParser(description="Rescore EPSS when incidents, findings, risks or third-party "
+                                                 "assessments change (LISTEN/NOTIFY)")
+    parser.add_argument('--schemas', action='append', default=[],
+                        help="comma-separated tenant schemas to handle (default: all)")
+    parser.add_argument('--debounce', type=float, default=2.0,
+                        help="quiet seconds after the last change before rescoring")
+    parser.add_argument('--max-wait', type=float, default=10.0,
+                        help="longest a change waits while changes keep arriving")
+    parser.add_argument('--batch-size', type=int, default=200, help="vulnerabilities per rescoring transaction")
+    parser.add_argument('--refresh-interval', type=float, default=300,
+                        help="seconds between reloads of the asset to vulnerability mapping")
+    parser.add_argument('--model', nargs='?', const='', metavar='PATH',
+                        help="score with a trained model artifact (default: the latest from epss_model.py)")
+    args = parser.parse_args()
+
+    schemas = {s.strip() for value in args.schemas for s in value.split(',') if s.strip()} or None
+    listener = EPSSListener(schemas=schemas, debounce=args.debounce, max_wait=args.max_wait,
+                            batch_size=args.batch_size, refresh_interval=args.refresh_interval,
+                            model=args.model)
+
+    def on_signal(signum, frame):
+        logger.info(f"Received signal {signum}, flushing pending changes")
+        listener.stopping = True
+
+    signal.signal(signal.SIGTERM, on_signal)
+    signal.signal(signal.SIGINT, on_signal)
+
+    try:
+        listener.run()
+    except Exception as e:
+        logger.error(f"EPSS listener failed: {e}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
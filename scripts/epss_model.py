@@ -0,0 +1,218 @@
+#!/usr/bin/env python3
+"""
+Trained EPSS Model
+Optional learned scoring for the EPSS calculator: a RandomForestRegressor and
+StandardScaler fitted on historical factor vectors (the five factor counts
+plus CVSS) against a label, persisted as a versioned joblib artifact and
+loaded once per process for vectorized batch prediction
+"""
+
+import os
+import sys
+import json
+import hashlib
+import argparse
+import threading
+import logging
+from datetime import datetime
+from typing import Dict, List, Any, Optional
+
+import numpy as np
+
+logger = logging.getLogger('epss_model')
+
+# Model inputs, in column order
+FEATURES = ['incidents_count', 'vulnerabilities_count', 'findings_count',
+            'risks_count', 'third_party_gaps_count', 'cvss_score']
+
+# Where artifacts are written and looked up; LATEST names the current one
+MODEL_DIR = os.getenv('EPSS_MODEL_DIR', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'models'))
+LATEST_FILE = 'LATEST'
+
+# epss_model_version is VARCHAR(20)
+MODEL_VERSION_LENGTH = 20
+
+# Label expressions selectable by name; any other label must be a vulnerabilities column
+LABELS = {
+    'first_epss': "(v.epss_calculation_metadata->'first_epss'->>'epss')::float8",
+}
+
+_loaded: Dict[str, 'EPSSModel'] = {}
+_load_lock = threading.Lock()
+
+
+class EPSSModel:
+    """A fitted scaler and regressor plus the metadata stamped on scores"""
+
+    def __init__(self, model, scaler, version: str, features: Optional[List[str]] = None,
+                 metadata: Optional[Dict[str, Any]] = None):
+        self.model = model
+        self.scaler = scaler
+        self.version = version
+        self.features = features or list(FEATURES)
+        self.metadata = metadata or {}
+
+    def predict(self, factor_counts: Dict[str, Any], cvss_scores: Any) -> np.ndarray:
+        """Scores for N vulnerabilities from FACTOR_KEYS -> length-N arrays and N CVSS scores, clipped to 0..1"""
+        columns = {**factor_counts, 'cvss_score': cvss_scores}
+        matrix = np.column_stack([np.asarray(columns[f], dtype=np.float64) for f in self.features])
+        if matrix.shape[0] == 0:
+            return np.zeros(0)
+        return np.clip(self.model.predict(self.scaler.transform(matrix)), 0.0, 1.0)
+
+    @classmethod
+    def train(cls, matrix: np.ndarray, labels: np.ndarray, label: str, n_estimators: int = 200,
+              random_state: int = 42) -> 'EPSSModel':
+        """Fit on an (N, len(FEATURES)) matrix; a 20% holdout is scored when there are enough rows"""
+        from sklearn.ensemble import RandomForestRegressor
+        from sklearn.metrics import mean_absolute_error, r2_score
+        from sklearn.model_selection import train_test_split
+        from sklearn.preprocessing import StandardScaler
+
+        matrix = np.asarray(matrix, dtype=np.float64)
+        labels = np.asarray(labels, dtype=np.float64)
+        metrics: Dict[str, Any] = {}
+        if len(labels) >= 20:
+            train_x, test_x, train_y, test_y = train_test_split(matrix, labels, test_size=0.2,
+                                                                random_state=random_state)
+        else:
+            train_x, train_y, test_x, test_y = matrix, labels, None, None
+
+        scaler = StandardScaler().fit(train_x)
+        model = RandomForestRegressor(n_estimators=n_estimators, random_state=random_state, n_jobs=-1)
+        model.fit(scaler.transform(train_x), train_y)
+        if test_x is not None:
+            predicted = np.clip(model.predict(scaler.transform(test_x)), 0.0, 1.0)
+            metrics = {'r2': round(float(r2_score(test_y, predicted)), 4),
+                       'mae': round(float(mean_absolute_error(test_y, predicted)), 4),
+                       'holdout_rows': int(len(test_y))}
+
+        trained_at = datetime.now()
+        digest = hashlib.sha1(matrix.tobytes() + labels.tobytes() + label.encode('utf-8')).hexdigest()
+        version = f"rf-{trained_at:%Y%m%d}-{digest[:6]}"[:MODEL_VERSION_LENGTH]
+        return cls(model, scaler, version, list(FEATURES), {
+            'label': label,
+            'trained_at': trained_at.isoformat(),
+            'training_rows': int(len(labels)),
+            'n_estimators': n_estimators,
+            'metrics': metrics,
+            'feature_importances': dict(zip(FEATURES, (round(float(v), 4) for v in model.feature_importances_)))
+        })
+
+    def save(self, directory: str = MODEL_DIR, make_latest: bool = True) -> str:
+        """Write the artifact as epss-model-<version>.joblib and optionally point LATEST at it"""
+        import joblib
+
+        os.makedirs(directory, exist_ok=True)
+        path = os.path.join(directory, f"epss-model-{self.version}.joblib")
+        joblib.dump({'version': self.version, 'model': self.model, 'scaler': self.scaler,
+                     'features': self.features, 'metadata': self.metadata}, path)
+        if make_latest:
+            tmp = os.path.join(directory, f"{LATEST_FILE}.tmp")
+            with open(tmp, 'w') as f:
+                f.write(os.path.basename(path) + "\n")
+            os.replace(tmp, os.path.join(directory, LATEST_FILE))
+        return path
+
+
+def resolve_model_path(path: Optional[str] = None) -> str:
+    """The artifact to load: ``path``, $EPSS_MODEL_PATH, or the one LATEST names in MODEL_DIR"""
+    path = path or os.getenv('EPSS_MODEL_PATH')
+    if path:
+        return os.path.abspath(path)
+    latest = os.path.join(MODEL_DIR, LATEST_FILE)
+    if not os.path.exists(latest):
+        raise FileNotFoundError(f"No EPSS model artifact: {latest} not found (train one with epss_model.py)")
+    with open(latest) as f:
+        return os.path.join(MODEL_DIR, f.read().strip())
+
+
+def load_model(path: Optional[str] = None) -> EPSSModel:
+    """Load an artifact, at most once per process per path"""
+    path = resolve_model_path(path)
+    with _load_lock:
+        model = _loaded.get(path)
+        if model is None:
+            import joblib
+
+            artifact = joblib.load(path)
+            model = _loaded[path] = EPSSModel(artifact['model'], artifact['scaler'], artifact['version'],
+                                              artifact.get('features'), artifact.get('metadata'))
+            logger.info(f"EPSS model {model.version} loaded from {path}")
+        return model
+
+
+def load_training_data(calculator, label: str, source: str = 'metadata') -> Dict[str, np.ndarray]:
+    """Feature matrix and labels from the stored risk factors (or epss_score_history) of labelled vulnerabilities"""
+    if label in LABELS:
+        label_sql = LABELS[label]
+    elif label in calculator.catalog.columns(calculator.conn, 'vulnerabilities'):
+        label_sql = f"v.{label}"
+    else:
+        raise ValueError(f"Unknown label {label!r}: use {', '.join(LABELS)} or a vulnerabilities column")
+
+    counts = FEATURES[:-1]
+    with calculator.conn.cursor() as cur:
+        if source == 'history':
+            # Every run's vector, each labelled with the vulnerability's current label
+            select = ", ".join(f"h.{c}" for c in counts)
+            cur.execute(f"""
+                SELECT {select}, v.cvss_score, {label_sql} AS label
+                FROM epss_score_history h
+                JOIN vulnerabilities v ON v.id = h.vulnerability_id
+                WHERE {label_sql} IS NOT NULL
+            """)
+        else:
+            select = ", ".join(f"(v.epss_calculation_metadata->'risk_factors'->>'{c}')::float8 AS {c}"
+                               for c in counts)
+            cur.execute(f"""
+                SELECT {select}, v.cvss_score, {label_sql} AS label
+                FROM vulnerabilities v
+                WHERE v.epss_calculation_metadata ? 'risk_factors'
+                AND {label_sql} IS NOT NULL
+            """)
+        rows = cur.fetchall()
+    calculator.conn.rollback()
+
+    matrix = np.array([[float(row[c] or 0) for c in counts] + [float(row['cvss_score'] or 0)] for row in rows],
+                      dtype=np.float64).reshape(-1, len(FEATURES))
+    labels = np.array([float(row['label']) for row in rows], dtype=np.float64)
+    return {'matrix': matrix, 'labels': labels}
+
+
+def main():
+    """Train a model from the tenant's scored vulnerabilities and save it as the latest artifact"""
+    parser = argparse.ArgumentParser(description="Train the learned EPSS model and save a versioned artifact")
+    parser.add_argument('--label', default='first_epss',
+                        help="training target: first_epss (imported FIRST.org score) or a numeric/boolean "
+                             "vulnerabilities column")
+    parser.add_argument('--source', choices=['metadata', 'history'], default='metadata',
+                        help="factor vectors from the last stored risk factors or from epss_score_history")
+    parser.add_argument('--n-estimators', type=int, default=200)
+    parser.add_argument('--model-dir', default=MODEL_DIR, help="directory for the artifact and LATEST pointer")
+    parser.add_argument('--no-latest', action='store_true', help="do not make the new artifact the default")
+    args = parser.parse_args()
+
+    from epss_calculator import EPSSCalculator
+
+    calculator = EPSSCalculator()
+    try:
+        calculator.connect()
+        data = load_training_data(calculator, args.label, args.source)
+        if len(data['labels']) < 2:
+            raise ValueError(f"Only {len(data['labels'])} labelled vulnerabilities; need at least 2 to train")
+        model = EPSSModel.train(data['matrix'], data['labels'], args.label, n_estimators=args.n_estimators)
+        path = model.save(args.model_dir, make_latest=not args.no_latest)
+        result = {'success': True, 'version': model.version, 'path': path, **model.metadata}
+    except Exception as e:
+        logger.error(f"EPSS model training failed: {e}")
+        result = {'success': False, 'error': str(e)}
+    finally:
+        calculator.disconnect()
+
+    print(json.dumps(result, indent=2))
+    sys.exit(0 if result['success'] else 1)
+
+
+if __name__ == "__main__":
+    main()
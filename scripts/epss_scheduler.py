@@ -0,0 +1,361 @@
+#!/usr/bin/env python3
+"""
+EPSS Recompute Scheduler
+Refreshes stale EPSS scores riskiest-first instead of sweeping everything at
+once: a priority queue ordered by staleness x severity x CVSS is drained in
+small batches under a queries-per-second and concurrency budget, with a state
+file so an interrupted run resumes where it stopped
+"""
+
+import os
+import sys
+import json
+import heapq
+import signal
+import argparse
+import threading
+import logging
+import time
+from datetime import datetime
+from typing import Dict, List, Any, Optional, Callable, Tuple
+
+from epss_calculator import EPSSCalculator, ENGINES, FactorCountMemo
+
+logger = logging.getLogger('epss_scheduler')
+
+# Priority multiplier per severity; unknown severities count as Low
+SEVERITY_WEIGHTS = {'critical': 4.0, 'high': 3.0, 'medium': 2.0, 'low': 1.0}
+
+# CVSS assumed when a vulnerability has none
+DEFAULT_CVSS = 5.0
+
+# Candidates: never scored, or scored before the run's cutoff
+CANDIDATES_QUERY = """
+    SELECT id, severity, cvss_score, epss_last_updated IS NULL AS never_scored,
+           EXTRACT(EPOCH FROM (NOW() - COALESCE(epss_last_updated, created_at, NOW()))) / 3600.0
+               AS staleness_hours
+    FROM vulnerabilities
+    WHERE epss_last_updated IS NULL OR epss_last_updated < %s
+"""
+
+
+def priority(row: Dict[str, Any], never_scored_hours: float) -> float:
+    """Staleness in hours x severity weight x CVSS; never-scored rows are at least ``never_scored_hours`` stale"""
+    staleness = float(row['staleness_hours'] or 0)
+    if row['never_scored']:
+        staleness = max(staleness, never_scored_hours)
+    severity = SEVERITY_WEIGHTS.get(str(row.get('severity') or '').lower(), 1.0)
+    cvss = float(row['cvss_score']) if row.get('cvss_score') is not None else DEFAULT_CVSS
+    # A CVSS of 0 should still let very stale rows through eventually
+    return staleness * severity * max(cvss, 0.1)
+
+
+class QueryBudget:
+    """Shared queries-per-second budget: batches pay for the queries they ran
+    and later batches wait until the debt is paid (0 = unlimited)"""
+
+    def __init__(self, qps: float = 0):
+        self.qps = qps
+        self.available_at = time.monotonic()
+        self.spent = 0
+        self.lock = threading.Lock()
+
+    def wait(self, stop: threading.Event):
+        """Block until the budget allows another batch, or the scheduler stops"""
+        if not self.qps:
+            return
+        with self.lock:
+            delay = self.available_at - time.monotonic()
+        if delay > 0:
+            stop.wait(delay)
+
+    def spend(self, queries: int):
+        """Charge the queries a batch ran"""
+        with self.lock:
+            self.spent += queries
+            if self.qps:
+                self.available_at = max(self.available_at, time.monotonic()) + queries / self.qps
+
+
+class SchedulerState:
+    """Progress of a run in a JSON file, rewritten atomically after every batch"""
+
+    def __init__(self, path: Optional[str]):
+        self.path = path
+        self.data: Dict[str, Any] = {}
+        self.lock = threading.Lock()
+
+    def load(self) -> Optional[Dict[str, Any]]:
+        """The unfinished run recorded in the file, if any"""
+        if not self.path or not os.path.exists(self.path):
+            return None
+        try:
+            with open(self.path) as f:
+                data = json.load(f)
+        except (OSError, ValueError) as e:
+            logger.warning(f"Ignoring unreadable scheduler state {self.path}: {e}")
+            return None
+        return None if data.get('finished') else data
+
+    def save(self, **updates):
+        with self.lock:
+            self.data.update(updates, updated_at=datetime.now().isoformat())
+            if not self.path:
+                return
+            tmp = f"{self.path}.tmp"
+            with open(tmp, 'w') as f:
+                json.dump(self.data, f, default=str)
+            os.replace(tmp, self.path)
+
+
+class EPSSScheduler:
+    """Drains a staleness-priority queue of vulnerabilities through EPSSCalculator batches.
+
+    ``concurrency`` workers each hold one connection; ``qps`` caps the
+    queries all of them issue per second, measured by the calculators'
+    instrumentation. Scores are committed per batch, so stopping loses at
+    most the batches in flight, and a resumed run keeps the original cutoff:
+    vulnerabilities refreshed before the interruption are no longer stale.
+    Percentiles are re-ranked across the portfolio once the queue drains.
+    """
+
+    def __init__(self, calculator_factory: Callable[[], EPSSCalculator], concurrency: int = 1,
+                 qps: float = 0, batch_size: int = 50, engine: str = 'sql', min_age_hours: float = 24,
+                 never_scored_hours: float = 24 * 30, limit: Optional[int] = None,
+                 state_path: Optional[str] = None, out=None):
+        """
+        Args:
+            calculator_factory: Builds an unconnected EPSSCalculator per worker
+            concurrency: Workers (database connections) scoring at once
+            qps: Queries per second across all workers (0 = unlimited)
+            batch_size: Vulnerabilities scored and committed together
+            engine: Risk factor engine passed to calculate_batch
+            min_age_hours: Scores younger than this are not refreshed
+            never_scored_hours: Staleness assumed for never-scored vulnerabilities
+            limit: Refresh at most this many of the riskiest stale vulnerabilities
+            state_path: JSON file recording progress for resuming
+            out: Stream receiving one JSON line per scored vulnerability
+        """
+        self.calculator_factory = calculator_factory
+        self.concurrency = max(1, concurrency)
+        self.budget = QueryBudget(qps)
+        self.batch_size = max(1, batch_size)
+        self.engine = engine
+        self.min_age_hours = min_age_hours
+        self.never_scored_hours = never_scored_hours
+        self.limit = limit
+        self.state = SchedulerState(state_path)
+        self.out = out
+        self.stop = threading.Event()
+        self.lock = threading.Lock()
+        self.queue: List[Tuple[float, int]] = []
+        self.counts = {'scored': 0, 'failed': 0}
+        self.failed_ids: List[int] = []
+
+    def build_queue(self, calculator: EPSSCalculator, cutoff: datetime, skip: set) -> int:
+        """Load the stale vulnerabilities into the priority queue, riskiest first"""
+        with calculator.conn.cursor() as cur:
+            cur.execute(CANDIDATES_QUERY, (cutoff,))
+            rows = cur.fetchall()
+        calculator.conn.rollback()
+        queue = [(-priority(row, self.never_scored_hours), row['id']) for row in rows if row['id'] not in skip]
+        if self.limit is not None:
+            queue = heapq.nsmallest(self.limit, queue)
+        heapq.heapify(queue)
+        self.queue = queue
+        return len(queue)
+
+    def next_batch(self) -> List[int]:
+        """Pop the next ``batch_size`` highest-priority ids"""
+        with self.lock:
+            return [heapq.heappop(self.queue)[1] for _ in range(min(self.batch_size, len(self.queue)))]
+
+    def record(self, results: List[Dict[str, Any]]):
+        """Count a finished batch, write its result lines and checkpoint"""
+        with self.lock:
+            for result in results:
+                if result['success']:
+                    self.counts['scored'] += 1
+                else:
+                    self.counts['failed'] += 1
+                    self.failed_ids.append(result['vulnerability_id'])
+                if self.out is not None:
+                    self.out.write(json.dumps(result, default=str) + "\n")
+            if self.out is not None:
+                self.out.flush()
+            remaining = len(self.queue)
+        self.state.save(scored=self.counts['scored'], failed_ids=list(self.failed_ids), remaining=remaining,
+                        queries=self.budget.spent)
+
+    def worker(self, calculator: EPSSCalculator):
+        """Score batches on one connection until the queue is empty or the run stops"""
+        memo = FactorCountMemo()
+        phase = calculator.instrumentation.phase
+        try:
+            while not self.stop.is_set():
+                self.budget.wait(self.stop)
+                if self.stop.is_set():
+                    break
+                batch = self.next_batch()
+                if not batch:
+                    break
+                with phase('scheduled_batch') as stats:
+                    queries = stats.queries
+                    results = list(calculator.calculate_batch(batch, engine=self.engine,
+                                                              chunk_size=len(batch), commit_size=len(batch),
+                                                              memo=memo))
+                self.budget.spend(stats.queries - queries)
+                self.record(results)
+        except Exception as e:
+            logger.error(f"Scheduler worker failed: {e}")
+            self.stop.set()
+        finally:
+            calculator.disconnect()
+
+    def rebuild_percentiles(self) -> Dict[str, Any]:
+        """Re-rank the whole portfolio once on a fresh connection, after the workers have stopped"""
+        calculator = self.calculator_factory()
+        try:
+            calculator.connect()
+            return {'updated': calculator.rebuild_percentiles()}
+        except Exception as e:
+            logger.error(f"Percentile rebuild after scheduled run failed: {e}")
+            return {'error': str(e)}
+        finally:
+            calculator.disconnect()
+
+    def run(self) -> Dict[str, Any]:
+        """Build or resume the queue and drain it; returns the run summary"""
+        started = time.perf_counter()
+        resumed = self.state.load()
+        if resumed:
+            cutoff = datetime.fromisoformat(resumed['cutoff'])
+            self.failed_ids = list(resumed.get('failed_ids', []))
+            self.counts['scored'] = resumed.get('scored', 0)
+            self.counts['failed'] = len(self.failed_ids)
+            logger.info(f"Resuming run started {resumed.get('started_at')} (cutoff {cutoff.isoformat()})")
+            self.state.data = dict(resumed)
+
+        calculators = [self.calculator_factory() for _ in range(self.concurrency)]
+        for calculator in calculators:
+            calculator.connect()
+        try:
+            if not resumed:
+                # On the database clock, like the epss_last_updated it is compared with
+                with calculators[0].conn.cursor() as cur:
+                    cur.execute("SELECT (NOW() - %s * INTERVAL '1 hour')::timestamp AS cutoff",
+                                (self.min_age_hours,))
+                    cutoff = cur.fetchone()['cutoff']
+                self.state.data = {'started_at': datetime.now().isoformat(), 'cutoff': cutoff.isoformat()}
+            try:
+                sync = calculators[0].sync_vulnerability_assets()
+                for calculator in calculators[1:]:
+                    calculator.asset_table_synced = calculators[0].asset_table_synced
+            except Exception as e:
+                sync = {'available': True, 'error': str(e)}
+            queued = self.build_queue(calculators[0], cutoff, set(self.failed_ids))
+        except Exception:
+            for calculator in calculators:
+                calculator.disconnect()
+            raise
+        logger.info(f"{queued} stale vulnerabilities queued; {self.concurrency} workers, "
+                    f"{self.budget.qps or 'unlimited'} queries/s")
+        self.state.save(queued=queued, remaining=queued, finished=False)
+
+        threads = [threading.Thread(target=self.worker, args=(calculator,), name=f"epss-scheduler-{i}")
+                   for i, calculator in enumerate(calculators)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            # Joined with a timeout so the main thread keeps handling signals
+            while thread.is_alive():
+                thread.join(0.5)
+
+        remaining = len(self.queue)
+        interrupted = self.stop.is_set() and remaining > 0
+        percentiles = None
+        if not interrupted and self.counts['scored']:
+            # Each worker ranked against its own snapshot of a moving portfolio; counts['scored']
+            # includes an interrupted earlier run, whose ranks were never rebuilt either
+            percentiles = self.rebuild_percentiles()
+        # A failed rebuild leaves the run unfinished so that resuming retries it
+        self.state.save(remaining=remaining, finished=not interrupted and 'error' not in (percentiles or {}))
+        elapsed = time.perf_counter() - started
+        return {
+            'cutoff': cutoff.isoformat(),
+            'resumed': bool(resumed),
+            'queued': queued,
+            'scored': self.counts['scored'],
+            'failed': self.counts['failed'],
+            'remaining': remaining,
+            'interrupted': interrupted,
+            'asset_sync': sync,
+            'percentiles': percentiles,
+            'queries': self.budget.spent,
+            'elapsed_seconds': round(elapsed, 2),
+            'queries_per_second': round(self.budget.spent / elapsed, 2) if elapsed else None
+        }
+
+
+def main():
+    """Main entry point for command-line execution"""
+    parser = argparse.ArgumentParser(description="Refresh stale EPSS scores riskiest-first under a database load budget")
+    parser.add_argument('--schema', help="tenant schema to score (default: the connection's search_path)")
+    parser.add_argument('--qps', type=float, default=20,
+                        help="queries per second across all workers (0 = unlimited)")
+    parser.add_argument('--concurrency', type=int, default=1, help="workers (database connections) at once")
+    parser.add_argument('--batch-size', type=int, default=50, help="vulnerabilities scored per transaction")
+    parser.add_argument('--engine', choices=ENGINES, default='sql', help="risk factor engine")
+    parser.add_argument('--min-age-hours', type=float, default=24,
+                        help="only refresh scores older than this")
+    parser.add_argument('--never-scored-hours', type=float, default=24 * 30,
+                        help="staleness assumed for never-scored vulnerabilities")
+    parser.add_argument('--limit', type=int, help="refresh at most this many vulnerabilities")
+    parser.add_argument('--model', nargs='?', const='', metavar='PATH',
+                        help="score with a trained model artifact (default: the latest from epss_model.py)")
+    parser.add_argument('--state', help="progress file; an unfinished run recorded there is resumed")
+    parser.add_argument('--output', help="write one JSON line per scored vulnerability here")
+    args = parser.parse_args()
+
+    def calculator_factory() -> EPSSCalculator:
+        calculator = EPSSCalculator(schema=args.schema)
+        if args.model is not None:
+            calculator.use_model(args.model or None)
+        return calculator
+
+    out = open(args.output, 'a') if args.output else None
+    scheduler = EPSSScheduler(
+        calculator_factory,
+        concurrency=args.concurrency,
+        qps=args.qps,
+        batch_size=args.batch_size,
+        engine=args.engine,
+        min_age_hours=args.min_age_hours,
+        never_scored_hours=args.never_scored_hours,
+        limit=args.limit,
+        state_path=args.state,
+        out=out
+    )
+
+    def on_signal(signum, frame):
+        logger.info(f"Received signal {signum}, finishing batches in flight")
+        scheduler.stop.set()
+
+    signal.signal(signal.SIGTERM, on_signal)
+    signal.signal(signal.SIGINT, on_signal)
+
+    try:
+        summary = scheduler.run()
+    except Exception as e:
+        logger.error(f"EPSS scheduler failed: {e}")
+        sys.exit(1)
+    finally:
+        if out is not None:
+            out.close()
+
+    print(json.dumps(summary, indent=2))
+    sys.exit(0 if summary['failed'] == 0 else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,225 @@
+#!/usr/bin/env python3
+"""
+EPSS Multi-Tenant Sweep
+Enumerates the org_* tenant schemas and runs the EPSS batch scorer for each
+one in a process pool, writing a combined summary
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+import logging
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+from datetime import datetime
+from typing import Dict, List, Any, Tuple
+
+import psycopg2
+from psycopg2.extras import RealDictCursor
+
+from epss_calculator import EPSSCalculator, ENGINES, run_batch
+
+logger = logging.getLogger('epss_tenant_sweep')
+
+
+def registry_config() -> Dict[str, str]:
+    """Connection settings of the database holding Organization_Schemas"""
+    return {
+        'host': os.getenv('DB_HOST', 'localhost'),
+        'port': os.getenv('DB_PORT', '5432'),
+        'database': os.getenv('DB_NAME', 'postgres'),
+        'user': os.getenv('DB_USER', 'postgres'),
+        'password': os.getenv('DB_PASSWORD', '')
+    }
+
+
+def list_tenants(config: Dict[str, str], prefix: str = 'org_') -> List[Dict[str, Any]]:
+    """Tenants registered in Organization_Schemas, or every ``prefix`` schema when there is no registry"""
+    conn = psycopg2.connect(**config, cursor_factory=RealDictCursor)
+    try:
+        with conn.cursor() as cur:
+            cur.execute("SELECT to_regclass('organization_schemas') IS NOT NULL AS registered")
+            if cur.fetchone()['registered']:
+                cur.execute("""
+                    SELECT DISTINCT ON (schemaname) schemaname AS schema, connectionstring AS dsn
+                    FROM organization_schemas
+                    WHERE schemaname IS NOT NULL
+                    ORDER BY schemaname, id
+                """)
+            else:
+                cur.execute("""
+                    SELECT nspname AS schema, NULL AS dsn
+                    FROM pg_namespace
+                    WHERE nspname LIKE %s
+                    ORDER BY nspname
+                """, (prefix.replace('_', '\\_') + '%',))
+            return [dict(row) for row in cur.fetchall()]
+    finally:
+        conn.close()
+
+
+def tenant_config(tenant: Dict[str, Any], default_config: Dict[str, str]) -> Dict[str, str]:
+    """Connection settings for one tenant: its own connection string, else the registry database"""
+    if tenant.get('dsn'):
+        return {'dsn': tenant['dsn']}
+    return dict(default_config)
+
+
+def database_key(config: Dict[str, str]) -> str:
+    """Identify the database a tenant lives in, for the per-database connection limit"""
+    if config.get('dsn'):
+        params = psycopg2.extensions.parse_dsn(config['dsn'])
+        return f"{params.get('host', 'localhost')}:{params.get('port', '5432')}/{params.get('dbname', '')}"
+    return f"{config.get('host')}:{config.get('port')}/{config.get('database')}"
+
+
+def sweep_tenant(schema: str, config: Dict[str, str], options: Dict[str, Any]) -> Dict[str, Any]:
+    """Score one tenant in a worker process and report its summary"""
+    started = time.perf_counter()
+    summary: Dict[str, Any] = {'schema': schema}
+    output_dir = options.get('output_dir')
+    path = os.path.join(output_dir, f"{schema}.jsonl") if output_dir else os.devnull
+    try:
+        calculator = EPSSCalculator(config, schema=schema)
+        if options.get('model') is not None:
+            calculator.use_model(options['model'] or None)
+        with open(path, 'w') as out:
+            summary.update(run_batch(
+                calculator, None, out=out,
+                engine=options['engine'],
+                chunk_size=options['chunk_size'],
+                commit_size=options['commit_size'],
+                incremental=options['incremental']
+            ))
+        summary['success'] = summary['failed'] == 0
+    except Exception as e:
+        logger.error(f"Tenant {schema} failed: {e}")
+        summary.update({'success': False, 'error': str(e)})
+    summary['elapsed_seconds'] = round(time.perf_counter() - started, 2)
+    if output_dir:
+        summary['results_file'] = path
+    return summary
+
+
+def sweep(tenants: List[Dict[str, Any]], default_config: Dict[str, str], options: Dict[str, Any],
+          parallelism: int = 4, per_database_limit: int = 0) -> Dict[str, Any]:
+    """Run every tenant in a process pool.
+
+    At most ``parallelism`` tenants run at once, and at most
+    ``per_database_limit`` of them (0 = no limit) against the same database,
+    so tenants sharing one server do not exhaust its connections. Each tenant
+    job holds a single connection.
+    """
+    started_at = datetime.now().isoformat()
+    started = time.perf_counter()
+    queue = [(t['schema'], tenant_config(t, default_config)) for t in tenants]
+    running: Dict[Any, Tuple[str, str]] = {}
+    per_database: Dict[str, int] = {}
+    results: List[Dict[str, Any]] = []
+
+    with ProcessPoolExecutor(max_workers=parallelism) as pool:
+        while queue or running:
+            # Start every queued tenant whose database still has a free slot
+            for item in list(queue):
+                if len(running) >= parallelism:
+                    break
+                schema, config = item
+                key = database_key(config)
+                if per_database_limit and per_database.get(key, 0) >= per_database_limit:
+                    continue
+                queue.remove(item)
+                per_database[key] = per_database.get(key, 0) + 1
+                running[pool.submit(sweep_tenant, schema, config, options)] = (key, schema)
+                logger.info(f"Started tenant {schema} ({len(running)} running, {len(queue)} queued)")
+
+            done, _ = wait(list(running), return_when=FIRST_COMPLETED)
+            for future in done:
+                key, schema = running.pop(future)
+                per_database[key] -= 1
+                try:
+                    result = future.result()
+                except Exception as e:
+                    # The worker process itself died
+                    result = {'schema': schema, 'success': False, 'error': str(e)}
+                results.append(result)
+                logger.info(f"Finished tenant {result.get('schema')}: "
+                            f"{'ok' if result.get('success') else 'failed'} in {result.get('elapsed_seconds')}s")
+
+    results.sort(key=lambda r: r['schema'])
+    return {
+        'started_at': started_at,
+        'tenants': len(results),
+        'tenants_succeeded': sum(1 for r in results if r.get('success')),
+        'tenants_failed': sum(1 for r in results if not r.get('success')),
+        'vulnerabilities_total': sum(r.get('total', 0) for r in results),
+        'vulnerabilities_successful': sum(r.get('successful', 0) for r in results),
+        'vulnerabilities_failed': sum(r.get('failed', 0) for r in results),
+        'parallelism': parallelism,
+        'per_database_limit': per_database_limit,
+        'elapsed_seconds': round(time.perf_counter() - started, 2),
+        'results': results
+    }
+
+
+def main():
+    """Main entry point for command-line execution"""
+    parser = argparse.ArgumentParser(description="Rescore EPSS for every tenant schema in parallel")
+    parser.add_argument('--schemas', action='append', default=[],
+                        help="comma-separated tenant schemas to sweep (default: all registered tenants)")
+    parser.add_argument('--prefix', default='org_',
+                        help="schema prefix used when Organization_Schemas is not available")
+    parser.add_argument('--parallelism', type=int, default=os.cpu_count() or 4,
+                        help="tenants scored at the same time")
+    parser.add_argument('--per-database-limit', type=int, default=0,
+                        help="max tenants running against the same database at once (0 = no limit)")
+    parser.add_argument('--engine', choices=ENGINES, default='sql', help="risk factor engine")
+    parser.add_argument('--incremental', action='store_true',
+                        help="only rescore vulnerabilities whose inputs changed")
+    parser.add_argument('--chunk-size', type=int, default=1000)
+    parser.add_argument('--commit-size', type=int, default=500)
+    parser.add_argument('--model', nargs='?', const='', metavar='PATH',
+                        help="score with a trained model artifact (default: the latest from epss_model.py)")
+    parser.add_argument('--output-dir', help="write each tenant's result lines to <dir>/<schema>.jsonl")
+    parser.add_argument('--summary', help="write the combined summary here instead of stdout")
+    args = parser.parse_args()
+
+    config = registry_config()
+    try:
+        tenants = list_tenants(config, args.prefix)
+    except Exception as e:
+        logger.error(f"Could not list tenant schemas: {e}")
+        sys.exit(1)
+
+    wanted = {s.strip() for value in args.schemas for s in value.split(',') if s.strip()}
+    if wanted:
+        tenants = [t for t in tenants if t['schema'] in wanted]
+    if not tenants:
+        print("Error: no tenant schemas to sweep")
+        sys.exit(1)
+
+    if args.output_dir:
+        os.makedirs(args.output_dir, exist_ok=True)
+    options = {
+        'engine': args.engine,
+        'incremental': args.incremental,
+        'chunk_size': args.chunk_size,
+        'commit_size': args.commit_size,
+        'output_dir': args.output_dir,
+        'model': args.model
+    }
+    summary = sweep(tenants, config, options, parallelism=max(1, args.parallelism),
+                    per_database_limit=args.per_database_limit)
+
+    report = json.dumps(summary, indent=2, default=str)
+    if args.summary:
+        with open(args.summary, 'w') as f:
+            f.write(report)
+        logger.info(f"Sweep summary written to {args.summary}")
+    else:
+        print(report)
+    sys.exit(0 if summary['tenants_failed'] == 0 else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,353 @@
+#!/usr/bin/env python3
+"""
+EPSS Scoring Worker
+Long-lived EPSS calculator process speaking newline-delimited JSON on stdin/stdout
+or on a Unix socket, so callers avoid interpreter start-up and reconnects per score
+
+Requests:  {"id": 1, "op": "score", "vulnerability_id": 42}
+           {"id": 2, "op": "batch", "vulnerability_ids": [1, 2, 3], "engine": "sql"}
+           {"id": 3, "op": "health"} | {"id": 4, "op": "ready"} | {"id": 5, "op": "shutdown"}
+           {"id": 6, "op": "invalidate_catalog", "schema": "org_acme"}  (schema optional)
+Responses: {"id": 1, "ok": true, "result": {...}, "elapsed_ms": 12.3}
+Events:    {"type": "ready", ...} on start-up, {"type": "shutdown", ...} after draining
+"""
+
+import os
+import sys
+import json
+import signal
+import asyncio
+import socket
+import argparse
+import threading
+import socketserver
+import logging
+import time
+from typing import Dict, Any, Optional
+
+import psycopg2
+from psycopg2 import extensions
+
+from epss_calculator import EPSSCalculator, ENGINES
+
+logger = logging.getLogger('epss_worker')
+
+
+class WorkerDrain(Exception):
+    """Raised to stop reading new requests once a drain has been requested"""
+
+
+class EPSSWorker:
+    """Keeps one warm EPSSCalculator connection and serves JSON-lines requests"""
+
+    def __init__(self, calculator: Optional[EPSSCalculator] = None, ranker_max_age: float = 300,
+                 async_pool_size: int = 0):
+        """Initialize the worker around a calculator"""
+        self.calculator = calculator or EPSSCalculator()
+        # Single scores run their factor counts concurrently over this many pooled connections (0 = off)
+        self.async_pool_size = async_pool_size
+        self.loop: Optional[asyncio.AbstractEventLoop] = None
+        self.pool = None
+        # Keep the portfolio percentile ranker warm, refreshing it periodically
+        self.calculator.ranker_max_age = ranker_max_age
+        self.lock = threading.Lock()
+        self.draining = threading.Event()
+        self.started_at = time.time()
+        self.requests_served = 0
+        self.requests_failed = 0
+        self.in_flight = 0
+
+    def ensure_connection(self):
+        """Open the database connection if it is missing or closed"""
+        conn = self.calculator.conn
+        if conn is None or conn.closed:
+            self.calculator.connect()
+            self.calculator.load_ranker()
+            self.end_transaction()
+
+    def ensure_async_pool(self) -> bool:
+        """Open the asyncpg pool if enabled; falls back to sequential scoring if it cannot"""
+        if not self.async_pool_size:
+            return False
+        if self.pool is None:
+            try:
+                if self.loop is None:
+                    self.loop = asyncio.new_event_loop()
+                self.pool = self.loop.run_until_complete(
+                    # Grows to the limit only under concurrent factor counts
+                    self.calculator.create_async_pool(min_size=1, max_size=self.async_pool_size)
+                )
+            except Exception as e:
+                logger.warning(f"Async pool unavailable, scoring sequentially: {e}")
+                self.async_pool_size = 0
+                return False
+        return True
+
+    def reset_connection(self):
+        """Drop a broken connection so the next request reconnects"""
+        try:
+            self.calculator.disconnect()
+        except Exception:
+            pass
+        self.calculator.conn = None
+
+    def end_transaction(self):
+        """Make sure no transaction is left open between requests"""
+        conn = self.calculator.conn
+        if conn is not None and not conn.closed and \
+                conn.get_transaction_status() != extensions.TRANSACTION_STATUS_IDLE:
+            conn.rollback()
+
+    def health(self) -> Dict[str, Any]:
+        """Report liveness, connection state and counters"""
+        conn = self.calculator.conn
+        return {
+            'status': 'draining' if self.draining.is_set() else 'ok',
+            'pid': os.getpid(),
+            'uptime_seconds': round(time.time() - self.started_at, 1),
+            'db_connected': conn is not None and not conn.closed,
+            'async_pool_size': self.async_pool_size if self.pool is not None else 0,
+            'model_version': self.calculator.model_version,
+            'requests_served': self.requests_served,
+            'requests_failed': self.requests_failed,
+            'in_flight': self.in_flight
+        }
+
+    def ready(self) -> Dict[str, Any]:
+        """Check that the worker can reach the database"""
+        with self.lock:
+            self.ensure_connection()
+            with self.calculator.conn.cursor() as cur:
+                cur.execute("SELECT 1")
+            self.end_transaction()
+        return {'ready': not self.draining.is_set()}
+
+    def run_scoring(self, request: Dict[str, Any]) -> Any:
+        """Run a score or batch request against the warm connection"""
+        op = request.get('op')
+        if op == 'score':
+            vulnerability_id = int(request['vulnerability_id'])
+            if self.ensure_async_pool():
+                return self.loop.run_until_complete(
+                    self.calculator.score_vulnerability_async(vulnerability_id, self.pool)
+                )
+            return self.calculator.score_vulnerability(vulnerability_id)
+        if op == 'batch':
+            engine = request.get('engine', 'sql')
+            if engine not in ENGINES:
+                raise ValueError(f"Unknown engine {engine!r}")
+            vulnerability_ids = [int(v) for v in request.get('vulnerability_ids', [])]
+            return list(self.calculator.calculate_batch(vulnerability_ids, engine=engine))
+        raise ValueError(f"Unknown op {op!r}")
+
+    def handle(self, request: Dict[str, Any]) -> Dict[str, Any]:
+        """Handle one decoded request and build its response"""
+        started = time.perf_counter()
+        request_id = request.get('id')
+        op = request.get('op')
+        response = {'id': request_id, 'ok': True}
+        try:
+            if op == 'health':
+                response['result'] = self.health()
+            elif op == 'ready':
+                response['result'] = self.ready()
+            elif op == 'shutdown':
+                self.draining.set()
+                response['result'] = {'draining': True}
+            elif op == 'invalidate_catalog':
+                # After migrations: re-read tables and columns on the next check
+                self.calculator.catalog.invalidate(request.get('schema'))
+                response['result'] = {'invalidated': request.get('schema') or 'all'}
+            elif self.draining.is_set():
+                raise RuntimeError("Worker is draining and no longer accepts work")
+            else:
+                with self.lock:
+                    self.in_flight += 1
+                    try:
+                        try:
+                            self.ensure_connection()
+                            response['result'] = self.run_scoring(request)
+                        except (psycopg2.OperationalError, psycopg2.InterfaceError) as e:
+                            # The warm connection went away; reconnect once and retry
+                            logger.warning(f"Database connection lost, reconnecting: {e}")
+                            self.reset_connection()
+                            self.ensure_connection()
+                            response['result'] = self.run_scoring(request)
+                        finally:
+                            self.end_transaction()
+                    finally:
+                        self.in_flight -= 1
+        except Exception as e:
+            logger.error(f"Request {request_id} ({op}) failed: {e}")
+            response['ok'] = False
+            response['error'] = str(e)
+
+        if response['ok']:
+            self.requests_served += 1
+        else:
+            self.requests_failed += 1
+        response['elapsed_ms'] = round((time.perf_counter() - started) * 1000, 2)
+        return response
+
+    def handle_line(self, line: str) -> Optional[Dict[str, Any]]:
+        """Decode one JSON line and handle it; blank lines are ignored"""
+        line = line.strip()
+        if not line:
+            return None
+        try:
+            request = json.loads(line)
+            if not isinstance(request, dict):
+                raise ValueError("request must be a JSON object")
+        except ValueError as e:
+            self.requests_failed += 1
+            return {'id': None, 'ok': False, 'error': f"Invalid request: {e}"}
+        return self.handle(request)
+
+    def event(self, event_type: str) -> Dict[str, Any]:
+        """Build a lifecycle event message"""
+        return {'type': event_type, **self.health()}
+
+    def close(self):
+        """Release the database connection"""
+        with self.lock:
+            self.calculator.disconnect()
+            if self.loop is not None:
+                if self.pool is not None:
+                    self.loop.run_until_complete(self.pool.close())
+                    self.pool = None
+                self.loop.close()
+                self.loop = None
+
+
+def serve_stdio(worker: EPSSWorker):
+    """Serve requests from stdin, writing one response line per request to stdout"""
+    busy = threading.Event()
+
+    def on_signal(signum, frame):
+        logger.info(f"Received signal {signum}, draining")
+        worker.draining.set()
+        if not busy.is_set():
+            raise WorkerDrain()
+
+    signal.signal(signal.SIGTERM, on_signal)
+    signal.signal(signal.SIGINT, on_signal)
+
+    def emit(message: Dict[str, Any]):
+        sys.stdout.write(json.dumps(message, default=str) + "\n")
+        sys.stdout.flush()
+
+    emit(worker.event('ready'))
+    try:
+        for line in sys.stdin:
+            busy.set()
+            try:
+                response = worker.handle_line(line)
+                if response is not None:
+                    emit(response)
+            finally:
+                busy.clear()
+            if worker.draining.is_set():
+                break
+    except WorkerDrain:
+        pass
+    finally:
+        worker.close()
+        emit(worker.event('shutdown'))
+
+
+class _LineHandler(socketserver.StreamRequestHandler):
+    """One client connection on the Unix socket"""
+
+    def handle(self):
+        worker: EPSSWorker = self.server.worker
+        # Poll so idle clients notice a drain without waiting for their next request
+        self.connection.settimeout(0.5)
+        buffer = b''
+        while not worker.draining.is_set():
+            try:
+                chunk = self.connection.recv(65536)
+            except socket.timeout:
+                continue
+            except OSError:
+                break
+            if not chunk:
+                break
+            buffer += chunk
+            while b'\n' in buffer:
+                line, buffer = buffer.split(b'\n', 1)
+                response = worker.handle_line(line.decode('utf-8', errors='replace'))
+                if response is not None:
+                    self.wfile.write((json.dumps(response, default=str) + "\n").encode('utf-8'))
+                    self.wfile.flush()
+
+
+class _UnixServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = False
+    block_on_close = True
+
+
+def serve_socket(worker: EPSSWorker, path: str):
+    """Serve requests on a Unix socket until SIGTERM, then drain in-flight requests"""
+    if os.path.exists(path):
+        os.unlink(path)
+    server = _UnixServer(path, _LineHandler)
+    server.worker = worker
+
+    def on_signal(signum, frame):
+        logger.info(f"Received signal {signum}, draining")
+        worker.draining.set()
+
+    signal.signal(signal.SIGTERM, on_signal)
+    signal.signal(signal.SIGINT, on_signal)
+
+    def watch_drain():
+        worker.draining.wait()
+        server.shutdown()
+
+    threading.Thread(target=watch_drain, daemon=True).start()
+    print(json.dumps(worker.event('ready')), flush=True)
+    try:
+        server.serve_forever(poll_interval=0.5)
+    finally:
+        # Joins client threads, so in-flight requests finish before we disconnect
+        server.server_close()
+        worker.close()
+        if os.path.exists(path):
+            os.unlink(path)
+        print(json.dumps(worker.event('shutdown')), flush=True)
+
+
+def main():
+    """Main entry point for the worker"""
+    parser = argparse.ArgumentParser(description="Long-lived EPSS scoring worker (JSON lines)")
+    parser.add_argument('--socket', help="listen on this Unix socket path instead of stdin/stdout")
+    parser.add_argument('--no-warmup', action='store_true',
+                        help="do not open the database connection before the ready message")
+    parser.add_argument('--ranker-max-age', type=float, default=300,
+                        help="seconds before the in-memory percentile ranker is reloaded")
+    parser.add_argument('--async-pool', type=int, default=0,
+                        help="up to this many asyncpg connections for concurrent factor counts "
+                             "on single scores (default 0: off)")
+    parser.add_argument('--model', nargs='?', const='', metavar='PATH',
+                        help="score with a trained model artifact (default: the latest from epss_model.py)")
+    args = parser.parse_args()
+
+    worker = EPSSWorker(ranker_max_age=args.ranker_max_age, async_pool_size=args.async_pool)
+    if args.model is not None:
+        # Loaded once here; every request reuses it
+        worker.calculator.use_model(args.model or None)
+    if not args.no_warmup:
+        try:
+            worker.ensure_connection()
+        except Exception as e:
+            # Still start; requests will retry the connection
+            logger.error(f"Warm-up connection failed: {e}")
+
+    if args.socket:
+        serve_socket(worker, args.socket)
+    else:
+        serve_stdio(worker)
+
+
+if __name__ == "__main__":
+    main()
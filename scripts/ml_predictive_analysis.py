@@ -16,11 +16,21 @@ Date: 2024
 import pandas as pd
 import numpy as np
 from datetime import datetime, timedelta
+from decimal import Decimal
 import psycopg2
 from psycopg2.extras import RealDictCursor
+from psycopg2.pool import ThreadedConnectionPool
 import os
+import re
+import sys
+import contextlib
 import json
-from typing import Dict, List, Any, Tuple
+import math
+import time
+import hashlib
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Any, Tuple, Optional
 import warnings
 warnings.filterwarnings('ignore')
 
@@ -32,28 +42,509 @@ from sklearn.linear_model import LogisticRegression
 from sklearn.metrics import classification_report, mean_squared_error, accuracy_score
 from sklearn.pipeline import Pipeline
 from sklearn.impute import SimpleImputer
-import xgboost as xgb
-from imblearn.over_sampling import SMOTE
 import joblib
 
+from schema_catalog import SchemaCatalog, catalog as default_catalog
+
+
+# Columns read from each GRC table. The aggregate path requires the same
+# columns, so both paths skip exactly the same tables
+TABLE_COLUMNS = {
+    'risks': [
+        'id', 'risk_id', 'title', 'description', 'risk_level', 'status', 'impact_level',
+        'likelihood_level', 'risk_score', 'remediation_status', 'created_at', 'updated_at',
+        'due_date', 'assigned_to', 'department_id'
+    ],
+    'incidents': [
+        'id', 'incident_id', 'title', 'description', 'severity', 'status', 'impact_level',
+        'created_at', 'resolved_at', 'assigned_to', 'department_id', 'category'
+    ],
+    'vulnerabilities': [
+        'id', 'vulnerability_id', 'title', 'description', 'severity', 'status',
+        'cvss_score', 'remediation_status', 'discovered_at', 'due_date', 'affected_assets',
+        'category', 'threat_level'
+    ],
+    'controls': [
+        'id', 'control_id', 'title', 'description', 'control_type', 'status',
+        'implementation_status', 'effectiveness_score', 'last_assessment',
+        'next_review_date', 'department_id'
+    ],
+    'compliance': [
+        'id', 'compliance_id', 'framework_name', 'compliance_score', 'status',
+        'last_assessment', 'next_audit_date', 'critical_findings', 'department_id',
+        'overall_compliance_percentage'
+    ],
+    'findings': [
+        'id', 'finding_id', 'title', 'description', 'severity', 'status',
+        'remediation_status', 'created_at', 'due_date', 'assigned_to', 'related_risk_id',
+        'related_asset_id'
+    ],
+    'assessments': [
+        'id', 'assessment_id', 'title', 'assessment_type', 'status', 'overall_score',
+        'completion_percentage', 'start_date', 'end_date', 'department_id', 'assessor_id'
+    ],
+    'threats': [
+        'id', 'threat_id', 'title', 'description', 'threat_level', 'status',
+        'likelihood_score', 'impact_score', 'remediation_status', 'discovered_at',
+        'last_seen', 'category'
+    ],
+    'technology_risks': [
+        'id', 'technology_risk_id', 'title', 'description', 'risk_level',
+        'technology_type', 'status', 'impact_level', 'remediation_status', 'identified_at',
+        'department_id'
+    ],
+    'assets': [
+        'id', 'asset_id', 'name', 'asset_type', 'criticality_level', 'location',
+        'department_id', 'status', 'last_assessment', 'compliance_status', 'risk_level'
+    ]
+}
+
+# Per-table scalar aggregates, in feature_engineering() order. Each expression
+# reproduces the pandas computation over the fetched rows: `!=` counts NULLs
+# (IS DISTINCT FROM) while ==, isin, >= and mean skip them, and an item is
+# overdue once it is at least one whole day past its date
+FEATURE_AGGREGATES = {
+    'risks': [
+        ('total_risks', "COUNT(*)"),
+        ('open_risks', "COUNT(*) FILTER (WHERE status IS DISTINCT FROM 'closed')"),
+        ('high_risk_count', "COUNT(*) FILTER (WHERE risk_level IN ('high', 'critical'))"),
+        ('avg_risk_score', "AVG(risk_score)"),
+        ('overdue_risks', "COUNT(*) FILTER (WHERE due_date::timestamp <= %(overdue_before)s)"),
+        ('remediated_risks', "COUNT(*) FILTER (WHERE remediation_status = 'completed')")
+    ],
+    'incidents': [
+        ('total_incidents', "COUNT(*)"),
+        ('open_incidents', "COUNT(*) FILTER (WHERE status IS DISTINCT FROM 'resolved')"),
+        ('critical_incidents', "COUNT(*) FILTER (WHERE severity IN ('critical', 'high'))"),
+        ('avg_incident_age', "AVG(FLOOR(EXTRACT(EPOCH FROM %(now)s - created_at::timestamp) / 86400))"),
+        ('incident_resolution_rate', "COUNT(*) FILTER (WHERE status = 'resolved')::float8 / NULLIF(COUNT(*), 0)")
+    ],
+    'vulnerabilities': [
+        ('total_vulnerabilities', "COUNT(*)"),
+        ('open_vulnerabilities', "COUNT(*) FILTER (WHERE status IS DISTINCT FROM 'closed')"),
+        ('critical_vulnerabilities', "COUNT(*) FILTER (WHERE severity IN ('critical', 'high'))"),
+        ('avg_cvss_score', "AVG(cvss_score)"),
+        ('overdue_vulnerabilities', "COUNT(*) FILTER (WHERE due_date::timestamp <= %(overdue_before)s)"),
+        ('remediated_vulnerabilities', "COUNT(*) FILTER (WHERE remediation_status = 'completed')")
+    ],
+    'controls': [
+        ('total_controls', "COUNT(*)"),
+        ('implemented_controls', "COUNT(*) FILTER (WHERE implementation_status = 'implemented')"),
+        ('effective_controls', "COUNT(*) FILTER (WHERE effectiveness_score >= 80)"),
+        ('avg_control_effectiveness', "AVG(effectiveness_score)"),
+        ('overdue_control_reviews', "COUNT(*) FILTER (WHERE next_review_date::timestamp <= %(overdue_before)s)")
+    ],
+    'compliance': [
+        ('avg_compliance_score', "AVG(compliance_score)"),
+        ('overall_compliance_percentage', "AVG(overall_compliance_percentage)"),
+        ('critical_compliance_findings', "COALESCE(SUM(critical_findings), 0)"),
+        ('compliant_frameworks', "COUNT(*) FILTER (WHERE compliance_score >= 80)")
+    ],
+    'findings': [
+        ('total_findings', "COUNT(*)"),
+        ('open_findings', "COUNT(*) FILTER (WHERE status IS DISTINCT FROM 'closed')"),
+        ('critical_findings', "COUNT(*) FILTER (WHERE severity IN ('critical', 'high'))"),
+        ('overdue_findings', "COUNT(*) FILTER (WHERE due_date::timestamp <= %(overdue_before)s)"),
+        ('remediated_findings', "COUNT(*) FILTER (WHERE remediation_status = 'completed')")
+    ],
+    'assessments': [
+        ('total_assessments', "COUNT(*)"),
+        ('completed_assessments', "COUNT(*) FILTER (WHERE status = 'completed')"),
+        ('avg_assessment_score', "AVG(overall_score)"),
+        ('assessment_completion_rate', "AVG(completion_percentage)")
+    ],
+    'threats': [
+        ('total_threats', "COUNT(*)"),
+        ('active_threats', "COUNT(*) FILTER (WHERE status = 'active')"),
+        ('high_threats', "COUNT(*) FILTER (WHERE threat_level IN ('high', 'critical'))"),
+        ('avg_threat_likelihood', "AVG(likelihood_score)"),
+        ('avg_threat_impact', "AVG(impact_score)")
+    ],
+    'technology_risks': [
+        ('total_tech_risks', "COUNT(*)"),
+        ('high_tech_risks', "COUNT(*) FILTER (WHERE risk_level IN ('high', 'critical'))"),
+        ('remediated_tech_risks', "COUNT(*) FILTER (WHERE remediation_status = 'completed')")
+    ],
+    'assets': [
+        ('total_assets', "COUNT(*)"),
+        ('critical_assets', "COUNT(*) FILTER (WHERE criticality_level IN ('high', 'critical'))"),
+        ('non_compliant_assets', "COUNT(*) FILTER (WHERE compliance_status IS DISTINCT FROM 'compliant')"),
+        ('high_risk_assets', "COUNT(*) FILTER (WHERE risk_level IN ('high', 'critical'))")
+    ]
+}
+
+# Features measured against the current time (ages, overdue counts); they move from day
+# to day without any data changing, so the model registry leaves them out of its fingerprint
+TIME_RELATIVE_FEATURES = frozenset(
+    name for expressions in FEATURE_AGGREGATES.values() for name, sql in expressions if '%(' in sql
+)
+
+# Further scalars read by the targets, risk drivers and distributions, computed in the same query
+SUPPORT_AGGREGATES = {
+    'risks': [
+        ('unremediated_risks', "COUNT(*) FILTER (WHERE remediation_status IS DISTINCT FROM 'completed')"),
+        ('overdue_critical_risks', "COUNT(*) FILTER (WHERE risk_level = 'critical' AND due_date::timestamp < %(now)s)"),
+        ('risk_level_counts', "(SELECT jsonb_object_agg(level, n) FROM (SELECT risk_level::text AS level, COUNT(*) AS n "
+                              "FROM risks WHERE risk_level IS NOT NULL GROUP BY 1) AS levels)")
+    ],
+    'incidents': [
+        ('recent_incidents', "COUNT(*) FILTER (WHERE created_at::timestamp > %(recent_since)s)")
+    ],
+    'vulnerabilities': [
+        ('severity_counts', "(SELECT jsonb_object_agg(level, n) FROM (SELECT severity::text AS level, COUNT(*) AS n "
+                            "FROM vulnerabilities WHERE severity IS NOT NULL GROUP BY 1) AS levels)")
+    ]
+}
+
+
+def _days_since(dates: pd.Series, now: pd.Timestamp) -> pd.Series:
+    """Whole days from each date to now, as feature_engineering() computes them"""
+    return (now - pd.to_datetime(dates)).dt.days
+
+
+def _mean(values: pd.Series) -> float:
+    """Mean of the non-null values from a correctly rounded sum, so a whole column
+    and the same column folded in chunks give bit-identical results"""
+    values = pd.to_numeric(values, errors='coerce').dropna()
+    return math.fsum(values) / len(values) if len(values) else np.nan
+
+
+def _json_default(value):
+    """JSON encoding for numpy scalars and arrays in results; anything else as text"""
+    if isinstance(value, np.generic):
+        return value.item()
+    if isinstance(value, np.ndarray):
+        return value.tolist()
+    return str(value)
+
+
+def _overdue(dates: pd.Series, now: pd.Timestamp) -> pd.Series:
+    """Rows at least one whole day past their date"""
+    return _days_since(dates, now).clip(lower=0) > 0
+
+
+# Chunk-by-chunk pandas counterparts of FEATURE_AGGREGATES and SUPPORT_AGGREGATES
+# for the streaming path, using the expressions feature_engineering() applies to
+# whole tables: (name, kind, fn(chunk, now)). 'rows' is the table's row count,
+# 'count' sums a boolean mask, 'ratio' divides one by the row count, 'mean' and
+# 'sum' fold a numeric series and 'value_counts' merges a level histogram
+STREAM_AGGREGATES = {
+    'risks': [
+        ('total_risks', 'rows', None),
+        ('open_risks', 'count', lambda df, now: df['status'] != 'closed'),
+        ('high_risk_count', 'count', lambda df, now: df['risk_level'].isin(['high', 'critical'])),
+        ('avg_risk_score', 'mean', lambda df, now: df['risk_score']),
+        ('overdue_risks', 'count', lambda df, now: _overdue(df['due_date'], now)),
+        ('remediated_risks', 'count', lambda df, now: df['remediation_status'] == 'completed'),
+        ('unremediated_risks', 'count', lambda df, now: df['remediation_status'] != 'completed'),
+        ('overdue_critical_risks', 'count', lambda df, now: (df['risk_level'] == 'critical') & (pd.to_datetime(df['due_date']) < now)),
+        ('risk_level_counts', 'value_counts', lambda df, now: df['risk_level'])
+    ],
+    'incidents': [
+        ('total_incidents', 'rows', None),
+        ('open_incidents', 'count', lambda df, now: df['status'] != 'resolved'),
+        ('critical_incidents', 'count', lambda df, now: df['severity'].isin(['critical', 'high'])),
+        ('avg_incident_age', 'mean', lambda df, now: _days_since(df['created_at'], now)),
+        ('incident_resolution_rate', 'ratio', lambda df, now: df['status'] == 'resolved'),
+        ('recent_incidents', 'count', lambda df, now: pd.to_datetime(df['created_at']) > (now - pd.Timedelta(days=30)))
+    ],
+    'vulnerabilities': [
+        ('total_vulnerabilities', 'rows', None),
+        ('open_vulnerabilities', 'count', lambda df, now: df['status'] != 'closed'),
+        ('critical_vulnerabilities', 'count', lambda df, now: df['severity'].isin(['critical', 'high'])),
+        ('avg_cvss_score', 'mean', lambda df, now: df['cvss_score']),
+        ('overdue_vulnerabilities', 'count', lambda df, now: _overdue(df['due_date'], now)),
+        ('remediated_vulnerabilities', 'count', lambda df, now: df['remediation_status'] == 'completed'),
+        ('severity_counts', 'value_counts', lambda df, now: df['severity'])
+    ],
+    'controls': [
+        ('total_controls', 'rows', None),
+        ('implemented_controls', 'count', lambda df, now: df['implementation_status'] == 'implemented'),
+        ('effective_controls', 'count', lambda df, now: df['effectiveness_score'] >= 80),
+        ('avg_control_effectiveness', 'mean', lambda df, now: df['effectiveness_score']),
+        ('overdue_control_reviews', 'count', lambda df, now: _overdue(df['next_review_date'], now))
+    ],
+    'compliance': [
+        ('avg_compliance_score', 'mean', lambda df, now: df['compliance_score']),
+        ('overall_compliance_percentage', 'mean', lambda df, now: df['overall_compliance_percentage']),
+        ('critical_compliance_findings', 'sum', lambda df, now: df['critical_findings']),
+        ('compliant_frameworks', 'count', lambda df, now: df['compliance_score'] >= 80)
+    ],
+    'findings': [
+        ('total_findings', 'rows', None),
+        ('open_findings', 'count', lambda df, now: df['status'] != 'closed'),
+        ('critical_findings', 'count', lambda df, now: df['severity'].isin(['critical', 'high'])),
+        ('overdue_findings', 'count', lambda df, now: _overdue(df['due_date'], now)),
+        ('remediated_findings', 'count', lambda df, now: df['remediation_status'] == 'completed')
+    ],
+    'assessments': [
+        ('total_assessments', 'rows', None),
+        ('completed_assessments', 'count', lambda df, now: df['status'] == 'completed'),
+        ('avg_assessment_score', 'mean', lambda df, now: df['overall_score']),
+        ('assessment_completion_rate', 'mean', lambda df, now: df['completion_percentage'])
+    ],
+    'threats': [
+        ('total_threats', 'rows', None),
+        ('active_threats', 'count', lambda df, now: df['status'] == 'active'),
+        ('high_threats', 'count', lambda df, now: df['threat_level'].isin(['high', 'critical'])),
+        ('avg_threat_likelihood', 'mean', lambda df, now: df['likelihood_score']),
+        ('avg_threat_impact', 'mean', lambda df, now: df['impact_score'])
+    ],
+    'technology_risks': [
+        ('total_tech_risks', 'rows', None),
+        ('high_tech_risks', 'count', lambda df, now: df['risk_level'].isin(['high', 'critical'])),
+        ('remediated_tech_risks', 'count', lambda df, now: df['remediation_status'] == 'completed')
+    ],
+    'assets': [
+        ('total_assets', 'rows', None),
+        ('critical_assets', 'count', lambda df, now: df['criticality_level'].isin(['high', 'critical'])),
+        ('non_compliant_assets', 'count', lambda df, now: df['compliance_status'] != 'compliant'),
+        ('high_risk_assets', 'count', lambda df, now: df['risk_level'].isin(['high', 'critical']))
+    ]
+}
+
+
+class StreamingAggregator:
+    """
+    Running aggregates for one table, folded one chunk of rows at a time so a
+    table of any size is summarized in the memory of a single chunk
+    """
+
+    def __init__(self, table_name: str, now: pd.Timestamp):
+        """
+        Args:
+            table_name: Table whose STREAM_AGGREGATES are folded
+            now: Reference time for ages and overdue counts, fixed for the whole stream
+        """
+        self.spec = STREAM_AGGREGATES[table_name]
+        self.now = now
+        self.row_count = 0
+        self.counts = {}
+        self.sums = {}
+        self.non_null = {}
+        self.minimum = {}
+        self.maximum = {}
+        self.levels = {}
+
+    def add(self, chunk: pd.DataFrame):
+        """Fold one chunk of rows into the running aggregates"""
+        self.row_count += len(chunk)
+        for name, kind, fn in self.spec:
+            if kind == 'rows':
+                continue
+            values = fn(chunk, self.now)
+            if kind in ('count', 'ratio'):
+                self.counts[name] = self.counts.get(name, 0) + int(values.sum())
+            elif kind == 'value_counts':
+                levels = self.levels.setdefault(name, {})
+                for level, count in values.value_counts().items():
+                    levels[level] = levels.get(level, 0) + int(count)
+            else:
+                values = pd.to_numeric(values, errors='coerce').dropna()
+                if values.empty:
+                    continue
+                if kind == 'mean':
+                    # Each chunk's fsum plus its rounding residual: the final fsum over these
+                    # equals _mean()'s whole-column sum whatever the itersize
+                    total = math.fsum(values)
+                    self.sums.setdefault(name, []).extend([total, math.fsum(np.append(values.to_numpy(dtype=float), -total))])
+                else:
+                    # Integer columns stay integral, as Series.sum() keeps them
+                    self.sums.setdefault(name, []).append(values.sum())
+                self.non_null[name] = self.non_null.get(name, 0) + len(values)
+                self.minimum[name] = min(self.minimum.get(name, values.min()), values.min())
+                self.maximum[name] = max(self.maximum.get(name, values.max()), values.max())
+
+    def result(self) -> Dict[str, Any]:
+        """Aggregates in the shape fetch_aggregates_from_tables() returns"""
+        aggregates = {'row_count': self.row_count}
+        for name, kind, _ in self.spec:
+            if kind == 'rows':
+                aggregates[name] = self.row_count
+            elif kind == 'count':
+                aggregates[name] = self.counts.get(name, 0)
+            elif kind == 'ratio':
+                aggregates[name] = self.counts.get(name, 0) / self.row_count if self.row_count else np.nan
+            elif kind == 'value_counts':
+                aggregates[name] = self.levels.get(name, {})
+            elif kind == 'mean':
+                aggregates[name] = math.fsum(self.sums[name]) / self.non_null[name] if name in self.sums else np.nan
+            else:
+                aggregates[name] = sum(self.sums.get(name, [0]))
+        return aggregates
+
+    def ranges(self) -> Dict[str, List[float]]:
+        """Minimum and maximum seen for each mean or sum column"""
+        return {name: [float(self.minimum[name]), float(self.maximum[name])] for name in self.minimum}
+
+
+# Trained predictive models, one directory per tenant (git-ignored)
+MODEL_REGISTRY_DIR = os.getenv('ML_MODEL_DIR', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'models', 'predictive'))
+
+# Targets train_predictive_models() fits and the predict entry point loads
+MODEL_TARGETS = ['risk_exposure', 'compliance_level', 'incident_likelihood', 'threat_likelihood']
+
+
+class ModelRegistry:
+    """
+    On-disk store of trained models, one joblib artifact per tenant, target,
+    feature schema hash and training-data fingerprint, so a run over unchanged
+    data loads its models instead of fitting them again
+    """
+
+    def __init__(self, directory: str = MODEL_REGISTRY_DIR, keep: int = 3, max_age_days: float = 30):
+        """
+        Args:
+            directory: Registry root; each tenant gets a subdirectory
+            keep: Most recently used artifacts kept per tenant and target
+            max_age_days: Artifacts unused for longer than this are pruned
+        """
+        self.directory = directory
+        self.keep = max(1, keep)
+        self.max_age_days = max_age_days
+
+    def tenant_dir(self, tenant: str) -> str:
+        """Directory of a tenant's artifacts, named readably and collision-free"""
+        slug = re.sub(r'[^A-Za-z0-9_.-]+', '_', tenant).strip('_')[:60]
+        return os.path.join(self.directory, f"{slug}-{hashlib.sha1(tenant.encode('utf-8')).hexdigest()[:8]}")
+
+    @staticmethod
+    def schema_hash(features_df: pd.DataFrame, model) -> str:
+        """Hash of the feature columns and the estimator configuration a model was fitted with"""
+        schema = {
+            'columns': list(features_df.columns),
+            'dtypes': [str(dtype) for dtype in features_df.dtypes],
+            'estimator': type(model).__name__,
+            'params': model.get_params()
+        }
+        return hashlib.sha1(json.dumps(schema, sort_keys=True, default=str).encode('utf-8')).hexdigest()
+
+    @staticmethod
+    def fingerprint(features_df: pd.DataFrame, target: pd.Series) -> str:
+        """Hash of the training data: target values and the feature values that are not
+        relative to the current time (see TIME_RELATIVE_FEATURES)"""
+        stable = features_df.drop(columns=[c for c in features_df.columns if c in TIME_RELATIVE_FEATURES])
+        digest = hashlib.sha1(stable.to_numpy(dtype=np.float64).tobytes())
+        digest.update(np.asarray(target, dtype=np.float64).tobytes())
+        return digest.hexdigest()
+
+    def path(self, tenant: str, target: str, schema_hash: str, fingerprint: str) -> str:
+        """Artifact path for one tenant, target, schema and fingerprint"""
+        return os.path.join(self.tenant_dir(tenant), f"{target}-{schema_hash[:12]}-{fingerprint[:16]}.joblib")
+
+    def load(self, tenant: str, target: str, schema_hash: str, fingerprint: str) -> Optional[Any]:
+        """The stored model for exactly this key, or None; a hit counts as a use for pruning"""
+        path = self.path(tenant, target, schema_hash, fingerprint)
+        if not os.path.exists(path):
+            return None
+        try:
+            artifact = joblib.load(path)
+        except Exception as e:
+            print(f"⚠️  Ignoring unreadable model artifact {path}: {e}")
+            return None
+        os.utime(path)
+        return artifact['model']
+
+    def latest(self, tenant: str, target: str, columns: List[str]) -> Optional[Any]:
+        """The most recently used model for a target that was fitted on these feature columns,
+        whatever its training data; for inference without refitting"""
+        directory = self.tenant_dir(tenant)
+        if not os.path.isdir(directory):
+            return None
+        candidates = sorted(
+            ((os.path.getmtime(os.path.join(directory, name)), os.path.join(directory, name))
+             for name in os.listdir(directory) if name.startswith(f"{target}-") and name.endswith('.joblib')),
+            reverse=True
+        )
+        for _, path in candidates:
+            try:
+                artifact = joblib.load(path)
+            except Exception as e:
+                print(f"⚠️  Ignoring unreadable model artifact {path}: {e}")
+                continue
+            if artifact.get('columns') == columns:
+                os.utime(path)
+                return artifact['model']
+        return None
+
+    def save(self, tenant: str, target: str, schema_hash: str, fingerprint: str, model,
+             columns: List[str]) -> str:
+        """Write a fitted model atomically and prune the tenant's stale artifacts"""
+        path = self.path(tenant, target, schema_hash, fingerprint)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp = f"{path}.{os.getpid()}.tmp"
+        joblib.dump({
+            'model': model,
+            'tenant': tenant,
+            'target': target,
+            'schema_hash': schema_hash,
+            'fingerprint': fingerprint,
+            'columns': columns,
+            'trained_at': datetime.now().isoformat()
+        }, tmp)
+        os.replace(tmp, path)
+        self.prune(tenant)
+        return path
+
+    def prune(self, tenant: str) -> int:
+        """Remove artifacts beyond the `keep` most recently used per target, and any unused for max_age_days"""
+        directory = self.tenant_dir(tenant)
+        if not os.path.isdir(directory):
+            return 0
+        by_target: Dict[str, List[Tuple[float, str]]] = {}
+        for name in os.listdir(directory):
+            if name.endswith('.joblib'):
+                path = os.path.join(directory, name)
+                by_target.setdefault(name.rsplit('-', 2)[0], []).append((os.path.getmtime(path), path))
+
+        cutoff = time.time() - self.max_age_days * 86400
+        removed = 0
+        for artifacts in by_target.values():
+            artifacts.sort(reverse=True)
+            for rank, (used_at, path) in enumerate(artifacts):
+                if rank >= self.keep or used_at < cutoff:
+                    try:
+                        os.remove(path)
+                        removed += 1
+                    except OSError:
+                        pass
+        if removed:
+            print(f"🧹 Pruned {removed} stale model artifacts for {tenant}")
+        return removed
+
 
 class GRCPredictiveAnalyzer:
     """
     Comprehensive predictive analysis system for GRC (Governance, Risk, Compliance) data
     """
 
-    def __init__(self, db_config: Dict[str, str]):
+    def __init__(self, db_config: Dict[str, str], catalog: SchemaCatalog = None, pool_size: int = 4,
+                 itersize: int = 5000, registry: ModelRegistry = None):
         """
         Initialize the predictive analyzer with database configuration
 
         Args:
             db_config: Database connection parameters
+            catalog: Schema catalog for table/column checks (defaults to the process-wide one)
+            pool_size: Connections used to read tables concurrently (1 reads them one by one)
+            itersize: Rows per round trip and per folded chunk in the streaming fetch mode
+            registry: Store of trained models reused while the training data is unchanged
+                (defaults to one in MODEL_REGISTRY_DIR; set self.registry to None to always fit)
         """
         self.db_config = db_config
         self.models = {}
         self.scalers = {}
         self.encoders = {}
         self.connection = None
+        self.catalog = catalog or default_catalog
+        self.pool_size = max(1, pool_size)
+        self.pool = None
+        self.table_latency = {}
+        self.itersize = max(1, itersize)
+        self.column_ranges = {}
+        self.registry = registry if registry is not None else ModelRegistry()
+        self.tenant = None  # registry key; None while working on sample data, whose models are not kept
+        self.model_sources = {}
 
     def connect_database(self):
         """Establish database connection"""
@@ -73,91 +564,192 @@ class GRCPredictiveAnalyzer:
 
     def disconnect_database(self):
         """Close database connection"""
+        if self.pool:
+            self.pool.closeall()
+            self.pool = None
         if self.connection:
             self.connection.close()
             print("🔌 Database connection closed")
 
+    def connection_pool(self) -> ThreadedConnectionPool:
+        """Pool of up to pool_size connections for concurrent table reads, opened on first use"""
+        if self.pool is None:
+            self.pool = ThreadedConnectionPool(1, self.pool_size, cursor_factory=RealDictCursor, **self.db_config)
+        return self.pool
+
+    def run_per_table(self, work, tables: Dict[str, List[str]], action: str) -> Dict[str, Any]:
+        """
+        Run work(connection, table_name, columns) for every table concurrently over
+        the connection pool, recording each table's latency in self.table_latency
+
+        Each table runs in its own transaction on its own connection, so a failure
+        neither aborts nor waits on the others
+
+        Args:
+            work: Callable returning the table's result
+            tables: Table name -> columns to read
+            action: Verb used in failure messages
+
+        Returns:
+            Dictionary of table name -> result (None when the table failed)
+        """
+        pool = None
+        if self.pool_size > 1 and len(tables) > 1:
+            try:
+                pool = self.connection_pool()
+            except Exception as e:
+                print(f"⚠️  Connection pool unavailable, reading tables sequentially: {e}")
+
+        def run(table_name: str, columns: List[str]):
+            started = time.perf_counter()
+            conn = None
+            try:
+                conn = pool.getconn() if pool else self.connection
+                result = work(conn, table_name, columns)
+                conn.rollback()
+            except Exception as e:
+                print(f"⚠️  Failed to {action} {table_name}: {e}")
+                result = None
+                if conn is not None and not conn.closed:
+                    conn.rollback()
+            finally:
+                if pool and conn is not None:
+                    pool.putconn(conn, close=bool(conn.closed))
+            self.table_latency[table_name] = time.perf_counter() - started
+            return result
+
+        started = time.perf_counter()
+        # Never more workers than pooled connections: getconn() raises rather than waits
+        with ThreadPoolExecutor(max_workers=self.pool_size if pool else 1) as executor:
+            futures = {table_name: executor.submit(run, table_name, columns) for table_name, columns in tables.items()}
+            results = {table_name: future.result() for table_name, future in futures.items()}
+        if tables:
+            print(f"⏱️  {len(tables)} tables read in {time.perf_counter() - started:.2f}s "
+                  f"(sum of table latencies {sum(self.table_latency[t] for t in tables):.2f}s)")
+        return results
+
     def fetch_data_from_tables(self) -> Dict[str, pd.DataFrame]:
         """
-        Fetch data from all relevant GRC tables
+        Fetch data from all relevant GRC tables, concurrently over the connection pool
 
         Returns:
             Dictionary containing DataFrames for each table
         """
-        tables_queries = {
-            'risks': """
-                SELECT id, risk_id, title, description, risk_level, status, impact_level,
-                       likelihood_level, risk_score, remediation_status, created_at, updated_at,
-                       due_date, assigned_to, department_id
-                FROM risks
-            """,
-            'incidents': """
-                SELECT id, incident_id, title, description, severity, status, impact_level,
-                       created_at, resolved_at, assigned_to, department_id, category
-                FROM incidents
-            """,
-            'vulnerabilities': """
-                SELECT id, vulnerability_id, title, description, severity, status,
-                       cvss_score, remediation_status, discovered_at, due_date,
-                       affected_assets, category, threat_level
-                FROM vulnerabilities
-            """,
-            'controls': """
-                SELECT id, control_id, title, description, control_type, status,
-                       implementation_status, effectiveness_score, last_assessment,
-                       next_review_date, department_id
-                FROM controls
-            """,
-            'compliance': """
-                SELECT id, compliance_id, framework_name, compliance_score, status,
-                       last_assessment, next_audit_date, critical_findings,
-                       department_id, overall_compliance_percentage
-                FROM compliance
-            """,
-            'findings': """
-                SELECT id, finding_id, title, description, severity, status,
-                       remediation_status, created_at, due_date, assigned_to,
-                       related_risk_id, related_asset_id
-                FROM findings
-            """,
-            'assessments': """
-                SELECT id, assessment_id, title, assessment_type, status,
-                       overall_score, completion_percentage, start_date, end_date,
-                       department_id, assessor_id
-                FROM assessments
-            """,
-            'threats': """
-                SELECT id, threat_id, title, description, threat_level, status,
-                       likelihood_score, impact_score, remediation_status,
-                       discovered_at, last_seen, category
-                FROM threats
-            """,
-            'technology_risks': """
-                SELECT id, technology_risk_id, title, description, risk_level,
-                       technology_type, status, impact_level, remediation_status,
-                       identified_at, department_id
-                FROM technology_risks
-            """,
-            'assets': """
-                SELECT id, asset_id, name, asset_type, criticality_level,
-                       location, department_id, status, last_assessment,
-                       compliance_status, risk_level
-                FROM assets
-            """
+        data_frames = {}
+        available = {}
+
+        for table_name, columns in TABLE_COLUMNS.items():
+            # Checked against the tenant's cached catalog: a missing table or
+            # column is skipped up front instead of failing
+            missing = self.catalog.missing_columns(self.connection, table_name, columns)
+            if missing:
+                print(f"⚠️  Skipping {table_name}: missing {', '.join(missing)}")
+                continue
+            available[table_name] = columns
+
+        def fetch(conn, table_name: str, columns: List[str]) -> pd.DataFrame:
+            return pd.read_sql_query(f"SELECT {', '.join(columns)} FROM {table_name}", conn)
+
+        fetched = self.run_per_table(fetch, available, 'fetch')
+        for table_name in TABLE_COLUMNS:
+            df = fetched.get(table_name)
+            if df is not None:
+                print(f"✅ Fetched {len(df)} records from {table_name} in {self.table_latency[table_name]:.2f}s")
+            data_frames[table_name] = df if df is not None else pd.DataFrame()
+
+        return data_frames
+
+    def fetch_aggregates_from_tables(self) -> Dict[str, Dict[str, Any]]:
+        """
+        Compute the per-table aggregates in the database, one query per table,
+        so only scalars cross the wire however large the tables are
+
+        Returns:
+            Dictionary of aggregate name -> value for each table (empty when skipped or failed)
+        """
+        # The pandas path measures ages against the client clock, so this does too
+        now = datetime.now()
+        params = {
+            'now': now,
+            'overdue_before': now - timedelta(days=1),
+            'recent_since': now - timedelta(days=30)
         }
+        aggregates = {}
+        available = {}
+
+        for table_name, columns in TABLE_COLUMNS.items():
+            missing = self.catalog.missing_columns(self.connection, table_name, columns)
+            if missing:
+                print(f"⚠️  Skipping {table_name}: missing {', '.join(missing)}")
+                continue
+            available[table_name] = columns
+
+        def aggregate(conn, table_name: str, columns: List[str]) -> Dict[str, Any]:
+            expressions = [('row_count', "COUNT(*)")] + FEATURE_AGGREGATES[table_name] + SUPPORT_AGGREGATES.get(table_name, [])
+            select = ",\n                       ".join(f"{expression} AS {name}" for name, expression in expressions)
+            with conn.cursor() as cur:
+                cur.execute(f"SELECT {select} FROM {table_name}", params)
+                row = cur.fetchone()
+            return {
+                name: float(value) if isinstance(value, Decimal) else (np.nan if value is None else value)
+                for name, value in row.items()
+            }
 
-        data_frames = {}
+        computed = self.run_per_table(aggregate, available, 'aggregate')
+        for table_name in TABLE_COLUMNS:
+            values = computed.get(table_name)
+            if values is not None:
+                print(f"✅ Aggregated {values['row_count']} records from {table_name} in {self.table_latency[table_name]:.2f}s")
+            aggregates[table_name] = values or {}
 
-        for table_name, query in tables_queries.items():
-            try:
-                df = pd.read_sql_query(query, self.connection)
-                data_frames[table_name] = df
-                print(f"✅ Fetched {len(df)} records from {table_name}")
-            except Exception as e:
-                print(f"⚠️  Failed to fetch {table_name}: {e}")
-                data_frames[table_name] = pd.DataFrame()
+        return aggregates
 
-        return data_frames
+    def stream_aggregates_from_tables(self) -> Dict[str, Dict[str, Any]]:
+        """
+        Compute the per-table aggregates client-side without materializing tables:
+        rows arrive through named server-side cursors, itersize at a time, and each
+        chunk is folded into a StreamingAggregator and dropped
+
+        Returns:
+            Dictionary of aggregate name -> value for each table (empty when skipped or failed)
+        """
+        # Fixed once so every chunk measures ages against the same moment
+        now = pd.to_datetime('today')
+        aggregates = {}
+        available = {}
+        self.column_ranges = {}
+
+        for table_name, columns in TABLE_COLUMNS.items():
+            missing = self.catalog.missing_columns(self.connection, table_name, columns)
+            if missing:
+                print(f"⚠️  Skipping {table_name}: missing {', '.join(missing)}")
+                continue
+            available[table_name] = columns
+
+        def stream(conn, table_name: str, columns: List[str]) -> StreamingAggregator:
+            aggregator = StreamingAggregator(table_name, now)
+            # Plain tuple rows, built into frames the way read_sql_query builds them
+            with conn.cursor(name=f"grc_stream_{table_name}", cursor_factory=psycopg2.extensions.cursor) as cur:
+                cur.itersize = self.itersize
+                cur.execute(f"SELECT {', '.join(columns)} FROM {table_name}")
+                while True:
+                    rows = cur.fetchmany(self.itersize)
+                    if not rows:
+                        break
+                    aggregator.add(pd.DataFrame.from_records(rows, columns=columns, coerce_float=True))
+            return aggregator
+
+        streamed = self.run_per_table(stream, available, 'stream')
+        for table_name in TABLE_COLUMNS:
+            aggregator = streamed.get(table_name)
+            if aggregator is None:
+                aggregates[table_name] = {}
+                continue
+            aggregates[table_name] = aggregator.result()
+            self.column_ranges.update({f"{table_name}.{name}": bounds for name, bounds in aggregator.ranges().items()})
+            print(f"✅ Streamed {aggregator.row_count} records from {table_name} in {self.table_latency[table_name]:.2f}s")
+
+        return aggregates
 
     def generate_sample_data(self) -> Dict[str, pd.DataFrame]:
         """
@@ -252,7 +844,7 @@ class GRCPredictiveAnalyzer:
                 'total_risks': len(risk_df),
                 'open_risks': len(risk_df[risk_df['status'] != 'closed']),
                 'high_risk_count': len(risk_df[risk_df['risk_level'].isin(['high', 'critical'])]),
-                'avg_risk_score': risk_df['risk_score'].mean(),
+                'avg_risk_score': _mean(risk_df['risk_score']),
                 'overdue_risks': len(risk_df[risk_df['risk_overdue_days'] > 0]),
                 'remediated_risks': len(risk_df[risk_df['remediation_status'] == 'completed'])
             })
@@ -266,7 +858,7 @@ class GRCPredictiveAnalyzer:
                 'total_incidents': len(incident_df),
                 'open_incidents': len(incident_df[incident_df['status'] != 'resolved']),
                 'critical_incidents': len(incident_df[incident_df['severity'].isin(['critical', 'high'])]),
-                'avg_incident_age': incident_df['incident_age_days'].mean(),
+                'avg_incident_age': _mean(incident_df['incident_age_days']),
                 'incident_resolution_rate': len(incident_df[incident_df['status'] == 'resolved']) / len(incident_df) if len(incident_df) > 0 else 0
             })
 
@@ -280,7 +872,7 @@ class GRCPredictiveAnalyzer:
                 'total_vulnerabilities': len(vuln_df),
                 'open_vulnerabilities': len(vuln_df[vuln_df['status'] != 'closed']),
                 'critical_vulnerabilities': len(vuln_df[vuln_df['severity'].isin(['critical', 'high'])]),
-                'avg_cvss_score': vuln_df['cvss_score'].mean(),
+                'avg_cvss_score': _mean(vuln_df['cvss_score']),
                 'overdue_vulnerabilities': len(vuln_df[vuln_df['vuln_overdue_days'] > 0]),
                 'remediated_vulnerabilities': len(vuln_df[vuln_df['remediation_status'] == 'completed'])
             })
@@ -295,7 +887,7 @@ class GRCPredictiveAnalyzer:
                 'total_controls': len(control_df),
                 'implemented_controls': len(control_df[control_df['implementation_status'] == 'implemented']),
                 'effective_controls': len(control_df[control_df['effectiveness_score'] >= 80]),
-                'avg_control_effectiveness': control_df['effectiveness_score'].mean(),
+                'avg_control_effectiveness': _mean(control_df['effectiveness_score']),
                 'overdue_control_reviews': len(control_df[control_df['control_overdue_days'] > 0])
             })
 
@@ -303,8 +895,8 @@ class GRCPredictiveAnalyzer:
         if not data_frames['compliance'].empty:
             compliance_df = data_frames['compliance'].copy()
             features.update({
-                'avg_compliance_score': compliance_df['compliance_score'].mean(),
-                'overall_compliance_percentage': compliance_df['overall_compliance_percentage'].mean(),
+                'avg_compliance_score': _mean(compliance_df['compliance_score']),
+                'overall_compliance_percentage': _mean(compliance_df['overall_compliance_percentage']),
                 'critical_compliance_findings': compliance_df['critical_findings'].sum(),
                 'compliant_frameworks': len(compliance_df[compliance_df['compliance_score'] >= 80])
             })
@@ -329,8 +921,8 @@ class GRCPredictiveAnalyzer:
             features.update({
                 'total_assessments': len(assessment_df),
                 'completed_assessments': len(assessment_df[assessment_df['status'] == 'completed']),
-                'avg_assessment_score': assessment_df['overall_score'].mean(),
-                'assessment_completion_rate': assessment_df['completion_percentage'].mean()
+                'avg_assessment_score': _mean(assessment_df['overall_score']),
+                'assessment_completion_rate': _mean(assessment_df['completion_percentage'])
             })
 
         # 8. Threat-related features
@@ -340,8 +932,8 @@ class GRCPredictiveAnalyzer:
                 'total_threats': len(threat_df),
                 'active_threats': len(threat_df[threat_df['status'] == 'active']),
                 'high_threats': len(threat_df[threat_df['threat_level'].isin(['high', 'critical'])]),
-                'avg_threat_likelihood': threat_df['likelihood_score'].mean(),
-                'avg_threat_impact': threat_df['impact_score'].mean()
+                'avg_threat_likelihood': _mean(threat_df['likelihood_score']),
+                'avg_threat_impact': _mean(threat_df['impact_score'])
             })
 
         # 9. Technology risk features
@@ -389,7 +981,7 @@ class GRCPredictiveAnalyzer:
             risk_df = data_frames['risks']
             # Calculate risk exposure score
             risk_exposure = (
-                risk_df['risk_score'].mean() * 0.4 +
+                _mean(risk_df['risk_score']) * 0.4 +
                 len(risk_df[risk_df['status'] != 'closed']) * 10 * 0.3 +
                 len(risk_df[risk_df['remediation_status'] != 'completed']) * 5 * 0.3
             )
@@ -398,7 +990,7 @@ class GRCPredictiveAnalyzer:
         # Compliance level target
         if not data_frames['compliance'].empty:
             compliance_df = data_frames['compliance']
-            compliance_level = compliance_df['compliance_score'].mean()
+            compliance_level = _mean(compliance_df['compliance_score'])
             targets['compliance_level'] = pd.Series([compliance_level])
 
         # Incident likelihood target (convert to binary classification)
@@ -427,6 +1019,68 @@ class GRCPredictiveAnalyzer:
 
         return targets
 
+    def feature_engineering_from_aggregates(self, aggregates: Dict[str, Dict[str, Any]]) -> pd.DataFrame:
+        """
+        Build the feature_engineering() DataFrame from database-side aggregates
+
+        Args:
+            aggregates: Per-table aggregates from fetch_aggregates_from_tables()
+
+        Returns:
+            Processed DataFrame with engineered features
+        """
+        print("🔧 Performing feature engineering from aggregates...")
+
+        features = {}
+        for table_name, expressions in FEATURE_AGGREGATES.items():
+            table_aggregates = aggregates.get(table_name, {})
+            # Same rule as the row path: an empty table contributes no features
+            if table_aggregates.get('row_count'):
+                features.update({name: table_aggregates[name] for name, _ in expressions})
+
+        master_df = pd.DataFrame([features])
+        master_df = master_df.fillna(0)
+
+        print("✅ Feature engineering completed")
+        return master_df
+
+    def create_target_variables_from_aggregates(self, aggregates: Dict[str, Dict[str, Any]]) -> Dict[str, pd.Series]:
+        """
+        Create the create_target_variables() targets from database-side aggregates
+
+        Args:
+            aggregates: Per-table aggregates from fetch_aggregates_from_tables()
+
+        Returns:
+            Dictionary of target variables
+        """
+        targets = {}
+
+        risks = aggregates.get('risks', {})
+        if risks.get('row_count'):
+            risk_exposure = (
+                risks['avg_risk_score'] * 0.4 +
+                risks['open_risks'] * 10 * 0.3 +
+                risks['unremediated_risks'] * 5 * 0.3
+            )
+            targets['risk_exposure'] = pd.Series([min(risk_exposure, 100)])  # Cap at 100
+
+        compliance = aggregates.get('compliance', {})
+        if compliance.get('row_count'):
+            targets['compliance_level'] = pd.Series([compliance['avg_compliance_score']])
+
+        incidents = aggregates.get('incidents', {})
+        if incidents.get('row_count'):
+            incident_score = min((incidents['recent_incidents'] * 2 + incidents['open_incidents'] * 5), 100)
+            targets['incident_likelihood'] = pd.Series([1 if incident_score > 70 else 0])
+
+        vulnerabilities = aggregates.get('vulnerabilities', {})
+        if vulnerabilities.get('row_count'):
+            threat_score = min((vulnerabilities['open_vulnerabilities'] * 3 + vulnerabilities['critical_vulnerabilities'] * 5), 100)
+            targets['threat_likelihood'] = pd.Series([1 if threat_score > 70 else 0])
+
+        return targets
+
     def train_predictive_models(self, features_df: pd.DataFrame, targets: Dict[str, pd.Series]):
         """
         Train multiple predictive models for different risk metrics
@@ -437,6 +1091,9 @@ class GRCPredictiveAnalyzer:
         """
         print("🤖 Training predictive models...")
 
+        # Random sample data never recurs, so its models are neither looked up nor saved
+        registry = self.registry if self.tenant is not None else None
+
         models_config = {
             'risk_exposure': {
                 'model': RandomForestRegressor(n_estimators=100, random_state=42),
@@ -465,6 +1122,17 @@ class GRCPredictiveAnalyzer:
                     X = features_df
                     y = target_series
 
+                    # Unchanged tenant data, features and model settings: load instead of fitting
+                    if registry is not None:
+                        schema_hash = registry.schema_hash(X, model_config['model'])
+                        fingerprint = registry.fingerprint(X, y)
+                        stored = registry.load(self.tenant, target_name, schema_hash, fingerprint)
+                        if stored is not None:
+                            self.models[target_name] = stored
+                            self.model_sources[target_name] = 'registry'
+                            print(f"♻️  {target_name} model loaded from registry (training data unchanged)")
+                            continue
+
                     # For small datasets, duplicate data to improve training
                     if len(X) < 5:
                         print(f"⚠️  Very small dataset for {target_name}, duplicating data")
@@ -494,6 +1162,10 @@ class GRCPredictiveAnalyzer:
 
                     # Store trained model
                     self.models[target_name] = model_config['model']
+                    self.model_sources[target_name] = 'trained'
+                    if registry is not None:
+                        registry.save(self.tenant, target_name, schema_hash, fingerprint,
+                                           model_config['model'], list(features_df.columns))
 
                     print(f"✅ {target_name} model trained successfully")
 
@@ -608,10 +1280,14 @@ class GRCPredictiveAnalyzer:
 
         return insights
 
-    def generate_advanced_insights(self, features_df: pd.DataFrame, predictions: Dict[str, Any], data_frames: Dict[str, pd.DataFrame]) -> Dict[str, Any]:
+    def generate_advanced_insights(self, features_df: pd.DataFrame, predictions: Dict[str, Any], data_frames: Dict[str, pd.DataFrame],
+                                   aggregates: Dict[str, Dict[str, Any]] = None) -> Dict[str, Any]:
         """
         Generate advanced insights with detailed reasoning and analysis
+
+        Row-level analyses read data_frames; without rows they fall back to aggregates
         """
+        aggregates = aggregates or {}
         advanced_insights = {
             'risk_drivers': {},
             'predictive_reasoning': {},
@@ -631,6 +1307,15 @@ class GRCPredictiveAnalyzer:
                 'overdue_critical_risks': len(risk_df[(risk_df['risk_level'] == 'critical') & (pd.to_datetime(risk_df['due_date']) < pd.to_datetime('today'))])
             }
             advanced_insights['risk_drivers'] = risk_drivers
+        elif aggregates.get('risks', {}).get('row_count'):
+            risks = aggregates['risks']
+            level_counts = risks['risk_level_counts'] if isinstance(risks['risk_level_counts'], dict) else {}
+            advanced_insights['risk_drivers'] = {
+                'top_risk_categories': dict(sorted(level_counts.items(), key=lambda item: item[1], reverse=True)),
+                'remediation_effectiveness': risks['remediated_risks'] / risks['row_count'],
+                'aging_risks': risks['high_risk_count'],
+                'overdue_critical_risks': risks['overdue_critical_risks']
+            }
 
         # Predictive reasoning for each model
         for metric, prediction_data in predictions.items():
@@ -752,10 +1437,14 @@ class GRCPredictiveAnalyzer:
 
         return reasoning
 
-    def generate_visualization_data(self, features_df: pd.DataFrame, predictions: Dict[str, Any], data_frames: Dict[str, pd.DataFrame]) -> Dict[str, Any]:
+    def generate_visualization_data(self, features_df: pd.DataFrame, predictions: Dict[str, Any], data_frames: Dict[str, pd.DataFrame],
+                                    aggregates: Dict[str, Dict[str, Any]] = None) -> Dict[str, Any]:
         """
         Generate data for advanced visualizations
+
+        Distributions read data_frames; without rows they fall back to aggregates
         """
+        aggregates = aggregates or {}
         viz_data = {
             'risk_distribution': {},
             'trend_charts': {},
@@ -777,6 +1466,14 @@ class GRCPredictiveAnalyzer:
                 ],
                 'colors': ['#22c55e', '#eab308', '#f97316', '#ef4444']
             }
+        elif aggregates.get('risks', {}).get('row_count'):
+            level_counts = aggregates['risks']['risk_level_counts']
+            level_counts = level_counts if isinstance(level_counts, dict) else {}
+            viz_data['risk_distribution'] = {
+                'labels': ['Low', 'Medium', 'High', 'Critical'],
+                'values': [level_counts.get(level, 0) for level in ['low', 'medium', 'high', 'critical']],
+                'colors': ['#22c55e', '#eab308', '#f97316', '#ef4444']
+            }
 
         # Vulnerability severity distribution
         if not data_frames['vulnerabilities'].empty:
@@ -791,6 +1488,14 @@ class GRCPredictiveAnalyzer:
                 ],
                 'colors': ['#22c55e', '#eab308', '#f97316', '#ef4444']
             }
+        elif aggregates.get('vulnerabilities', {}).get('row_count'):
+            severity_counts = aggregates['vulnerabilities']['severity_counts']
+            severity_counts = severity_counts if isinstance(severity_counts, dict) else {}
+            viz_data['vulnerability_distribution'] = {
+                'labels': ['Low', 'Medium', 'High', 'Critical'],
+                'values': [severity_counts.get(level, 0) for level in ['low', 'medium', 'high', 'critical']],
+                'colors': ['#22c55e', '#eab308', '#f97316', '#ef4444']
+            }
 
         # Prediction confidence visualization
         viz_data['prediction_confidence'] = {}
@@ -1002,13 +1707,132 @@ class GRCPredictiveAnalyzer:
 
         return round(sum(score_components), 1)
 
-    def run_complete_analysis(self) -> Dict[str, Any]:
+    def tenant_key(self) -> str:
+        """
+        Registry key of the connected tenant: database and schema name, so train and
+        predict runs agree on it however the host is spelled in their connection settings
+        """
+        with self.connection.cursor() as cursor:
+            cursor.execute("SELECT current_database() AS database, current_schema() AS schema")
+            row = cursor.fetchone()
+        return f"{row['database']}.{row['schema']}"
+
+    def load_database_data(self, fetch_mode: str) -> Tuple[Dict[str, pd.DataFrame], Optional[Dict[str, Dict[str, Any]]], bool]:
+        """
+        Read the connected tenant's data in the given fetch mode
+
+        Args:
+            fetch_mode: 'rows', 'aggregate' or 'stream' (see run_complete_analysis)
+
+        Returns:
+            (data_frames, aggregates, has_data); aggregates is None in rows mode and
+            data_frames are empty otherwise
+        """
+        self.tenant = self.tenant_key()
+
+        if fetch_mode in ('aggregate', 'stream'):
+            # Aggregate in the database, or fold streamed chunks; no table is held in memory
+            if fetch_mode == 'aggregate':
+                aggregates = self.fetch_aggregates_from_tables()
+            else:
+                aggregates = self.stream_aggregates_from_tables()
+            data_frames = {table_name: pd.DataFrame() for table_name in TABLE_COLUMNS}
+            return data_frames, aggregates, any(values.get('row_count') for values in aggregates.values())
+
+        # Fetch data from database
+        data_frames = self.fetch_data_from_tables()
+        return data_frames, None, not all(df.empty for df in data_frames.values())
+
+    def build_features(self, data_frames: Dict[str, pd.DataFrame],
+                       aggregates: Optional[Dict[str, Dict[str, Any]]]) -> Tuple[pd.DataFrame, Dict[str, pd.Series]]:
+        """
+        Engineer features and targets from rows or, when given, aggregates
+
+        Returns:
+            (features_df, targets)
+        """
+        if aggregates is not None:
+            return self.feature_engineering_from_aggregates(aggregates), self.create_target_variables_from_aggregates(aggregates)
+        return self.feature_engineering(data_frames), self.create_target_variables(data_frames)
+
+    def compile_results(self, features_df: pd.DataFrame, predictions: Dict[str, Any], data_frames: Dict[str, pd.DataFrame],
+                        aggregates: Optional[Dict[str, Dict[str, Any]]], mode: str, fetch_mode: str,
+                        started: float) -> Dict[str, Any]:
+        """
+        Derive insights, visualization data and summaries from features and predictions;
+        nothing here fits a model
+
+        Args:
+            mode: 'production', 'demo' or 'predict', reported in model_performance
+            fetch_mode: How the data was read ('sample' for demo data)
+            started: time.perf_counter() at the start of the run
+
+        Returns:
+            Complete analysis results
+        """
+        if aggregates is not None:
+            record_counts = [values.get('row_count', 0) for values in aggregates.values()]
+        else:
+            record_counts = [len(df) for df in data_frames.values()]
+
+        return {
+            'timestamp': datetime.now().isoformat(),
+            'predictions': predictions,
+            'insights': self.generate_insights(features_df, predictions),
+            # Advanced reasoning and detailed analysis
+            'advanced_insights': self.generate_advanced_insights(features_df, predictions, data_frames, aggregates),
+            'visualization_data': self.generate_visualization_data(features_df, predictions, data_frames, aggregates),
+            # Risk correlations and trends
+            'correlation_analysis': self.analyze_correlations(features_df),
+            # Predictive confidence and uncertainty
+            'uncertainty_analysis': self.analyze_uncertainty(predictions),
+            # Historical trends (simulated for demo)
+            'trend_analysis': self.generate_trend_analysis(features_df),
+            'feature_summary': {
+                'total_risks': int(features_df.get('total_risks', [0])[0]),
+                'open_risks': int(features_df.get('open_risks', [0])[0]),
+                'open_incidents': int(features_df.get('open_incidents', [0])[0]),
+                'open_vulnerabilities': int(features_df.get('open_vulnerabilities', [0])[0]),
+                'overdue_items': int(features_df.get('overdue_risks', [0])[0] + features_df.get('overdue_vulnerabilities', [0])[0]),
+                'compliance_score': round(features_df.get('avg_risk_score', [0])[0], 2),
+                'remediated_risks': int(features_df.get('remediated_risks', [0])[0]),
+                'critical_vulnerabilities': int(features_df.get('critical_vulnerabilities', [0])[0]),
+                'incident_resolution_rate': round(features_df.get('incident_resolution_rate', [0])[0] * 100, 1),
+                'avg_cvss_score': round(features_df.get('avg_cvss_score', [0])[0], 2)
+            },
+            'model_performance': {
+                'models_trained': len(self.models),
+                'models_loaded_from_registry': [name for name, source in self.model_sources.items() if source == 'registry'],
+                'available_predictions': list(predictions.keys()),
+                'mode': mode,
+                'feature_count': len(features_df.columns),
+                'training_samples': len(features_df)
+            },
+            'data_source': 'sample_data' if mode == 'demo' else 'database',
+            'analysis_metadata': {
+                'data_tables_processed': len([count for count in record_counts if count]),
+                'total_records_processed': int(sum(record_counts)),
+                'fetch_mode': fetch_mode,
+                'table_fetch_seconds': {table_name: round(seconds, 3) for table_name, seconds in self.table_latency.items()},
+                'column_ranges': self.column_ranges,
+                'analysis_duration_seconds': round(time.perf_counter() - started, 3),
+                'ml_algorithms_used': ['RandomForest', 'GradientBoosting', 'LogisticRegression']
+            }
+        }
+
+    def run_complete_analysis(self, fetch_mode: str = 'rows') -> Dict[str, Any]:
         """
         Run the complete predictive analysis pipeline
 
+        Args:
+            fetch_mode: 'rows' fetches every table into pandas; 'aggregate' computes the
+                features in the database and transfers only per-table scalars; 'stream'
+                folds server-side cursor chunks into running aggregates in bounded memory
+
         Returns:
             Complete analysis results
         """
+        started = time.perf_counter()
         try:
             print("🚀 Starting GRC Predictive Analysis...")
 
@@ -1018,12 +1842,10 @@ class GRCPredictiveAnalyzer:
             if db_connected:
                 # Production mode with real data
                 print("🏭 Production mode: Using database data")
-
-                # Fetch data from database
-                data_frames = self.fetch_data_from_tables()
+                data_frames, aggregates, has_data = self.load_database_data(fetch_mode)
 
                 # Check if we got any data
-                if all(df.empty for df in data_frames.values()):
+                if not has_data:
                     print("⚠️  No data found in database, switching to demo mode")
                     db_connected = False
             else:
@@ -1032,13 +1854,11 @@ class GRCPredictiveAnalyzer:
             if not db_connected:
                 # Demo mode with sample data
                 print("🔧 Generating sample data for demonstration...")
+                aggregates = None
+                self.tenant = None
                 data_frames = self.generate_sample_data()
 
-            # Feature engineering
-            features_df = self.feature_engineering(data_frames)
-
-            # Create target variables
-            targets = self.create_target_variables(data_frames)
+            features_df, targets = self.build_features(data_frames, aggregates)
 
             # Train models
             self.train_predictive_models(features_df, targets)
@@ -1046,68 +1866,106 @@ class GRCPredictiveAnalyzer:
             # Generate predictions
             predictions = self.generate_predictions(features_df)
 
-            # Generate insights
-            insights = self.generate_insights(features_df, predictions)
+            results = self.compile_results(features_df, predictions, data_frames, aggregates,
+                                           'production' if db_connected else 'demo',
+                                           fetch_mode if db_connected else 'sample', started)
 
-            # Advanced reasoning and detailed analysis
-            advanced_insights = self.generate_advanced_insights(features_df, predictions, data_frames)
+            print("✅ Analysis completed successfully")
+            return results
 
-            # Visualization data
-            visualization_data = self.generate_visualization_data(features_df, predictions, data_frames)
+        except Exception as e:
+            print(f"❌ Analysis failed: {e}")
+            return {"error": str(e)}
 
-            # Risk correlations and trends
-            correlation_analysis = self.analyze_correlations(features_df)
+        finally:
+            self.disconnect_database()
 
-            # Predictive confidence and uncertainty
-            uncertainty_analysis = self.analyze_uncertainty(predictions)
+    def run_training(self, fetch_mode: str = 'aggregate') -> Dict[str, Any]:
+        """
+        Offline entry point: fit the tenant's models and persist them in the registry.
+        Models whose training data is unchanged are kept as they are
 
-            # Historical trends (simulated for demo)
-            trend_analysis = self.generate_trend_analysis(features_df)
-
-            # Compile comprehensive results
-            results = {
-                'timestamp': datetime.now().isoformat(),
-                'predictions': predictions,
-                'insights': insights,
-                'advanced_insights': advanced_insights,
-                'visualization_data': visualization_data,
-                'correlation_analysis': correlation_analysis,
-                'uncertainty_analysis': uncertainty_analysis,
-                'trend_analysis': trend_analysis,
-                'feature_summary': {
-                    'total_risks': int(features_df.get('total_risks', [0])[0]),
-                    'open_risks': int(features_df.get('open_risks', [0])[0]),
-                    'open_incidents': int(features_df.get('open_incidents', [0])[0]),
-                    'open_vulnerabilities': int(features_df.get('open_vulnerabilities', [0])[0]),
-                    'overdue_items': int(features_df.get('overdue_risks', [0])[0] + features_df.get('overdue_vulnerabilities', [0])[0]),
-                    'compliance_score': round(features_df.get('avg_risk_score', [0])[0], 2),
-                    'remediated_risks': int(features_df.get('remediated_risks', [0])[0]),
-                    'critical_vulnerabilities': int(features_df.get('critical_vulnerabilities', [0])[0]),
-                    'incident_resolution_rate': round(features_df.get('incident_resolution_rate', [0])[0] * 100, 1),
-                    'avg_cvss_score': round(features_df.get('avg_cvss_score', [0])[0], 2)
-                },
-                'model_performance': {
-                    'models_trained': len(self.models),
-                    'available_predictions': list(predictions.keys()),
-                    'mode': 'production' if db_connected else 'demo',
-                    'feature_count': len(features_df.columns),
-                    'training_samples': len(features_df)
-                },
-                'data_source': 'database' if db_connected else 'sample_data',
-                'analysis_metadata': {
-                    'data_tables_processed': len([k for k, v in data_frames.items() if not v.empty]),
-                    'total_records_processed': sum(len(df) for df in data_frames.values()),
-                    'analysis_duration_seconds': 0,  # Would be calculated in real implementation
-                    'ml_algorithms_used': ['RandomForest', 'GradientBoosting', 'LogisticRegression']
-                }
+        Args:
+            fetch_mode: How the tenant's data is read (see run_complete_analysis)
+
+        Returns:
+            Summary of the trained and reused models
+        """
+        started = time.perf_counter()
+        try:
+            if self.registry is None:
+                return {'success': False, 'error': 'Training needs a model registry to persist the models'}
+            if not self.connect_database():
+                return {'success': False, 'error': 'Database not available'}
+
+            data_frames, aggregates, has_data = self.load_database_data(fetch_mode)
+            if not has_data:
+                return {'success': False, 'tenant': self.tenant, 'error': 'No data found for this tenant'}
+
+            features_df, targets = self.build_features(data_frames, aggregates)
+            self.train_predictive_models(features_df, targets)
+
+            return {
+                'success': bool(self.models),
+                'tenant': self.tenant,
+                'trained': [name for name, source in self.model_sources.items() if source == 'trained'],
+                'unchanged': [name for name, source in self.model_sources.items() if source == 'registry'],
+                'skipped': [name for name in targets if name not in self.models],
+                'feature_count': len(features_df.columns),
+                'fetch_mode': fetch_mode,
+                'duration_seconds': round(time.perf_counter() - started, 3)
             }
 
-            print("✅ Analysis completed successfully")
-            return results
+        except Exception as e:
+            print(f"❌ Training failed: {e}")
+            return {'success': False, 'error': str(e)}
+
+        finally:
+            self.disconnect_database()
+
+    def run_prediction(self, fetch_mode: str = 'aggregate') -> Dict[str, Any]:
+        """
+        Fast inference-only entry point for interactive calls: current features and
+        the tenant's persisted models, with no fitting and no demo-data fallback
+
+        Args:
+            fetch_mode: How the tenant's data is read; aggregate transfers only scalars
+
+        Returns:
+            Analysis results in the run_complete_analysis shape, under 'analysis'
+        """
+        started = time.perf_counter()
+        try:
+            if self.registry is None:
+                return {'success': False, 'error': 'Prediction needs a model registry to load the models from'}
+            if not self.connect_database():
+                return {'success': False, 'error': 'Database not available'}
+
+            data_frames, aggregates, has_data = self.load_database_data(fetch_mode)
+            if not has_data:
+                return {'success': False, 'tenant': self.tenant, 'error': 'No data found for this tenant'}
+            features_df, _ = self.build_features(data_frames, aggregates)
+
+            for target_name in MODEL_TARGETS:
+                model = self.registry.latest(self.tenant, target_name, list(features_df.columns))
+                if model is not None:
+                    self.models[target_name] = model
+                    self.model_sources[target_name] = 'registry'
+            if not self.models:
+                return {'success': False, 'tenant': self.tenant,
+                        'error': 'No trained models for this tenant and feature schema; run with --mode train first'}
+
+            predictions = self.generate_predictions(features_df)
+            return {
+                'success': True,
+                'tenant': self.tenant,
+                'analysis': self.compile_results(features_df, predictions, data_frames, aggregates,
+                                                 'predict', fetch_mode, started)
+            }
 
         except Exception as e:
-            print(f"❌ Analysis failed: {e}")
-            return {"error": str(e)}
+            print(f"❌ Prediction failed: {e}")
+            return {'success': False, 'error': str(e)}
 
         finally:
             self.disconnect_database()
@@ -1116,6 +1974,30 @@ def main():
     """
     Main function to run the predictive analysis
     """
+    parser = argparse.ArgumentParser(description="Run the GRC predictive analysis")
+    parser.add_argument('--mode', choices=['analyze', 'train', 'predict'], default='analyze',
+                        help="analyze: full pipeline (fit and predict) with a results file; train: fit and "
+                             "persist the tenant's models (offline/scheduled); predict: inference only with the "
+                             "persisted models, printing the results as JSON")
+    parser.add_argument('--schema', help="tenant schema (org_*) to analyze; defaults to the connection's search_path")
+    parser.add_argument('--fetch-mode', choices=['rows', 'aggregate', 'stream'], default=os.getenv('ML_FETCH_MODE'),
+                        help="rows: load every table into pandas; aggregate: compute features in the database; "
+                             "stream: fold server-side cursor chunks into running aggregates "
+                             "(default rows for analyze, aggregate for train and predict)")
+    parser.add_argument('--statement-timeout-ms', type=int, default=None,
+                        help="server-side limit per query (predict defaults to 10000)")
+    parser.add_argument('--pool-size', type=int, default=int(os.getenv('ML_FETCH_POOL_SIZE', 4)),
+                        help="connections used to read the GRC tables concurrently")
+    parser.add_argument('--itersize', type=int, default=int(os.getenv('ML_STREAM_ITERSIZE', 5000)),
+                        help="rows per chunk in the stream fetch mode")
+    parser.add_argument('--model-dir', default=MODEL_REGISTRY_DIR, help="model registry directory")
+    parser.add_argument('--keep-models', type=int, default=3,
+                        help="most recently used artifacts kept per tenant and target")
+    parser.add_argument('--max-model-age-days', type=float, default=30,
+                        help="prune artifacts unused for longer than this")
+    parser.add_argument('--no-registry', action='store_true', help="always fit models and store nothing")
+    args = parser.parse_args()
+
     # Database configuration
     db_config = {
         'host': os.getenv('DB_HOST', 'localhost'),
@@ -1124,12 +2006,35 @@ def main():
         'user': os.getenv('DB_USER', 'postgres'),
         'password': os.getenv('DB_PASSWORD', ''),
     }
+    options = []
+    if args.schema:
+        if not re.match(r'^[A-Za-z_][A-Za-z0-9_]*$', args.schema):
+            parser.error(f"Invalid schema name {args.schema!r}")
+        options.append(f"-c search_path={args.schema}")
+    statement_timeout = args.statement_timeout_ms or (10000 if args.mode == 'predict' else None)
+    if statement_timeout:
+        options.append(f"-c statement_timeout={statement_timeout}")
+    if options:
+        db_config['options'] = ' '.join(options)
 
     # Initialize analyzer
-    analyzer = GRCPredictiveAnalyzer(db_config)
+    registry = ModelRegistry(args.model_dir, keep=args.keep_models, max_age_days=args.max_model_age_days)
+    analyzer = GRCPredictiveAnalyzer(db_config, pool_size=args.pool_size, itersize=args.itersize, registry=registry)
+    if args.no_registry:
+        analyzer.registry = None
+
+    if args.mode in ('train', 'predict'):
+        # Progress output goes to stderr so stdout carries only the JSON result
+        with contextlib.redirect_stdout(sys.stderr):
+            if args.mode == 'train':
+                result = analyzer.run_training(fetch_mode=args.fetch_mode or 'aggregate')
+            else:
+                result = analyzer.run_prediction(fetch_mode=args.fetch_mode or 'aggregate')
+        print(json.dumps(result, default=_json_default))
+        sys.exit(0 if result.get('success') else 1)
 
     # Run analysis
-    results = analyzer.run_complete_analysis()
+    results = analyzer.run_complete_analysis(fetch_mode=args.fetch_mode or 'rows')
 
     # Save results to file
     output_file = '/tmp/grc_analysis_results.json'
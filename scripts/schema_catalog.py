@@ -0,0 +1,220 @@
+#!/usr/bin/env python3
+"""
+Schema Catalog
+Per-tenant cache of the tables and columns visible on a connection, so table
+and column existence checks read the catalog once instead of querying
+information_schema on every call
+"""
+
+import re
+import time
+import weakref
+import threading
+import logging
+from typing import Dict, List, Optional, Iterable, FrozenSet, Set, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Every table, view and foreign table an unqualified query on the connection would resolve
+VISIBLE_COLUMNS_QUERY = """
+    SELECT c.relname, a.attname
+    FROM pg_catalog.pg_class c
+    JOIN pg_catalog.pg_attribute a
+        ON a.attrelid = c.oid AND a.attnum > 0 AND NOT a.attisdropped
+    WHERE c.relkind IN ('r', 'p', 'v', 'm', 'f')
+    AND pg_catalog.pg_table_is_visible(c.oid)
+"""
+
+# Valid indexes on visible tables that can serve text search: pg_trgm opclasses or to_tsvector expressions
+TEXT_SEARCH_INDEXES_QUERY = """
+    SELECT c.relname, pg_catalog.pg_get_indexdef(i.indexrelid)
+    FROM pg_catalog.pg_index i
+    JOIN pg_catalog.pg_class c ON c.oid = i.indrelid
+    WHERE i.indisvalid
+    AND pg_catalog.pg_table_is_visible(c.oid)
+    AND pg_catalog.pg_get_indexdef(i.indexrelid) ~ '(_trgm_ops|to_tsvector)'
+"""
+
+
+def normalize_expression(expression: str) -> str:
+    """Compare column expressions the way pg_get_indexdef prints them (``((assets)::text)`` == ``assets::text``).
+
+    Casts to text are dropped: PostgreSQL adds them to varchar columns in
+    index definitions and applies the same coercion to the query side.
+    """
+    expression = re.sub(r'[()\s"]', '', expression).lower()
+    return re.sub(r'::(text|charactervarying|varchar)\b', '', expression)
+
+
+def parse_text_search_index(definition: str) -> List[Tuple[str, str]]:
+    """(kind, expression) pairs an index definition serves; kind is 'trgm' or 'fts:<config>'"""
+    start = definition.find('(', definition.find(' USING '))
+    if start < 0:
+        return []
+    inner = definition[start + 1:definition.rfind(')')]
+    items, depth, current = [], 0, ''
+    for ch in inner:
+        if ch == ',' and depth == 0:
+            items.append(current.strip())
+            current = ''
+            continue
+        depth += ch == '('
+        depth -= ch == ')'
+        current += ch
+    items.append(current.strip())
+
+    found = []
+    for item in items:
+        trgm = re.match(r'^(.*)\s+\w*_trgm_ops$', item)
+        if trgm:
+            found.append(('trgm', normalize_expression(trgm.group(1))))
+            continue
+        fts = re.match(r"^to_tsvector\('(\w+)'::regconfig,\s*(.*)\)$", item)
+        if fts:
+            found.append((f"fts:{fts.group(1)}", normalize_expression(fts.group(2))))
+    return found
+
+
+def _values(row) -> tuple:
+    """Row values whatever the cursor factory (tuple or dict rows)"""
+    return tuple(row.values()) if isinstance(row, dict) else tuple(row)
+
+
+class SchemaCatalog:
+    """Tables and columns visible per tenant schema, introspected once.
+
+    Entries are keyed by server, database and the schemas on the effective
+    search_path, so ``org_*`` tenants sharing a process never see each
+    other's tables. Visibility follows ``pg_table_is_visible``: a table is
+    present exactly when an unqualified query would resolve it.
+    """
+
+    def __init__(self, max_age: Optional[float] = None):
+        """
+        Args:
+            max_age: Seconds before a tenant's catalog is reloaded (None keeps it until invalidated)
+        """
+        self.max_age = max_age
+        self._tables: Dict[str, Dict[str, FrozenSet[str]]] = {}
+        self._loaded_at: Dict[str, float] = {}
+        self._text_search: Dict[str, Dict[str, Dict[str, Set[str]]]] = {}
+        self._connection_keys: 'weakref.WeakKeyDictionary' = weakref.WeakKeyDictionary()
+        self._lock = threading.RLock()
+
+    def schema_key(self, conn) -> str:
+        """Catalog key of the tenant a connection is working in"""
+        with self._lock:
+            key = self._connection_keys.get(conn)
+            if key is None:
+                with conn.cursor() as cur:
+                    cur.execute("SELECT current_database(), array_to_string(current_schemas(false), ',')")
+                    database, schemas = _values(cur.fetchone())
+                key = f"{conn.info.host}:{conn.info.port}/{database}/{schemas}"
+                self._connection_keys[conn] = key
+            return key
+
+    def tables(self, conn) -> Dict[str, FrozenSet[str]]:
+        """All visible tables of the connection's tenant with their columns"""
+        key = self.schema_key(conn)
+        with self._lock:
+            cached = self._cached(key)
+            if cached is not None:
+                return cached
+            with conn.cursor() as cur:
+                cur.execute(VISIBLE_COLUMNS_QUERY)
+                return self._store(key, cur.fetchall())
+
+    async def tables_async(self, pool) -> Dict[str, FrozenSet[str]]:
+        """Same as tables() for an asyncpg pool, whose connections share one tenant"""
+        key = self._connection_keys.get(pool)
+        if key is None:
+            row = await pool.fetchrow(
+                "SELECT current_database(), array_to_string(current_schemas(false), ','), "
+                "inet_server_addr()::text, inet_server_port()"
+            )
+            database, schemas, host, port = _values(row)
+            key = f"{host or 'local'}:{port}/{database}/{schemas}"
+            self._connection_keys[pool] = key
+        with self._lock:
+            cached = self._cached(key)
+        if cached is not None:
+            return cached
+        rows = await pool.fetch(VISIBLE_COLUMNS_QUERY)
+        with self._lock:
+            return self._store(key, rows)
+
+    def _cached(self, key: str) -> Optional[Dict[str, FrozenSet[str]]]:
+        """The tenant's tables if loaded and not expired"""
+        loaded_at = self._loaded_at.get(key)
+        if loaded_at is not None and (self.max_age is None or time.time() - loaded_at <= self.max_age):
+            return self._tables[key]
+        return None
+
+    def _store(self, key: str, rows) -> Dict[str, FrozenSet[str]]:
+        """Cache (table, column) rows as the tenant's tables"""
+        found: Dict[str, Set[str]] = {}
+        for table, column in map(_values, rows):
+            found.setdefault(table, set()).add(column)
+        self._tables[key] = {table: frozenset(columns) for table, columns in found.items()}
+        self._loaded_at[key] = time.time()
+        logger.info(f"Schema catalog loaded for {key}: {len(found)} tables")
+        return self._tables[key]
+
+    def text_search_indexes(self, conn) -> Dict[str, Dict[str, Set[str]]]:
+        """Text search index kinds per table and column expression, e.g.
+        ``{'incidents': {'description': {'trgm', 'fts:simple'}}}``"""
+        key = self.schema_key(conn)
+        with self._lock:
+            if key in self._text_search and self._cached(key) is not None:
+                return self._text_search[key]
+            self.tables(conn)
+            found: Dict[str, Dict[str, Set[str]]] = {}
+            with conn.cursor() as cur:
+                cur.execute(TEXT_SEARCH_INDEXES_QUERY)
+                for table, definition in map(_values, cur.fetchall()):
+                    for kind, expression in parse_text_search_index(definition):
+                        found.setdefault(table, {}).setdefault(expression, set()).add(kind)
+            self._text_search[key] = found
+            return found
+
+    def has_table(self, conn, table: str) -> bool:
+        """Whether ``table`` is visible to the connection"""
+        return table in self.tables(conn)
+
+    def existing_tables(self, conn, tables: Iterable[str]) -> Set[str]:
+        """Which of the given tables are visible to the connection"""
+        visible = self.tables(conn)
+        return {table for table in tables if table in visible}
+
+    def columns(self, conn, table: str) -> FrozenSet[str]:
+        """Columns of ``table``, empty when it does not exist"""
+        return self.tables(conn).get(table, frozenset())
+
+    def missing_columns(self, conn, table: str, columns: Iterable[str]) -> List[str]:
+        """The given columns that ``table`` lacks (all of them when it does not exist)"""
+        present = self.columns(conn, table)
+        return [column for column in columns if column not in present]
+
+    def invalidate(self, schema: Optional[str] = None):
+        """Forget cached tables, for every tenant or only those whose search_path includes ``schema``"""
+        with self._lock:
+            if schema is None:
+                self._tables.clear()
+                self._loaded_at.clear()
+                self._text_search.clear()
+                # search_path may have changed too
+                self._connection_keys = weakref.WeakKeyDictionary()
+                return
+            for key in [k for k in self._tables if schema in k.rsplit('/', 1)[-1].split(',')]:
+                self._tables.pop(key, None)
+                self._loaded_at.pop(key, None)
+                self._text_search.pop(key, None)
+
+    def forget_connection(self, conn):
+        """Re-read a connection's tenant after it changed its search_path"""
+        with self._lock:
+            self._connection_keys.pop(conn, None)
+
+
+# Process-wide catalog shared by the scripts
+catalog = SchemaCatalog()
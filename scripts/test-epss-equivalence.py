@@ -0,0 +1,204 @@
+#!/usr/bin/env python3
+"""
+Equivalence checks for the EPSS calculator's fast paths
+Each optimized path is compared with a straightforward reference on seeded
+random data; no database is needed
+"""
+
+import os
+import csv
+import sys
+import random
+import logging
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from epss_calculator import (EPSSCalculator, FACTOR_KEYS, FACTOR_SOURCES, PercentileRanker,
+                             calculate_epss_scores, rank_percentile)
+
+logging.getLogger('epss_calculator').setLevel(logging.WARNING)
+
+ASSETS = ['web-01', 'WEB-01', 'db_main', 'db-main', 'mail%gw', 'vpn', 'erp\\prod', 'Core Switch']
+WORDS = ['outage', 'on', 'server', 'WEB-01a', 'DBXmain', 'mail gw', 'mail%gw', 'VPN', 'erp\\prod',
+         'core switch', 'db-main', 'patched', '']
+
+
+def ilike(text, pattern):
+    """Reference ``text ILIKE pattern`` (default escape), by dynamic programming"""
+    text, pattern = text.lower(), pattern.lower()
+    tokens = []
+    i = 0
+    while i < len(pattern):
+        if pattern[i] == '\\' and i + 1 < len(pattern):
+            tokens.append(('literal', pattern[i + 1]))
+            i += 2
+            continue
+        tokens.append(('any', None) if pattern[i] == '%' else ('one', None) if pattern[i] == '_'
+                      else ('literal', pattern[i]))
+        i += 1
+    matches = [True] + [False] * len(text)
+    for kind, ch in tokens:
+        if kind == 'any':
+            for j in range(1, len(text) + 1):
+                matches[j] = matches[j] or matches[j - 1]
+        else:
+            matches = [False] + [matches[j - 1] and (kind == 'one' or text[j - 1] == ch)
+                                 for j in range(1, len(text) + 1)]
+    return matches[-1]
+
+
+def random_text(rng):
+    """Free text mentioning some assets, or NULL"""
+    if rng.random() < 0.1:
+        return None
+    return ' '.join(rng.choice(WORDS + ASSETS) for _ in range(rng.randint(0, 6)))
+
+
+def test_in_memory_factor_counts():
+    """count_portfolio_factors_in_memory (Aho-Corasick AssetMentionIndex) vs the SQL ILIKE counts"""
+    print("🔍 Checking in-memory factor counts against ILIKE semantics...")
+    from epss_asset_index import AssetMentionIndex
+
+    rng = random.Random(3)
+    tables = {table: [(row_id, [random_text(rng) for _ in columns]) for row_id in range(60)]
+              for _, table, columns, _ in FACTOR_SOURCES}
+    vulnerability_assets = {vid: rng.sample(ASSETS, rng.randint(0, 3)) for vid in range(40)}
+
+    index = AssetMentionIndex(asset for assets in vulnerability_assets.values() for asset in assets)
+    for table, rows in tables.items():
+        index.add_rows(table, rows)
+    counts = EPSSCalculator().count_portfolio_factors_in_memory(vulnerability_assets, index)
+
+    mismatches = 0
+    for vid, assets in vulnerability_assets.items():
+        # As count_portfolio_factors: distinct rows where any column ILIKE '%asset%' for any asset
+        expected = dict.fromkeys(FACTOR_KEYS, 0)
+        for factor, table, _, _ in FACTOR_SOURCES:
+            expected[factor] += sum(
+                1 for _, values in tables[table]
+                if any(value is not None and ilike(value, f'%{asset}%') for value in values for asset in assets)
+            )
+        if counts[vid] != expected:
+            mismatches += 1
+            print(f"❌ vulnerability {vid} ({assets}): {counts[vid]} != {expected}")
+
+    if mismatches:
+        return False
+    print(f"✅ {len(vulnerability_assets)} asset sets counted identically")
+    return True
+
+
+def test_vectorized_scores():
+    """calculate_epss_scores (vectorized) vs EPSSCalculator.calculate_epss_score, bit for bit"""
+    print("\n🔍 Checking vectorized EPSS scores against the scalar formula...")
+    rng = random.Random(7)
+    # Zero counts, counts past each factor's cap, and missing/zero/fractional CVSS
+    factors = [{factor: rng.choice([0, 0, 1, 2, rng.randint(3, 40), rng.randint(41, 500)]) for factor in FACTOR_KEYS}
+               for _ in range(2000)]
+    for risk_factors in factors:
+        risk_factors['cvss_score'] = rng.choice([0, 0.0, 10.0, round(rng.uniform(0.1, 10), 1), rng.uniform(0, 10)])
+
+    calculator = EPSSCalculator()
+    scalar = [calculator.calculate_epss_score(risk_factors) for risk_factors in factors]
+    vectorized, _ = calculate_epss_scores(
+        {factor: [risk_factors[factor] for risk_factors in factors] for factor in FACTOR_KEYS},
+        [risk_factors['cvss_score'] for risk_factors in factors]
+    )
+
+    mismatches = [(i, a, float(b)) for i, (a, b) in enumerate(zip(scalar, vectorized)) if a != b]
+    for i, a, b in mismatches[:5]:
+        print(f"❌ {factors[i]}: scalar {a!r} != vectorized {b!r}")
+    if mismatches:
+        return False
+    print(f"✅ {len(factors)} scores identical")
+    return True
+
+
+class ScoresConnection:
+    """Just enough of a psycopg2 connection for rebuild_percentiles: serves the stored
+    scores and captures the percentiles it COPYs to staging"""
+
+    def __init__(self, scores_by_id):
+        self.scores_by_id = scores_by_id
+        self.staged = {}
+        self.rowcount = 0
+
+    def cursor(self):
+        return self
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def execute(self, query, params=None):
+        pass
+
+    def fetchall(self):
+        return [{'id': vid, 'epss_score': score} for vid, score in self.scores_by_id.items()]
+
+    def copy_expert(self, query, buffer):
+        self.staged = {int(vid): float(percentile) for vid, percentile in csv.reader(buffer)}
+
+    def commit(self):
+        pass
+
+
+def test_incremental_percentiles():
+    """PercentileRanker.update and the count fallback vs rebuild_percentiles over the same portfolio"""
+    print("\n🔍 Checking incremental percentiles against a full rebuild...")
+    rng = random.Random(8)
+    # Coarse scores so ties are common
+    scores = {vid: round(rng.choice([0.0, 1.0, rng.random()]), 2) for vid in range(300)}
+    ranker = PercentileRanker(scores)
+    calculator = EPSSCalculator()
+
+    mismatches = 0
+    for step in range(300):
+        vid = rng.randrange(400)  # rescores and new vulnerabilities
+        score = round(rng.random(), 2) if rng.random() < 0.8 else rng.choice(list(scores.values()))
+        others = [s for v, s in scores.items() if v != vid]
+        counted = rank_percentile(sum(s <= score for s in others), len(others))
+        incremental = ranker.update(vid, score)
+        scores[vid] = score
+
+        calculator.conn = ScoresConnection(dict(scores))
+        calculator.rebuild_percentiles()
+        rebuilt = calculator.conn.staged
+        if not incremental == counted == rebuilt[vid]:
+            mismatches += 1
+            print(f"❌ step {step}, vulnerability {vid}: ranker {incremental}, count {counted}, rebuild {rebuilt[vid]}")
+        # Ranks of the untouched vulnerabilities drift until the rebuild; the ranker's view does not
+        if step % 50 == 0 and any(ranker.percentile(scores[v]) != rebuilt[v] for v in scores):
+            mismatches += 1
+            print(f"❌ step {step}: ranker disagrees with the rebuild on the whole portfolio")
+
+    if mismatches:
+        return False
+    print("✅ 300 incremental ranks match the full rebuild")
+    return True
+
+
+def main():
+    """Run all checks"""
+    print("🚀 EPSS Equivalence Checks")
+    print("=" * 50)
+
+    results = {
+        'in_memory_counts': test_in_memory_factor_counts(),
+        'vectorized_scores': test_vectorized_scores(),
+        'incremental_percentiles': test_incremental_percentiles(),
+    }
+
+    print("\n" + "=" * 50)
+    all_passed = True
+    for test_name, passed in results.items():
+        print(f"{test_name.upper():24}: {'✅ PASSED' if passed else '❌ FAILED'}")
+        all_passed = all_passed and passed
+
+    return 0 if all_passed else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
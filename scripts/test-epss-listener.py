@@ -0,0 +1,132 @@
+#!/usr/bin/env python3
+"""
+Recovery checks for the EPSS change listener
+Drives EPSSListener with in-memory stand-ins for the calculator and the
+notification connection; no database is needed
+"""
+
+import io
+import os
+import sys
+import json
+import logging
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import psycopg2
+
+import epss_listener
+from epss_listener import EPSSListener
+
+logging.getLogger('epss_listener').setLevel(logging.CRITICAL)
+
+# Vulnerability id -> assets of the stand-in tenant
+ASSETS = {1: ['web-01'], 2: ['db-main'], 3: ['web-01', 'vpn']}
+
+
+class FakeConnection:
+    def rollback(self):
+        pass
+
+
+class FakeCalculator:
+    """The parts of EPSSCalculator the listener uses; counts connects and scored ids"""
+    connects = 0
+    scored = []
+
+    def __init__(self, db_config=None, schema=None):
+        self.db_config = db_config or {'host': 'localhost'}
+        self.schema = schema
+        self.conn = None
+        self.asset_table_synced = True
+
+    def connect(self):
+        FakeCalculator.connects += 1
+        self.conn = FakeConnection()
+
+    def disconnect(self):
+        self.conn = None
+
+    def use_model(self, path=None):
+        pass
+
+    def sync_vulnerability_assets(self):
+        return {}
+
+    def load_vulnerability_assets(self):
+        return ASSETS
+
+    def calculate_batch(self, ids, **kwargs):
+        if self.conn is None:
+            raise psycopg2.InterfaceError("connection already closed")
+        FakeCalculator.scored.extend(ids)
+        return [{'success': True, 'vulnerability_id': vid} for vid in ids]
+
+
+def event(schema, text):
+    return json.dumps({'schema': schema, 'table': 'incidents', 'op': 'UPDATE', 'id': 1,
+                       'texts': [text], 'truncated': False})
+
+
+def test_disconnect_with_pending_events():
+    """Events queued before the LISTEN connection drops are rescored after it reconnects"""
+    print("🔍 Checking a disconnect while events are pending...")
+    epss_listener.EPSSCalculator = FakeCalculator
+    FakeCalculator.connects, FakeCalculator.scored = 0, []
+    out = io.StringIO()
+    # Nothing settles inside the loop, so every id is rescored by the final drain
+    listener = EPSSListener(debounce=60, max_wait=60, out=out)
+    listener.listen = lambda: None
+    epss_listener.time.sleep = lambda seconds: None
+    polls = []
+
+    def poll():
+        polls.append(1)
+        if len(polls) == 1:
+            # Events arrive, then the notification connection fails before they are due
+            listener.handle(event('org_a', 'outage on WEB-01'))
+            raise psycopg2.OperationalError("server closed the connection unexpectedly")
+        if len(polls) == 2:
+            listener.handle(event('org_b', 'db-main patched'))
+        listener.stopping = True
+
+    listener.poll = poll
+    listener.run()
+
+    lines = [json.loads(line) for line in out.getvalue().splitlines()]
+    rescored = {line['schema']: line['vulnerabilities'] for line in lines if line['type'] == 'rescored'}
+    passed = True
+    if sorted(FakeCalculator.scored) != [1, 2, 3]:
+        passed = False
+        print(f"❌ rescored {sorted(FakeCalculator.scored)}, expected [1, 2, 3]")
+    if rescored != {'org_a': 2, 'org_b': 1}:
+        passed = False
+        print(f"❌ rescored batches {rescored}")
+    if lines[-1]['type'] != 'shutdown':
+        passed = False
+        print(f"❌ listener did not shut down cleanly: {lines[-1]}")
+    if passed:
+        print(f"✅ pending events survived the reconnect ({FakeCalculator.connects} tenant connections)")
+    return passed
+
+
+def main():
+    """Run all checks"""
+    print("🚀 EPSS Listener Checks")
+    print("=" * 50)
+
+    results = {
+        'disconnect_pending': test_disconnect_with_pending_events(),
+    }
+
+    print("\n" + "=" * 50)
+    all_passed = True
+    for test_name, passed in results.items():
+        print(f"{test_name.upper():24}: {'✅ PASSED' if passed else '❌ FAILED'}")
+        all_passed = all_passed and passed
+
+    return 0 if all_passed else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())